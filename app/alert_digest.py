@@ -0,0 +1,171 @@
+"""SLA violation alerts, batched into digest emails.
+
+The SLA scanner records each violation as a 'pending' row of kind 'sla' in the outbox (app.outbox), in the
+same transaction that sets `sla_violation`, so an alert survives a crash between the two. Its `run_after`
+is ALERT_DIGEST_WINDOW seconds later. A background sender thread waits until the oldest pending alert is
+due (or until ALERT_DIGEST_MAX_TICKETS are waiting), then queues one digest per (department, severity) and
+marks the alerts 'digested' in a single transaction. A ticket that was already alerted within
+ALERT_DEDUP_SECONDS is not recorded again.
+"""
+import json
+import logging
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from sqlalchemy import select, update, func
+from . import config
+from .database import SessionLocal
+from .models import OutboxMessage
+from .outbox import queue_email, notify as notify_outbox
+
+logger = logging.getLogger(__name__)
+
+KIND = "sla"
+_ID_CHUNK = 500  # complaint ids per dedup lookup, well under SQLite's bound-parameter limit
+
+
+class AlertDigest:
+    def __init__(self, window: float = None, max_tickets: int = None, dedup_seconds: float = None):
+        self.window = config.ALERT_DIGEST_WINDOW if window is None else window
+        self.max_tickets = max_tickets or config.ALERT_DIGEST_MAX_TICKETS
+        self.dedup_seconds = config.ALERT_DEDUP_SECONDS if dedup_seconds is None else dedup_seconds
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._stopping = False
+        self.stats = {"queued": 0, "suppressed": 0, "digests": 0, "emails_queued": 0, "flushes": 0}
+
+    def record(self, db, alerts: list, now: datetime = None) -> int:
+        """Add violations ({id, department, severity, subject, ...}) to `db` as pending alerts.
+
+        The caller commits, then calls notify(). Tickets alerted within the dedup window are skipped;
+        returns how many were recorded.
+        """
+        if not alerts:
+            return 0
+        now = now or datetime.utcnow()
+        # a recorded alert's run_after is its time plus the window
+        since = now + timedelta(seconds=self.window) - timedelta(seconds=self.dedup_seconds)
+        ids = list(OrderedDict.fromkeys(a["id"] for a in alerts))
+        seen = set()
+        for i in range(0, len(ids), _ID_CHUNK):
+            seen.update(db.execute(
+                select(OutboxMessage.complaint_id)
+                .where(OutboxMessage.kind == KIND, OutboxMessage.complaint_id.in_(ids[i:i + _ID_CHUNK]),
+                       OutboxMessage.run_after > since)
+            ).scalars())
+        run_after = now + timedelta(seconds=self.window)
+        rows = []
+        for a in alerts:
+            if a["id"] in seen:
+                continue
+            seen.add(a["id"])
+            rows.append(dict(kind=KIND, complaint_id=a["id"], to_email=config.ADMIN_EMAIL or "",
+                             subject=f"SLA violation: ticket #{a['id']}", body=json.dumps(a, default=str),
+                             status="pending", attempts=0, max_attempts=0, run_after=run_after))
+        if rows:
+            db.execute(OutboxMessage.__table__.insert(), rows)
+        with self._lock:
+            self.stats["queued"] += len(rows)
+            self.stats["suppressed"] += len(alerts) - len(rows)
+        return len(rows)
+
+    def notify(self):
+        """Wake the sender thread (starting it if needed) to look at the pending alerts."""
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stopping = False
+                self._thread = threading.Thread(target=self._run, name="alert-digest", daemon=True)
+                self._thread.start()
+        self._wakeup.set()
+
+    def _run(self):
+        while not self._stopping:
+            self._wakeup.clear()
+            try:
+                _, due = self._send_due()
+                timeout = None if due is None else max(0.0, (due - datetime.utcnow()).total_seconds())
+            except Exception:
+                logger.exception("Error sending SLA digests")
+                timeout = max(self.window, 1.0)
+            self._wakeup.wait(timeout)
+
+    def flush(self) -> int:
+        """Send every pending alert now, on the calling thread; returns the number of digests."""
+        return self._send_due(force=True)[0]
+
+    def stop(self, timeout: float = 10):
+        """Stop the sender thread; alerts still pending stay in the outbox for the next start."""
+        self._stopping = True
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _send_due(self, force: bool = False):
+        """Digest the pending alerts if the oldest is due; returns (digests queued, next due time or None)."""
+        now = datetime.utcnow()
+        db = SessionLocal()
+        try:
+            rows = db.execute(
+                select(OutboxMessage.id, OutboxMessage.body, OutboxMessage.run_after)
+                .where(OutboxMessage.kind == KIND, OutboxMessage.status == "pending")
+                .order_by(OutboxMessage.id)
+            ).all()
+            if not rows:
+                return 0, None
+            first_due = min(r.run_after for r in rows)
+            if not force and len(rows) < self.max_tickets and first_due > now:
+                return 0, first_due
+            alerts = [json.loads(r.body) for r in rows]
+            groups = OrderedDict()
+            for a in alerts:
+                groups.setdefault((a.get("department") or "Unassigned", a.get("severity") or "Medium"), []).append(a)
+            messages = [digest_message(dept, sev, items) for (dept, sev), items in groups.items()]
+            if config.ADMIN_EMAIL:
+                queued = sum(queue_email(db, config.ADMIN_EMAIL, subject, body, kind='alert') for subject, body in messages)
+            else:
+                for subject, body in messages:
+                    logger.warning("Admin alert: %s - %s", subject, body)
+                queued = 0
+            # rows recorded after the select above have higher ids and wait for the next round
+            db.execute(
+                update(OutboxMessage)
+                .where(OutboxMessage.kind == KIND, OutboxMessage.status == "pending", OutboxMessage.id <= rows[-1].id)
+                .values(status="digested", sent_at=now)
+            )
+            db.commit()
+        finally:
+            db.close()
+        if queued:
+            notify_outbox()
+        with self._lock:
+            self.stats["flushes"] += 1
+            self.stats["digests"] += len(messages)
+            self.stats["emails_queued"] += queued
+        logger.info("Queued %d SLA digests for %d tickets", len(messages), len(alerts))
+        return len(messages), None
+
+    def snapshot(self) -> dict:
+        db = SessionLocal()
+        try:
+            pending = db.execute(
+                select(func.count()).select_from(OutboxMessage)
+                .where(OutboxMessage.kind == KIND, OutboxMessage.status == "pending")
+            ).scalar()
+        finally:
+            db.close()
+        with self._lock:
+            return dict(self.stats, pending=pending)
+
+
+def digest_message(department: str, severity: str, alerts: list):
+    n = len(alerts)
+    subject = f"SLA Violations: {n} {severity} ticket{'s' if n != 1 else ''} in {department}"
+    lines = [f"Overdue {severity} tickets assigned to {department}: {n}", ""]
+    for a in sorted(alerts, key=lambda a: a["id"]):
+        lines.append(f"- Ticket #{a['id']}: {a.get('subject') or '(no subject)'}")
+        lines.append(f"  Received: {a.get('received_at')}  Created: {a.get('created_at')}  Due: {a.get('sla_due_at')}")
+    return subject, "\n".join(lines)
+
+
+digest = AlertDigest()
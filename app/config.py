@@ -14,6 +14,19 @@ SMTP_SERVER = os.getenv("SMTP_SERVER", "smtp.gmail.com")
 SMTP_PORT = int(os.getenv("SMTP_PORT", 587))
 SMTP_USER = os.getenv("SMTP_USER")
 SMTP_PASSWORD = os.getenv("SMTP_PASSWORD")
+# Long-lived SMTP connections shared by the outbox senders (app.utils.smtp_pool)
+SMTP_POOL_SIZE = int(os.getenv("SMTP_POOL_SIZE", 2))  # connections open at once
+SMTP_TIMEOUT = float(os.getenv("SMTP_TIMEOUT", 30))
+SMTP_STARTTLS = os.getenv("SMTP_STARTTLS", "1").lower() in ("1", "true", "yes")  # when the server offers it
+SMTP_IDLE_CHECK = float(os.getenv("SMTP_IDLE_CHECK", 30))  # NOOP a pooled connection idle longer than this before reuse
+SMTP_MAX_IDLE = float(os.getenv("SMTP_MAX_IDLE", 240))  # close instead of reusing (servers drop idle sessions)
+# Outgoing mail is queued in the outbox table and delivered by background senders (app.outbox)
+OUTBOX_WORKERS = int(os.getenv("OUTBOX_WORKERS", 2))
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", 20))  # messages claimed and sent per SMTP session checkout
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", 6))
+OUTBOX_BACKOFF_BASE = float(os.getenv("OUTBOX_BACKOFF_BASE", 30.0))  # seconds, doubled per attempt
+OUTBOX_BACKOFF_MAX = float(os.getenv("OUTBOX_BACKOFF_MAX", 3600.0))
+OUTBOX_POLL_INTERVAL = float(os.getenv("OUTBOX_POLL_INTERVAL", 5.0))
 IMAP_SERVER = os.getenv("IMAP_SERVER")
 IMAP_USER = os.getenv("IMAP_USER")
 IMAP_PASSWORD = os.getenv("IMAP_PASSWORD")
@@ -36,9 +49,33 @@ SLA_THRESHOLDS = {
     "Medium": 72,
     "Low": 168,  # 7 days
 }
+# The SLA scanner sleeps until the next deadline (plus a little slack), but never less than SLA_MIN_SLEEP seconds
+SLA_MIN_SLEEP = float(os.getenv("SLA_MIN_SLEEP", 1.0))
+SLA_DEADLINE_SLACK = float(os.getenv("SLA_DEADLINE_SLACK", 0.5))
+# SLA violation alerts are batched into per department+severity digests (app.alert_digest)
+ALERT_DIGEST_WINDOW = float(os.getenv("ALERT_DIGEST_WINDOW", 60))  # seconds to collect before sending
+ALERT_DIGEST_MAX_TICKETS = int(os.getenv("ALERT_DIGEST_MAX_TICKETS", 500))  # send early once this many are queued
+ALERT_DEDUP_SECONDS = float(os.getenv("ALERT_DEDUP_SECONDS", 86400))  # don't alert the same ticket again within this
 
-# Polling interval for IMAP (seconds)
+# Polling interval for IMAP (seconds); only used when the server doesn't support IDLE
 IMAP_POLL_INTERVAL = int(os.getenv("IMAP_POLL_INTERVAL", 300))  # default 5 minutes
+IMAP_PORT = int(os.getenv("IMAP_PORT", 993))
+IMAP_SSL = os.getenv("IMAP_SSL", "1").lower() in ("1", "true", "yes")
+IMAP_MAILBOX = os.getenv("IMAP_MAILBOX", "INBOX")
+IMAP_FETCH_BATCH = int(os.getenv("IMAP_FETCH_BATCH", 50))  # messages per UID FETCH / STORE round trip
+IMAP_IDLE_TIMEOUT = int(os.getenv("IMAP_IDLE_TIMEOUT", 1500))  # re-issue IDLE before servers' 30 minute cutoff
+IMAP_RECONNECT_DELAY = float(os.getenv("IMAP_RECONNECT_DELAY", 30))  # seconds to wait after a failed session
+# Email body extraction (app.utils.extract_metadata)
+EMAIL_MAX_BYTES = int(os.getenv("EMAIL_MAX_BYTES", 1_000_000))  # raw bytes parsed per message; the rest is ignored
+EMAIL_PART_MAX_BYTES = int(os.getenv("EMAIL_PART_MAX_BYTES", 200_000))  # decoded bytes read from each text part
+EMAIL_TEXT_MAX_CHARS = int(os.getenv("EMAIL_TEXT_MAX_CHARS", 20_000))  # cap on the stored description
+EMAIL_STRIP_QUOTES = os.getenv("EMAIL_STRIP_QUOTES", "1").lower() in ("1", "true", "yes")  # drop quoted replies and signatures
+# Ingest pipeline stages (app.ingest_pipeline): fetch -> parse -> persist -> triage jobs -> acknowledgement
+INGEST_QUEUE_SIZE = int(os.getenv("INGEST_QUEUE_SIZE", 200))  # bound of the queues between in-process stages
+INGEST_PARSE_WORKERS = int(os.getenv("INGEST_PARSE_WORKERS", 2))
+INGEST_PERSIST_BATCH = int(os.getenv("INGEST_PERSIST_BATCH", 100))  # complaints inserted per transaction
+INGEST_MAX_TRIAGE_BACKLOG = int(os.getenv("INGEST_MAX_TRIAGE_BACKLOG", 1000))  # fetching pauses above this many pending triage jobs
+INGEST_BACKLOG_WAIT = float(os.getenv("INGEST_BACKLOG_WAIT", 2.0))  # seconds between backlog checks
 
 # Admin email for alerts
 ADMIN_EMAIL = os.getenv("ADMIN_EMAIL")
@@ -54,9 +91,116 @@ if DB_PATH.startswith("sqlite:///") or DB_PATH.startswith("sqlite://"):
 else:
     DATABASE_URL = f"sqlite:///{DB_PATH}"
 
+# SQLite tuning, applied to every pooled connection when it is opened (app.database)
+SQLITE_JOURNAL_MODE = os.getenv("SQLITE_JOURNAL_MODE", "WAL")  # readers don't block the writer (or each other)
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")  # with WAL: durable except on power loss
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", 5000))  # wait this long for a lock before "database is locked"
+SQLITE_CACHE_SIZE_KB = int(os.getenv("SQLITE_CACHE_SIZE_KB", 32 * 1024))  # page cache per connection
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", 256 * 2**20))  # bytes of the file read through mmap; 0 disables
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 10))  # connections kept open
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", 20))  # extra connections under load, closed when returned
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", 30))  # seconds to wait for a free connection
+# Schema migrations (app.migrations): rows per backfill transaction, and the pause between them
+MIGRATION_BACKFILL_CHUNK = int(os.getenv("MIGRATION_BACKFILL_CHUNK", 1000))
+MIGRATION_BACKFILL_PAUSE = float(os.getenv("MIGRATION_BACKFILL_PAUSE", 0.05))  # seconds
+# Serialize writing transactions in the process so writers queue on a lock instead of retrying SQLite's
+DB_SINGLE_WRITER = os.getenv("DB_SINGLE_WRITER", "1").lower() in ("1", "true", "yes")
+
 # Other settings
 LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
 
 # LLM model settings
 LLM_MODEL = os.getenv("LLM_MODEL", "github/gpt-4o-mini")
 LLM_TIMEOUT = int(os.getenv("LLM_TIMEOUT", 20))
+
+# Triage mode: "fused" asks the LLM for categories, sentiment, severity and routing in one call;
+# "sequential" keeps the original three-call path (classify -> sentiment -> severity/routing).
+TRIAGE_MODE = os.getenv("TRIAGE_MODE", "fused").lower()
+
+# Background job queue (jobs table in the same SQLite DB)
+QUEUE_WORKERS = int(os.getenv("QUEUE_WORKERS", 2))
+QUEUE_MAX_ATTEMPTS = int(os.getenv("QUEUE_MAX_ATTEMPTS", 5))
+QUEUE_BACKOFF_BASE = float(os.getenv("QUEUE_BACKOFF_BASE", 2.0))  # seconds, doubled per attempt
+QUEUE_BACKOFF_MAX = float(os.getenv("QUEUE_BACKOFF_MAX", 600.0))
+QUEUE_POLL_INTERVAL = float(os.getenv("QUEUE_POLL_INTERVAL", 1.0))
+
+# LLM response cache (keyed by model, system prompt, user prompt and temperature)
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "1").lower() in ("1", "true", "yes")
+LLM_CACHE_TTL = int(os.getenv("LLM_CACHE_TTL", 24 * 3600))  # seconds
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", 1000))  # in-process LRU size
+LLM_CACHE_PERSIST = os.getenv("LLM_CACHE_PERSIST", "0").lower() in ("1", "true", "yes")  # also keep a SQLite tier
+LLM_CACHE_DB_MAX_ENTRIES = int(os.getenv("LLM_CACHE_DB_MAX_ENTRIES", 50000))
+
+# Shared LLM HTTP client (connection pool, keep-alive, concurrency limits)
+LLM_CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", 5))
+LLM_POOL_MAX_CONNECTIONS = int(os.getenv("LLM_POOL_MAX_CONNECTIONS", 10))
+LLM_POOL_MAX_KEEPALIVE = int(os.getenv("LLM_POOL_MAX_KEEPALIVE", 10))
+LLM_KEEPALIVE_EXPIRY = float(os.getenv("LLM_KEEPALIVE_EXPIRY", 60))  # seconds an idle connection is kept
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", 8))  # in-flight requests per process (sync and async each)
+LLM_HTTP2 = os.getenv("LLM_HTTP2", "1").lower() in ("1", "true", "yes")  # used only when the 'h2' package is installed
+
+# LLM admission control: token buckets per provider+model, circuit breaker and priority lanes
+LLM_RPM = int(os.getenv("LLM_RPM", 60))  # requests per minute; 0 disables the limit
+LLM_TPM = int(os.getenv("LLM_TPM", 100000))  # prompt+completion tokens per minute; 0 disables the limit
+# Fraction of each bucket a lane may NOT dip into, so urgent tickets always find quota left over
+LLM_LANE_RESERVE = {"urgent": 0.0, "normal": 0.1, "bulk": 0.5}
+# Seconds a call may wait for quota before it is shed (and falls back to heuristics)
+LLM_LANE_MAX_WAIT = {
+    "urgent": float(os.getenv("LLM_URGENT_MAX_WAIT", 30)),
+    "normal": float(os.getenv("LLM_NORMAL_MAX_WAIT", 10)),
+    "bulk": float(os.getenv("LLM_BULK_MAX_WAIT", 120)),
+}
+LLM_BREAKER_FAILURES = int(os.getenv("LLM_BREAKER_FAILURES", 5))  # consecutive failures that open the circuit
+LLM_BREAKER_OPEN_SECONDS = float(os.getenv("LLM_BREAKER_OPEN_SECONDS", 30))
+LLM_BREAKER_MAX_OPEN_SECONDS = float(os.getenv("LLM_BREAKER_MAX_OPEN_SECONDS", 900))  # caps Retry-After too
+
+# Prompt budgets: complaint text is cut to LLM_TEXT_MAX_TOKENS before it goes into a prompt (quoted
+# history and signatures first, then the middle of long texts) and each task's reply is capped
+LLM_TEXT_MAX_TOKENS = int(os.getenv("LLM_TEXT_MAX_TOKENS", 1500))
+LLM_TEXT_HEAD_RATIO = float(os.getenv("LLM_TEXT_HEAD_RATIO", 0.7))  # share of the budget kept from the start
+LLM_MAX_TOKENS = {
+    "classify": int(os.getenv("LLM_CLASSIFY_MAX_TOKENS", 100)),
+    "routing": int(os.getenv("LLM_ROUTING_MAX_TOKENS", 200)),
+    "sentiment": int(os.getenv("LLM_SENTIMENT_MAX_TOKENS", 10)),
+    "triage": int(os.getenv("LLM_TRIAGE_MAX_TOKENS", 250)),
+    "batch_item": int(os.getenv("LLM_BATCH_ITEM_MAX_TOKENS", 160)),  # per complaint in a batch request
+}
+LLM_TOKENIZER = os.getenv("LLM_TOKENIZER", "o200k_base")  # tiktoken encoding; used only when tiktoken is installed
+
+# Bulk re-triage (POST /admin/retriage, python -m app.retriage)
+RETRIAGE_CHUNK_SIZE = int(os.getenv("RETRIAGE_CHUNK_SIZE", 200))  # rows read and written per transaction
+RETRIAGE_BATCH_SIZE = int(os.getenv("RETRIAGE_BATCH_SIZE", 10))  # complaints packed into one LLM request
+RETRIAGE_CONCURRENCY = int(os.getenv("RETRIAGE_CONCURRENCY", 4))  # LLM requests in flight per chunk
+
+# Local classifier tier (python -m app.local_model train); tickets it is confident about skip the LLM
+LOCAL_MODEL_ENABLED = os.getenv("LOCAL_MODEL_ENABLED", "1").lower() in ("1", "true", "yes")  # no-op until a model is trained
+LOCAL_MODEL_PATH = os.getenv("LOCAL_MODEL_PATH", "./local_model.json")
+LOCAL_MODEL_THRESHOLD = float(os.getenv("LOCAL_MODEL_THRESHOLD", 0.85))  # min confidence to skip the LLM
+
+# Sentiment: a lexicon scorer by default; set LLM_SENTIMENT=1 to ask the LLM first in sequential triage
+LLM_SENTIMENT = os.getenv("LLM_SENTIMENT", "0").lower() in ("1", "true", "yes")
+SENTIMENT_LEXICON_PATH = os.getenv("SENTIMENT_LEXICON_PATH")  # defaults to TextBlob's en-sentiment.xml
+
+# Complaint listings (GET /get_complaints, /admin/complaints): rows per page when no limit is given, and the cap
+COMPLAINTS_PAGE_SIZE = int(os.getenv("COMPLAINTS_PAGE_SIZE", 100))
+COMPLAINTS_MAX_PAGE_SIZE = int(os.getenv("COMPLAINTS_MAX_PAGE_SIZE", 1000))
+
+# Full-text search (GET /search, app.search): page size and cap, BM25 weights of subject, description and
+# keywords (a match in the subject counts more than one deep in the description), and snippet length in tokens
+SEARCH_PAGE_SIZE = int(os.getenv("SEARCH_PAGE_SIZE", 20))
+SEARCH_MAX_PAGE_SIZE = int(os.getenv("SEARCH_MAX_PAGE_SIZE", 100))
+SEARCH_WEIGHTS = tuple(float(w) for w in os.getenv("SEARCH_WEIGHTS", "4,1,2").split(","))
+SEARCH_SNIPPET_TOKENS = int(os.getenv("SEARCH_SNIPPET_TOKENS", 16))
+
+# Bulk export (python -m app.export, GET /admin/export): rows fetched and written per chunk
+EXPORT_CHUNK_SIZE = int(os.getenv("EXPORT_CHUNK_SIZE", 5000))
+
+# Keep GET /get_summary counts in the summary_counters table (updated with each write) instead of counting rows
+SUMMARY_COUNTERS = os.getenv("SUMMARY_COUNTERS", "1").lower() in ("1", "true", "yes")
+
+# Duplicate detection (app.dedup): resends are matched by Message-ID / Idempotency-Key; near-duplicate
+# descriptions from the same customer are linked to the earlier ticket instead of being triaged again
+DEDUP_NEAR_DUPLICATES = os.getenv("DEDUP_NEAR_DUPLICATES", "1").lower() in ("1", "true", "yes")
+SIMHASH_MAX_DISTANCE = int(os.getenv("SIMHASH_MAX_DISTANCE", 5))  # differing bits (of 64) still counted as a duplicate; reindex after changing
+SIMHASH_MIN_TOKENS = int(os.getenv("SIMHASH_MIN_TOKENS", 5))  # shorter descriptions are never matched
+DEDUP_WINDOW_DAYS = float(os.getenv("DEDUP_WINDOW_DAYS", 30))  # only link to tickets created this recently
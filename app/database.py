@@ -1,57 +1,165 @@
-from sqlalchemy import create_engine
+import logging
+import threading
+import time
+from sqlalchemy import create_engine, event
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import QueuePool, StaticPool
+from . import config
 from .config import DATABASE_URL
 
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
-Base = declarative_base()
+logger = logging.getLogger(__name__)
+
+_WRITE_VERBS = ("INSERT", "UPDATE", "DELETE", "REPLACE", "CREATE", "DROP", "ALTER")
+_writers = {}  # engine -> its SingleWriter
+
+
+class SingleWriter:
+    """Lets one transaction at a time write, process-wide.
+
+    SQLite allows a single writer per file anyway; queueing on a lock here means writers wait in order
+    instead of spinning in SQLite's busy handler. The lock is reentrant per thread, so a nested session
+    that writes while its caller's transaction is open doesn't deadlock on it. A writer that can't get the
+    lock within `timeout` seconds (e.g. the holder waits on another thread) goes ahead and leaves the
+    wait to SQLite's busy_timeout.
+    """
 
+    def __init__(self, timeout: float):
+        self.timeout = timeout
+        self._cond = threading.Condition()
+        self._owner = None
+        self._holders = 0
+        self.acquired = 0
+        self.contended = 0
+        self.timeouts = 0
+        self.wait_ms = 0.0
 
-def init_db():
-    from . import models
-    Base.metadata.create_all(bind=engine)
-    # Run a lightweight direct sqlite migration to add missing columns
+    def acquire(self) -> bool:
+        me = threading.get_ident()
+        with self._cond:
+            if self._owner == me:
+                self._holders += 1
+                return True
+            if self._owner is not None:
+                self.contended += 1
+                started = time.monotonic()
+                deadline = started + self.timeout
+                while self._owner is not None:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.timeouts += 1
+                        logger.warning("Waited %.1fs for the database writer lock; continuing without it", self.timeout)
+                        return False
+                    self._cond.wait(remaining)
+                self.wait_ms += (time.monotonic() - started) * 1000
+            self._owner = me
+            self._holders = 1
+            self.acquired += 1
+            return True
+
+    def release(self):
+        with self._cond:
+            self._holders -= 1
+            if self._holders <= 0:
+                self._owner = None
+                self._holders = 0
+                self._cond.notify()
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                "held": self._owner is not None,
+                "acquired": self.acquired,
+                "contended": self.contended,
+                "timeouts": self.timeouts,
+                "avg_wait_ms": round(self.wait_ms / self.contended, 2) if self.contended else 0.0,
+            }
+
+
+def _is_write(statement: str) -> bool:
+    return statement.lstrip()[:7].upper().startswith(_WRITE_VERBS)
+
+
+def _apply_pragmas(dbapi_connection, connection_record):
+    cur = dbapi_connection.cursor()
     try:
-        run_sqlite_migrations(DATABASE_URL)
-    except Exception:
-        # don't crash startup on migration problems; SLA loop will handle schema errors gracefully
-        pass
+        cur.execute(f"PRAGMA busy_timeout = {int(config.SQLITE_BUSY_TIMEOUT_MS)}")
+        if config.SQLITE_JOURNAL_MODE:
+            cur.execute(f"PRAGMA journal_mode = {config.SQLITE_JOURNAL_MODE}")
+        if config.SQLITE_SYNCHRONOUS:
+            cur.execute(f"PRAGMA synchronous = {config.SQLITE_SYNCHRONOUS}")
+        cur.execute(f"PRAGMA cache_size = {-int(config.SQLITE_CACHE_SIZE_KB)}")  # negative: KiB, not pages
+        cur.execute(f"PRAGMA mmap_size = {int(config.SQLITE_MMAP_SIZE)}")
+        cur.execute("PRAGMA temp_store = MEMORY")
+    finally:
+        cur.close()
 
 
-def run_sqlite_migrations(database_url: str):
-    """For sqlite DATABASE_URL like sqlite:///./complaints.db, open the file and add missing columns.
+def _install_single_writer(engine, writer: SingleWriter):
+    # A connection takes the lock at its first write statement and gives it back when the transaction
+    # ends, or at the latest when the connection returns to the pool.
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before_write(conn, cursor, statement, parameters, context, executemany):
+        if '_writer' not in conn.info and _is_write(statement):
+            conn.info['_writer'] = writer.acquire()
 
-    This uses sqlite3 directly to ensure ALTER TABLE statements run against the file.
-    """
-    import sqlite3
-
-    if not database_url.startswith('sqlite'):
-        return
-
-    # extract file path
-    path = None
-    if database_url.startswith('sqlite:///'):
-        path = database_url.split('sqlite:///', 1)[1]
-    elif database_url.startswith('sqlite://'):
-        path = database_url.split('sqlite://', 1)[1]
-    if not path:
-        return
-
-    conn = sqlite3.connect(path)
-    cur = conn.cursor()
-    cur.execute("PRAGMA table_info('complaints')")
-    rows = cur.fetchall()
-    existing = {r[1] for r in rows}
-    if 'llm_classification' not in existing:
-        try:
-            cur.execute("ALTER TABLE complaints ADD COLUMN llm_classification TEXT")
-        except Exception:
-            pass
-    if 'llm_routing' not in existing:
-        try:
-            cur.execute("ALTER TABLE complaints ADD COLUMN llm_routing TEXT")
-        except Exception:
-            pass
-    conn.commit()
-    conn.close()
+    def _release(info):
+        if info.pop('_writer', False):
+            writer.release()
+
+    @event.listens_for(engine, "commit")
+    def _after_commit(conn):
+        _release(conn.info)
+
+    @event.listens_for(engine, "rollback")
+    def _after_rollback(conn):
+        _release(conn.info)
+
+    @event.listens_for(engine, "checkin")
+    def _on_checkin(dbapi_connection, connection_record):
+        if connection_record is not None:
+            _release(connection_record.info)
+
+
+def create_db_engine(url: str = None, tuned: bool = True):
+    """Engine for `url` (DATABASE_URL). `tuned=False` gives the plain untuned engine, for benchmarks."""
+    url = url or DATABASE_URL
+    kwargs = {"connect_args": {"check_same_thread": False}}
+    if not tuned or not url.startswith("sqlite"):
+        return create_engine(url, **kwargs)
+    memory = url in ("sqlite://", "sqlite:///:memory:") or "mode=memory" in url
+    if memory:
+        # every connection to ":memory:" would be a new empty database; share one
+        kwargs["poolclass"] = StaticPool
+    else:
+        kwargs.update(poolclass=QueuePool, pool_size=config.DB_POOL_SIZE, max_overflow=config.DB_MAX_OVERFLOW,
+                      pool_timeout=config.DB_POOL_TIMEOUT)
+    eng = create_engine(url, **kwargs)
+    event.listen(eng, "connect", _apply_pragmas)
+    if config.DB_SINGLE_WRITER and not memory:
+        _writers[eng] = SingleWriter(config.SQLITE_BUSY_TIMEOUT_MS / 1000.0)
+        _install_single_writer(eng, _writers[eng])
+    return eng
+
+
+def db_stats(eng=None) -> dict:
+    """Effective pragmas, pool usage and writer-lock contention of the engine."""
+    eng = eng or engine
+    out = {"pool": eng.pool.status()}
+    with eng.connect() as conn:
+        for name in ("journal_mode", "synchronous", "busy_timeout", "cache_size", "mmap_size"):
+            out[name] = conn.exec_driver_sql(f"PRAGMA {name}").scalar()
+    writer = _writers.get(eng)
+    out["single_writer"] = writer.stats() if writer else None
+    return out
+
+
+engine = create_db_engine(DATABASE_URL)
+SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+Base = declarative_base()
+
+
+def init_db(background_backfill: bool = False, stop_event: threading.Event = None):
+    """Create or migrate the schema (app.migrations); a no-op beyond one query when it is current."""
+    from .migrations import migrate
+    migrate(engine, background_backfill=background_backfill, stop_event=stop_event)
@@ -0,0 +1,204 @@
+"""Duplicate complaint detection.
+
+Exact resends are caught by unique indexes: the normalized Message-ID of emailed complaints and the
+Idempotency-Key header of POST /submit_complaint. A replay returns the existing ticket instead of a
+new row.
+
+Near-duplicates (the same customer writing in again about the same problem) are found with a 64-bit
+SimHash of the description, split into SIMHASH_MAX_DISTANCE + 1 bands that are indexed per customer in
+`complaint_signatures`. Any hash within SIMHASH_MAX_DISTANCE bits of a new one matches it exactly on at
+least one band, so the lookup is a few index seeks whatever the customer's history. A match is stored as a ticket with
+status 'Duplicate' and `duplicate_of` pointing at the original. It copies the original's triage (again
+whenever the original is triaged or re-triaged, since it is usually still queued when the duplicate
+arrives) and is neither triaged again nor given an SLA deadline. The customer is acknowledged with a
+reference to the original ticket.
+
+    python -m app.dedup reindex   # sign complaints stored earlier (and after changing SIMHASH_MAX_DISTANCE)
+"""
+import argparse
+import hashlib
+import logging
+import re
+from collections import Counter
+from datetime import datetime, timedelta
+from sqlalchemy import select, tuple_, delete
+from . import config
+from .database import SessionLocal, init_db
+from .models import Complaint, ComplaintSignature
+from .summary import snapshot, record_changes, set_categories, set_keywords
+
+logger = logging.getLogger(__name__)
+
+_MASK64 = (1 << 64) - 1
+_TOKEN_RE = re.compile(r"[a-z0-9']+")
+# triage fields a linked duplicate inherits from its original
+_COPIED = ('categories', 'severity', 'department', 'sentiment', 'keywords', 'llm_classification', 'llm_routing')
+
+
+def normalize_message_id(value) -> str:
+    """'<ABC@Mail.Example.com> ' -> 'abc@mail.example.com'; None for a missing or empty header."""
+    if not value:
+        return None
+    value = str(value).strip()
+    if value.startswith('<') and '>' in value:
+        value = value[1:value.index('>')]
+    return value.strip().lower() or None
+
+
+def _hash64(feature: str) -> int:
+    return int.from_bytes(hashlib.blake2b(feature.encode(), digest_size=8).digest(), 'big')
+
+
+def simhash(text: str):
+    """Signed 64-bit SimHash over word unigrams and bigrams, or None when the text is too short to compare."""
+    tokens = _TOKEN_RE.findall((text or '').lower())
+    if len(tokens) < config.SIMHASH_MIN_TOKENS:
+        return None
+    features = Counter(tokens)
+    features.update(f"{a} {b}" for a, b in zip(tokens, tokens[1:]))
+    weights = [0] * 64
+    for feature, weight in features.items():
+        h = _hash64(feature)
+        for bit in range(64):
+            weights[bit] += weight if h >> bit & 1 else -weight
+    h = sum(1 << bit for bit in range(64) if weights[bit] > 0)
+    return h - (1 << 64) if h >= 1 << 63 else h  # SQLite integers are signed
+
+
+def hamming(a: int, b: int) -> int:
+    return bin((a ^ b) & _MASK64).count('1')
+
+
+def _band_widths(max_distance: int) -> list:
+    # one more band than the allowed distance: some band of a close enough hash is left untouched
+    n = max_distance + 1
+    return [64 // n + (1 if i < 64 % n else 0) for i in range(n)]
+
+
+def bands(h: int) -> list:
+    h &= _MASK64
+    out, shift = [], 0
+    for i, width in enumerate(_band_widths(config.SIMHASH_MAX_DISTANCE)):
+        out.append((i, h >> shift & ((1 << width) - 1)))
+        shift += width
+    return out
+
+
+def _owner(email: str):
+    return email.strip().lower() if email else None
+
+
+def find_near_duplicate(db, customer_email: str, h: int, exclude_id: int = None):
+    """The closest recent original ticket of the customer within SIMHASH_MAX_DISTANCE, or None."""
+    owner = _owner(customer_email)
+    if owner is None or h is None:
+        return None
+    since = datetime.utcnow() - timedelta(days=config.DEDUP_WINDOW_DAYS)
+    rows = db.execute(
+        select(Complaint.id, Complaint.simhash)
+        .join(ComplaintSignature, ComplaintSignature.complaint_id == Complaint.id)
+        .where(ComplaintSignature.customer_email == owner,
+               tuple_(ComplaintSignature.band, ComplaintSignature.value).in_(bands(h)),
+               Complaint.duplicate_of.is_(None), Complaint.created_at >= since)
+        .distinct()
+    ).all()
+    best = None
+    for cid, other in rows:
+        if cid == exclude_id or other is None:
+            continue
+        d = hamming(h, other)
+        if d <= config.SIMHASH_MAX_DISTANCE and (best is None or (d, cid) < best):
+            best = (d, cid)
+    return best[1] if best else None
+
+
+def index_signature(db, complaint_id: int, customer_email: str, h: int):
+    owner = _owner(customer_email)
+    if owner is None or h is None:
+        return
+    db.add_all(ComplaintSignature(customer_email=owner, band=b, value=v, complaint_id=complaint_id) for b, v in bands(h))
+    db.flush()  # visible to the next lookup in this transaction (sessions don't autoflush)
+
+
+def link_if_duplicate(db, c):
+    """Sign a newly flushed complaint and link it to a near-duplicate original; returns the original's id or None.
+
+    Call before the complaint is counted in the summary, since a duplicate's status changes here.
+    """
+    c.simhash = simhash(c.description)
+    if not config.DEDUP_NEAR_DUPLICATES or c.simhash is None:
+        return None
+    original_id = find_near_duplicate(db, c.customer_email, c.simhash, exclude_id=c.id)
+    if original_id is None:
+        index_signature(db, c.id, c.customer_email, c.simhash)
+        return None
+    original = db.get(Complaint, original_id)
+    c.duplicate_of = original_id
+    c.status = 'Duplicate'
+    c.sla_due_at = None
+    _copy_triage(db, original, [c])
+    logger.info("Complaint %s is a near-duplicate of %s", c.id, original_id)
+    return original_id
+
+
+def _copy_triage(db, original, duplicates):
+    for d in duplicates:
+        for field in _COPIED:
+            setattr(d, field, getattr(original, field))
+    set_categories(db, {d.id: d.categories for d in duplicates})
+    set_keywords(db, {d.id: d.keywords for d in duplicates})
+
+
+def update_duplicates(db, original_ids) -> int:
+    """Copy the (re-)triaged originals' fields to their linked duplicates, with summary counters; call after flushing."""
+    duplicates = db.execute(select(Complaint).where(Complaint.duplicate_of.in_(list(original_ids)))).scalars().all()
+    if not duplicates:
+        return 0
+    by_original = {}
+    for d in duplicates:
+        by_original.setdefault(d.duplicate_of, []).append(d)
+    before = {d.id: snapshot(d) for d in duplicates}
+    for original in db.execute(select(Complaint).where(Complaint.id.in_(list(by_original)))).scalars():
+        _copy_triage(db, original, by_original[original.id])
+    record_changes(db, [(before[d.id], snapshot(d)) for d in duplicates])
+    return len(duplicates)
+
+
+def reindex(db, chunk_size: int = 1000) -> int:
+    """Recompute simhash and signatures of every original complaint, in id order."""
+    db.execute(delete(ComplaintSignature))
+    last_id, n = 0, 0
+    while True:
+        rows = db.execute(
+            select(Complaint).where(Complaint.id > last_id, Complaint.duplicate_of.is_(None))
+            .order_by(Complaint.id).limit(chunk_size)
+        ).scalars().all()
+        if not rows:
+            return n
+        for c in rows:
+            c.simhash = simhash(c.description)
+            index_signature(db, c.id, c.customer_email, c.simhash)
+        db.flush()
+        db.expunge_all()
+        last_id = rows[-1].id
+        n += len(rows)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Maintain the near-duplicate signature index")
+    parser.add_argument('command', choices=['reindex'])
+    parser.parse_args(argv)
+
+    init_db()
+    db = SessionLocal()
+    try:
+        n = reindex(db)
+        db.commit()
+        print(f"signed {n} complaints")
+        return 0
+    finally:
+        db.close()
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -1,93 +1,267 @@
+"""IMAP ingestion over one long-lived session.
+
+The session stays logged in and selected between polls. New mail is found with a UID SEARCH above the
+stored watermark (`mailbox_state`: UIDVALIDITY + last UID stored), fetched IMAP_FETCH_BATCH messages per
+UID FETCH with BODY.PEEK[] (so nothing is flagged before it is stored), parsed and stored by the stages
+in app.ingest_pipeline, and marked \\Seen with one UID STORE per batch once stored. Between polls the
+session waits in IDLE, so new mail is picked up as soon as the server announces it; servers without
+IDLE are polled every IMAP_POLL_INTERVAL seconds.
+"""
 import imaplib
 import email
-from email.header import decode_header
+import re
+import select
+import threading
 import time
 import logging
-from datetime import datetime
-from .config import IMAP_SERVER, IMAP_USER, IMAP_PASSWORD, IMAP_POLL_INTERVAL
+from sqlalchemy import func, case
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from . import config
 from .database import SessionLocal
-from .models import Complaint
-from .utils.extract_metadata import extract_text_from_email
-from .utils.notifier import send_acknowledgement
-from .utils.router import process_and_route
+from .models import MailboxState
+from .utils.extract_metadata import extract_text_from_email, parse_email_bytes, header_text
+from .dedup import normalize_message_id
 
 logger = logging.getLogger(__name__)
 
+_FETCH_UID_RE = re.compile(rb"UID (\d+)")
+_EXISTS_RE = re.compile(rb"^\* \d+ (EXISTS|RECENT)")
 
-def poll_inbox_once():
-    if not IMAP_SERVER or not IMAP_USER or not IMAP_PASSWORD:
-        logger.warning("IMAP credentials not configured")
+
+def uid_set(uids) -> str:
+    """Compact IMAP sequence set for sorted UIDs: [1, 2, 3, 7, 9, 10] -> '1:3,7,9:10'."""
+    parts = []
+    start = prev = None
+    for uid in uids:
+        if prev is not None and uid == prev + 1:
+            prev = uid
+            continue
+        if start is not None:
+            parts.append(str(start) if start == prev else f"{start}:{prev}")
+        start = prev = uid
+    if start is not None:
+        parts.append(str(start) if start == prev else f"{start}:{prev}")
+    return ",".join(parts)
+
+
+class IMAPSession:
+    def __init__(self, server: str = None, user: str = None, password: str = None, mailbox: str = None,
+                 port: int = None, use_ssl: bool = None):
+        self.server = server or config.IMAP_SERVER
+        self.user = user or config.IMAP_USER
+        self.password = password or config.IMAP_PASSWORD
+        self.mailbox = mailbox or config.IMAP_MAILBOX
+        self.port = port or config.IMAP_PORT
+        self.use_ssl = config.IMAP_SSL if use_ssl is None else use_ssl
+        self.key = f"{self.user}@{self.server}/{self.mailbox}"
+        self.conn = None
+        self.uidvalidity = None
+        self.lock = threading.Lock()  # imaplib connections are not thread-safe
+        self.interrupt = threading.Event()  # ends an IDLE early so another caller can use the session
+
+    def connect(self):
+        cls = imaplib.IMAP4_SSL if self.use_ssl else imaplib.IMAP4
+        conn = cls(self.server, self.port)
+        try:
+            conn.login(self.user, self.password)
+            typ, _ = conn.select(self.mailbox)
+            if typ != 'OK':
+                raise imaplib.IMAP4.error(f"SELECT {self.mailbox} failed")
+            _, data = conn.response('UIDVALIDITY')
+            self.uidvalidity = int(data[0]) if data and data[0] else None
+        except Exception:
+            _shutdown(conn)
+            raise
+        self.conn = conn
+        logger.info("IMAP session opened for %s (UIDVALIDITY %s)", self.key, self.uidvalidity)
+
+    def ensure(self):
+        if self.conn is None:
+            self.connect()
+        return self.conn
+
+    def close(self):
+        conn, self.conn = self.conn, None
+        if conn is not None:
+            try:
+                conn.logout()
+            except Exception:
+                _shutdown(conn)
+
+    @property
+    def supports_idle(self) -> bool:
+        return self.conn is not None and 'IDLE' in self.conn.capabilities
+
+    def search_new(self, last_uid: int) -> list:
+        """UIDs of unseen messages above `last_uid` (all unseen when there is no watermark yet)."""
+        criteria = ('UID', f"{last_uid + 1}:*", 'UNSEEN') if last_uid else ('UNSEEN',)
+        typ, data = self.conn.uid('SEARCH', *criteria)
+        if typ != 'OK':
+            raise imaplib.IMAP4.error(f"UID SEARCH failed: {data}")
+        # "n:*" always matches the highest UID, even when it is below n
+        return sorted(u for u in (int(x) for x in (data[0] or b"").split()) if u > last_uid)
+
+    def fetch(self, uids: list) -> list:
+        """[(uid, raw RFC822 bytes)] for `uids`, in one UID FETCH that leaves \\Seen alone."""
+        typ, data = self.conn.uid('FETCH', uid_set(uids), '(UID BODY.PEEK[])')
+        if typ != 'OK':
+            raise imaplib.IMAP4.error(f"UID FETCH failed: {data}")
+        out = []
+        for part in data:
+            if isinstance(part, tuple):
+                m = _FETCH_UID_RE.search(part[0])
+                if m:
+                    out.append((int(m.group(1)), part[1]))
+        return sorted(out)
+
+    def mark_seen(self, uids: list):
+        if uids:
+            self.conn.uid('STORE', uid_set(uids), '+FLAGS.SILENT', '(\\Seen)')
+
+    def idle(self, timeout: float, stop_event=None) -> bool:
+        """Wait in IDLE until the server reports new mail, `timeout` passes, stop or interrupt; True on new mail."""
+        conn = self.conn
+        tag = conn._new_tag()
+        conn.send(tag + b" IDLE\r\n")
+        line = conn.readline()
+        if not line.startswith(b"+"):
+            raise imaplib.IMAP4.abort(f"IDLE refused: {line!r}")
+        sock = conn.sock
+        deadline = time.monotonic() + timeout
+        got_mail = False
+        try:
+            while not got_mail and time.monotonic() < deadline:
+                if (stop_event is not None and stop_event.is_set()) or self.interrupt.is_set():
+                    break
+                # SSL may hold a decrypted record the socket no longer shows as readable
+                pending = getattr(sock, 'pending', lambda: 0)()
+                if not pending and not select.select([sock], [], [], min(1.0, max(0.0, deadline - time.monotonic())))[0]:
+                    continue
+                line = conn.readline()
+                if not line:
+                    raise imaplib.IMAP4.abort("connection closed during IDLE")
+                got_mail = bool(_EXISTS_RE.match(line))
+        finally:
+            conn.send(b"DONE\r\n")
+            while True:
+                line = conn.readline()
+                if not line:
+                    raise imaplib.IMAP4.abort("connection closed while ending IDLE")
+                if line.startswith(tag):
+                    break
+                got_mail = got_mail or bool(_EXISTS_RE.match(line))
+        return got_mail
+
+
+def _shutdown(conn):
+    try:
+        conn.shutdown()
+    except Exception:
+        pass
+
+
+def load_watermark(db, session: IMAPSession) -> int:
+    """Last stored UID for the session's mailbox; 0 when unknown or the mailbox's UIDVALIDITY changed."""
+    state = db.get(MailboxState, session.key)
+    if state is None or state.uidvalidity != session.uidvalidity:
+        if state is not None:
+            logger.warning("UIDVALIDITY of %s changed (%s -> %s); rescanning unseen mail",
+                           session.key, state.uidvalidity, session.uidvalidity)
         return 0
+    return state.last_uid
 
+
+def advance_watermark(db, session: IMAPSession, uid: int):
+    """Move the watermark up to `uid` in `db`'s transaction (never down; a new UIDVALIDITY replaces it)."""
+    stmt = sqlite_insert(MailboxState).values(mailbox=session.key, uidvalidity=session.uidvalidity, last_uid=uid)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[MailboxState.mailbox],
+        set_={
+            "last_uid": case(
+                (MailboxState.uidvalidity == stmt.excluded.uidvalidity, func.max(MailboxState.last_uid, stmt.excluded.last_uid)),
+                else_=stmt.excluded.last_uid,
+            ),
+            "uidvalidity": stmt.excluded.uidvalidity,
+            "updated_at": func.now(),
+        },
+    )
+    db.execute(stmt)
+
+
+def parse_message(raw: bytes) -> dict:
+    msg = parse_email_bytes(raw)
+    from_ = header_text(msg.get('From'))
+    # Try to parse the From header into name and email
+    from_name = None
+    from_email = None
     try:
-        mail = imaplib.IMAP4_SSL(IMAP_SERVER)
-        mail.login(IMAP_USER, IMAP_PASSWORD)
-        mail.select('inbox')
-        status, messages = mail.search(None, '(UNSEEN)')
-        if status != 'OK':
-            return 0
-        msgs = messages[0].split()
-        count = 0
-        for num in msgs:
-            res, msg_data = mail.fetch(num, '(RFC822)')
-            if res != 'OK':
-                continue
-            for part in msg_data:
-                if isinstance(part, tuple):
-                    msg = email.message_from_bytes(part[1])
-                    from_ = msg.get('From')
-                    # Try to parse the From header into name and email
-                    from_name = None
-                    from_email = None
-                    try:
-                        parsed = email.utils.parseaddr(from_)
-                        from_name = parsed[0] if parsed and parsed[0] else None
-                        from_email = parsed[1] if parsed and parsed[1] else from_
-                    except Exception:
-                        from_email = from_
-                    subject = msg.get('Subject')
-                    date = msg.get('Date')
-                    try:
-                        body = extract_text_from_email(msg)
-                    except Exception:
-                        body = ""
-
-                    # Create complaint record
-                    db = SessionLocal()
-                    complaint = Complaint(
-                        customer_name=from_name,
-                        customer_email=from_email,
-                        channel='Email',
-                        subject=subject,
-                        description=body,
-                        received_at=datetime.utcnow()
-                    )
-                    db.add(complaint)
-                    db.commit()
-                    db.refresh(complaint)
-                    db.close()
-
-                    # Process routing/classification asynchronously (simple call)
-                    process_and_route(complaint.id)
-
-                    # Send acknowledgement
-                    send_acknowledgement(complaint.id)
-
-                    count += 1
-            # mark as seen
-            mail.store(num, '+FLAGS', '\\Seen')
-        mail.logout()
-        return count
+        parsed = email.utils.parseaddr(from_)
+        from_name = parsed[0] if parsed and parsed[0] else None
+        from_email = parsed[1] if parsed and parsed[1] else from_
+    except Exception:
+        from_email = from_
+    try:
+        body = extract_text_from_email(msg)
     except Exception:
-        logger.exception("Failed to poll IMAP inbox")
+        body = ""
+    return {"customer_name": from_name, "customer_email": from_email, "subject": header_text(msg.get('Subject')),
+            "description": body, "message_id": normalize_message_id(header_text(msg.get('Message-ID')))}
+
+
+def _ingest_new_mail(session: IMAPSession) -> int:
+    from .ingest_pipeline import run
+    db = SessionLocal()
+    try:
+        last_uid = load_watermark(db, session)
+    finally:
+        db.close()
+    return run(session, session.search_new(last_uid))
+
+
+_session = None
+
+
+def get_session() -> IMAPSession:
+    global _session
+    if _session is None:
+        _session = IMAPSession()
+    return _session
+
+
+def poll_inbox_once():
+    if not config.IMAP_SERVER or not config.IMAP_USER or not config.IMAP_PASSWORD:
+        logger.warning("IMAP credentials not configured")
         return 0
 
+    session = get_session()
+    session.interrupt.set()  # let a waiting IDLE hand over the session
+    with session.lock:
+        session.interrupt.clear()
+        try:
+            session.ensure()
+            return _ingest_new_mail(session)
+        except Exception:
+            logger.exception("Failed to poll IMAP inbox")
+            session.close()  # reconnect on the next poll
+            return 0
+
 
 def start_polling_loop(stop_event):
+    session = get_session()
     while not stop_event.is_set():
-        try:
-            new = poll_inbox_once()
-            logger.info("IMAP polled, new messages=%s", new)
-        except Exception:
-            logger.exception("Error in IMAP poll loop")
-        time.sleep(IMAP_POLL_INTERVAL)
+        new = poll_inbox_once()
+        if new:
+            logger.info("IMAP ingested new messages=%s", new)
+        if session.conn is None:
+            stop_event.wait(config.IMAP_RECONNECT_DELAY)
+            continue
+        if not session.supports_idle:
+            stop_event.wait(config.IMAP_POLL_INTERVAL)
+            continue
+        with session.lock:
+            try:
+                session.idle(config.IMAP_IDLE_TIMEOUT, stop_event)
+            except Exception:
+                logger.exception("IMAP IDLE failed; reconnecting")
+                session.close()
+    session.close()
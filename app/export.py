@@ -0,0 +1,299 @@
+"""Bulk export of complaints (python -m app.export, GET /admin/export).
+
+Rows are read from a read-only SQLite connection inside one read transaction, so the export is a
+consistent snapshot and never takes the writer lock. They are fetched EXPORT_CHUNK_SIZE at a time
+from a single statement ordered by (updated_at, id) and written out chunk by chunk, so memory stays
+flat however large the table is. The connection is opened when streaming starts, not before.
+
+Formats: ndjson, csv and columnar. Columnar is Parquet when pyarrow is installed; otherwise it is
+gzip-compressed column chunks, one JSON object per chunk ({"columns": [...], "rows": n, "data":
+{column: [values]}}), each chunk its own gzip member.
+
+Incremental exports: rows are exported in (updated_at, id) order up to a watermark, the latest
+"updated_at,id" when the export starts. Every write to a complaint moves its updated_at (the model sets
+it, and triggers cover raw SQL), so passing the watermark back as `after`, or letting the CLI keep it
+in a state file, gets the rows added or changed since, e.g. tickets triaged after the last run. A
+changed row is exported again in full; consumers keep the latest copy per id.
+
+    python -m app.export --format csv --columns id,status,severity -o complaints.csv
+    python -m app.export --format columnar --date-from 2024-01-01 -o complaints.parquet
+    python -m app.export --state export.state -o new.ndjson   # only rows added or changed since the last run
+"""
+import argparse
+import csv
+import gzip
+import io
+import json
+import logging
+import os
+import sqlite3
+import sys
+from urllib.parse import quote
+from sqlalchemy import Boolean, Float, Integer
+from sqlalchemy.engine import make_url
+from . import config
+from .models import Complaint
+
+logger = logging.getLogger(__name__)
+
+FORMATS = ("ndjson", "csv", "columnar")
+COLUMNS = [c.name for c in Complaint.__table__.columns]
+
+
+def have_pyarrow() -> bool:
+    try:
+        import pyarrow  # noqa: F401
+        import pyarrow.parquet  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def output_kind(fmt: str) -> tuple:
+    """(file extension, media type) of what `fmt` produces here."""
+    if fmt == "columnar":
+        return ("parquet", "application/vnd.apache.parquet") if have_pyarrow() else ("columns.jsonl.gz", "application/gzip")
+    return {"ndjson": ("ndjson", "application/x-ndjson"), "csv": ("csv", "text/csv")}[fmt]
+
+
+def parse_columns(columns: str = None) -> list:
+    if not columns:
+        return list(COLUMNS)
+    names = [c.strip() for c in columns.split(",") if c.strip()]
+    unknown = [c for c in names if c not in COLUMNS]
+    if unknown:
+        raise ValueError(f"Unknown columns: {', '.join(unknown)}")
+    return list(dict.fromkeys(names))
+
+
+def connect_readonly(url: str = None) -> sqlite3.Connection:
+    path = make_url(url or config.DATABASE_URL).database
+    if not path or path == ":memory:":
+        raise ValueError("Export needs a database file")
+    # check_same_thread off: a streamed response pulls chunks from the threadpool
+    conn = sqlite3.connect(f"file:{quote(os.path.abspath(path))}?mode=ro", uri=True, check_same_thread=False,
+                           isolation_level=None)
+    conn.execute("PRAGMA query_only = 1")
+    return conn
+
+
+def parse_watermark(value: str):
+    """"updated_at,id" (as returned in X-Export-Watermark) -> (updated_at, id); None for an empty value."""
+    if not value:
+        return None
+    updated_at, _, last_id = value.rpartition(",")
+    if updated_at.strip() and last_id.strip().isdigit():
+        return updated_at.strip(), int(last_id)
+    raise ValueError(f"Bad watermark {value!r}, expected 'updated_at,id'")
+
+
+def format_watermark(key) -> str:
+    return f"{key[0]},{key[1]}" if key else ""
+
+
+class Export:
+    """One export run: validates its arguments up front and exposes the watermark before any row is read."""
+
+    def __init__(self, fmt: str = "ndjson", columns: str = None, date_from: str = None, date_to: str = None,
+                 after: str = None, chunk_size: int = None, url: str = None):
+        if fmt not in FORMATS:
+            raise ValueError(f"format must be one of {', '.join(FORMATS)}")
+        self.fmt = fmt
+        self.columns = parse_columns(columns)
+        self.date_from, self.date_to = date_from, date_to
+        self.after = parse_watermark(after)
+        self.chunk_size = chunk_size or config.EXPORT_CHUNK_SIZE
+        self.url = url
+        self.rows = 0
+        # a short-lived connection for validation and the watermark; stream() opens its own, so nothing is held
+        # open (or left open, if the caller never streams) in between
+        conn = connect_readonly(url)
+        try:
+            # a database not yet migrated lacks the newest columns: leave them out, or refuse if asked for by name
+            existing = {r[1] for r in conn.execute("PRAGMA table_info('complaints')")}
+            missing = [c for c in self.columns if c not in existing]
+            if missing and columns:
+                raise ValueError(f"Columns not in this database: {', '.join(missing)}")
+            self.columns = [c for c in self.columns if c in existing]
+            latest = conn.execute("SELECT updated_at, id FROM complaints WHERE updated_at IS NOT NULL "
+                                  "ORDER BY updated_at DESC, id DESC LIMIT 1").fetchone()
+        finally:
+            conn.close()
+        # rows written after this point are past the watermark and left for the next run
+        self.watermark_key = tuple(latest) if latest and (self.after is None or tuple(latest) > self.after) else self.after
+
+    @property
+    def watermark(self) -> str:
+        return format_watermark(self.watermark_key)
+
+    def _chunks(self, conn):
+        if self.watermark_key is None or self.watermark_key == self.after:
+            return
+        where, params = ["(updated_at, id) <= (?, ?)"], list(self.watermark_key)
+        if self.after:
+            where.append("(updated_at, id) > (?, ?)")
+            params.extend(self.after)
+        if self.date_from:
+            where.append("created_at >= ?")
+            params.append(self.date_from)
+        if self.date_to:
+            where.append("created_at <= ?")
+            params.append(self.date_to)
+        cols = ", ".join(self.columns)  # validated against the model and the table
+        cur = conn.execute(f"SELECT {cols} FROM complaints WHERE {' AND '.join(where)} ORDER BY updated_at, id", params)
+        while True:
+            rows = cur.fetchmany(self.chunk_size)
+            if not rows:
+                return
+            self.rows += len(rows)
+            yield rows
+
+    def stream(self):
+        """Yield the export as bytes, chunk by chunk, from its own read transaction; closes it when done."""
+        writer = {"ndjson": _ndjson, "csv": _csv, "columnar": _parquet if have_pyarrow() else _column_chunks}[self.fmt]
+        conn = connect_readonly(self.url)
+        try:
+            conn.execute("BEGIN")
+            yield from writer(self.columns, self._chunks(conn))
+        finally:
+            conn.close()
+        logger.info("Exported %s complaints (%s) up to %s", self.rows, self.fmt, self.watermark)
+
+
+def _ndjson(columns, chunks):
+    for rows in chunks:
+        yield "".join(json.dumps(dict(zip(columns, r)), ensure_ascii=False, default=str) + "\n" for r in rows).encode()
+
+
+def _csv(columns, chunks):
+    buf = io.StringIO()
+    out = csv.writer(buf)
+    out.writerow(columns)
+    for rows in chunks:
+        out.writerows(rows)
+        yield buf.getvalue().encode()
+        buf.seek(0)
+        buf.truncate()
+    if buf.tell():
+        yield buf.getvalue().encode()
+
+
+def _column_chunks(columns, chunks):
+    for rows in chunks:
+        data = {c: list(values) for c, values in zip(columns, zip(*rows))}
+        line = json.dumps({"columns": columns, "rows": len(rows), "data": data}, ensure_ascii=False, default=str)
+        yield gzip.compress(line.encode() + b"\n", compresslevel=6)  # 9 is over twice as slow for ~2% smaller output
+
+
+class _Sink(io.RawIOBase):
+    """Write-only stream that hands over what was written since the last drain; Parquet tracks offsets via tell()."""
+
+    def __init__(self):
+        self.parts = []
+        self.position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        self.parts.append(bytes(b))
+        self.position += len(b)
+        return len(b)
+
+    def tell(self):
+        return self.position
+
+    def drain(self) -> bytes:
+        data = b"".join(self.parts)
+        self.parts.clear()
+        return data
+
+
+def _arrow_type(pa, name):
+    col_type = Complaint.__table__.columns[name].type
+    if isinstance(col_type, Boolean):
+        return pa.bool_()
+    if isinstance(col_type, Integer):
+        return pa.int64()
+    if isinstance(col_type, Float):
+        return pa.float64()
+    return pa.string()  # text, and timestamps as stored
+
+
+def _parquet(columns, chunks):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    schema = pa.schema([(c, _arrow_type(pa, c)) for c in columns])
+    casts = [bool if t == pa.bool_() else str if t == pa.string() else None for t in schema.types]
+    sink = _Sink()
+    writer = pq.ParquetWriter(sink, schema, compression="zstd")
+    try:
+        for rows in chunks:
+            arrays = []
+            for i, (values, cast) in enumerate(zip(zip(*rows), casts)):
+                if cast is not None:
+                    values = [None if v is None else cast(v) for v in values]
+                arrays.append(pa.array(values, type=schema.types[i]))
+            writer.write_batch(pa.RecordBatch.from_arrays(arrays, schema=schema))  # one row group per chunk
+            yield sink.drain()
+    finally:
+        writer.close()
+    yield sink.drain()
+
+
+def _read_state(path: str) -> str:
+    try:
+        with open(path) as f:
+            state = json.load(f)
+    except FileNotFoundError:
+        return None
+    if state.get("updated_at") is None:
+        return None  # nothing exported yet, or a state file from the id-only exports: start over
+    return format_watermark((state["updated_at"], int(state["id"])))
+
+
+def _write_state(path: str, watermark: str):
+    key = parse_watermark(watermark)
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump({"updated_at": key[0], "id": key[1]} if key else {}, f)
+    os.replace(tmp, path)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Stream complaints out of the database")
+    parser.add_argument('--format', choices=FORMATS, default='ndjson')
+    parser.add_argument('--columns', help="comma-separated columns (default: all)")
+    parser.add_argument('--date-from', help="created_at >= this (e.g. 2024-01-01)")
+    parser.add_argument('--date-to', help="created_at <= this")
+    parser.add_argument('--after', help="only rows added or changed after this 'updated_at,id' (a previous watermark)")
+    parser.add_argument('--state', help="file holding the watermark; read before and updated after a successful export")
+    parser.add_argument('--chunk-size', type=int, default=None)
+    parser.add_argument('--db', help="database file (default: DB_PATH)")
+    parser.add_argument('-o', '--output', help="output file (default: stdout)")
+    args = parser.parse_args(argv)
+
+    after = _read_state(args.state) if args.state else args.after
+    try:
+        export = Export(args.format, args.columns, args.date_from, args.date_to, after, args.chunk_size,
+                        f"sqlite:///{args.db}" if args.db else None)
+    except (ValueError, sqlite3.Error) as e:
+        parser.error(str(e))
+    out = open(args.output, "wb") if args.output else sys.stdout.buffer
+    try:
+        for data in export.stream():
+            out.write(data)
+    finally:
+        if args.output:
+            out.close()
+        else:
+            out.flush()
+    if args.state:
+        _write_state(args.state, export.watermark)
+    print(f"exported {export.rows} complaints as {output_kind(args.format)[0]}; watermark {export.watermark}",
+          file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
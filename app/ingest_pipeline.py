@@ -0,0 +1,288 @@
+"""Staged IMAP ingestion: fetch -> parse -> persist, then the triage and acknowledgement queues.
+
+    fetch    the IMAP thread: UID FETCH in IMAP_FETCH_BATCH chunks, and the \\Seen STOREs
+    parse    INGEST_PARSE_WORKERS threads turning raw RFC822 bytes into complaint fields
+    persist  one writer thread (SQLite has a single writer) inserting up to INGEST_PERSIST_BATCH
+             complaints per transaction, with their triage jobs and the UID watermark
+    triage   the job queue workers (QUEUE_WORKERS), which then queue the acknowledgement
+    ack      the outbox senders (OUTBOX_WORKERS)
+
+The in-process stages are joined by queues of INGEST_QUEUE_SIZE items, so a slow stage blocks the one
+before it. The fetch stage also waits while more than INGEST_MAX_TRIAGE_BACKLOG triage jobs are
+pending. A message is flagged \\Seen only after the transaction holding its complaint has committed.
+"""
+import logging
+import queue
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from sqlalchemy import select, func
+from sqlalchemy.exc import OperationalError
+from . import config
+from .database import SessionLocal, engine
+from .models import Complaint, Job, OutboxMessage
+from .summary import snapshot, record_changes
+from .sla_monitor import sla_due_at
+from .job_queue import enqueue, notify as notify_jobs
+from .email_ingestor import parse_message, advance_watermark
+from .dedup import link_if_duplicate
+
+logger = logging.getLogger(__name__)
+
+_DONE = object()
+
+
+class StageStats:
+    def __init__(self, name: str):
+        self.name = name
+        self._lock = threading.Lock()
+        self.items = 0
+        self.errors = 0
+        self.busy_seconds = 0.0
+        self.waits = 0  # times the stage was held back by the stage after it
+        self.skips = 0  # items dropped as already stored
+
+    def record(self, items: int, seconds: float, errors: int = 0):
+        with self._lock:
+            self.items += items
+            self.errors += errors
+            self.busy_seconds += seconds
+
+    def waited(self):
+        with self._lock:
+            self.waits += 1
+
+    def skipped(self):
+        with self._lock:
+            self.skips += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "items": self.items,
+                "errors": self.errors,
+                "waits": self.waits,
+                "skips": self.skips,
+                "busy_seconds": round(self.busy_seconds, 3),
+                "items_per_second": round(self.items / self.busy_seconds, 1) if self.busy_seconds else None,
+            }
+
+
+STAGES = {name: StageStats(name) for name in ("fetch", "parse", "persist")}
+
+
+def _put(q, item, stage: StageStats):
+    try:
+        q.put_nowait(item)
+    except queue.Full:
+        stage.waited()
+        q.put(item)
+
+
+def triage_backlog() -> int:
+    with engine.connect() as conn:
+        return conn.execute(
+            select(func.count(Job.id)).where(Job.kind == 'triage', Job.status.in_(('queued', 'running')))
+        ).scalar()
+
+
+class _Run:
+    """State shared by the stage threads of one ingest run."""
+
+    def __init__(self, session):
+        self.session = session
+        self.parse_q = queue.Queue(maxsize=config.INGEST_QUEUE_SIZE)
+        self.persist_q = queue.Queue(maxsize=config.INGEST_QUEUE_SIZE)
+        self.fetched = deque()  # fetched UIDs in order; the persist stage advances the watermark along it
+        self.persisted = queue.SimpleQueue()  # committed UIDs the fetch thread should flag \Seen
+        self.failed = threading.Event()
+        self.count = 0
+
+    def parse_worker(self):
+        stats = STAGES["parse"]
+        while True:
+            item = self.parse_q.get()
+            if item is _DONE:
+                return
+            if self.failed.is_set():
+                continue  # keep draining so the fetch thread can finish
+            uid, raw = item
+            started = time.perf_counter()
+            try:
+                fields = parse_message(raw)
+            except Exception:
+                logger.exception("Failed to parse message UID %s", uid)
+                self.failed.set()
+                stats.record(0, time.perf_counter() - started, errors=1)
+                continue
+            stats.record(1, time.perf_counter() - started)
+            _put(self.persist_q, (uid, fields), stats)
+
+    def persist_worker(self):
+        done = set()
+        finished = False
+        while not finished:
+            item = self.persist_q.get()
+            if item is _DONE:
+                return
+            batch = [item]
+            while len(batch) < config.INGEST_PERSIST_BATCH:
+                try:
+                    item = self.persist_q.get(timeout=0.05)
+                except queue.Empty:
+                    break
+                if item is _DONE:
+                    finished = True
+                    break
+                batch.append(item)
+            if self.failed.is_set():
+                continue  # keep draining so the producers can finish; these are refetched next time
+            started = time.perf_counter()
+            stored, errors = self.persist_isolated(batch, done)
+            STAGES["persist"].record(stored, time.perf_counter() - started, errors=errors)
+
+    def persist_isolated(self, batch: list, done: set) -> tuple:
+        """Store `batch`, or its messages one at a time if that fails; returns (stored, errors)."""
+        try:
+            self.persist(batch, done)
+            return len(batch), 0
+        except Exception as e:
+            if len(batch) == 1:
+                return 0, self.skip(batch[0], e, done)
+            logger.warning("Failed to store %d ingested messages (%s), storing them one at a time", len(batch), e)
+        stored = errors = 0
+        for item in batch:
+            if self.failed.is_set():
+                errors += 1  # refetched next time
+                continue
+            n, failed = self.persist_isolated([item], done)
+            stored += n
+            errors += failed
+        return stored, errors
+
+    def skip(self, item: tuple, error: Exception, done: set) -> int:
+        """Give up on a message that can't be stored: move the watermark past it but leave it unread."""
+        uid, fields = item
+        if isinstance(error, OperationalError):
+            # locked, full or broken database: not this message's fault, try everything again next time
+            logger.error("Failed to store ingested message UID %s: %s", uid, error)
+            self.failed.set()
+            return 1
+        logger.error("Skipping message UID %s (subject %r), it stays unread in the mailbox: %s",
+                     uid, fields.get("subject"), error)
+        try:
+            self.persist([], done, skip=[uid])
+        except Exception:
+            logger.exception("Failed to move the watermark past UID %s", uid)
+            self.failed.set()
+        return 1
+
+    def persist(self, batch: list, done: set, skip=()):
+        db = SessionLocal()
+        try:
+            now = datetime.utcnow()
+            # a message stored before (a crash before \Seen, a resend with the same Message-ID) is skipped
+            ids = {fields["message_id"] for _, fields in batch if fields["message_id"]}
+            seen = set(db.execute(select(Complaint.message_id).where(Complaint.message_id.in_(ids))).scalars()) if ids else set()
+            complaints = []
+            for _, fields in batch:
+                if fields["message_id"] in seen:
+                    STAGES["persist"].skipped()
+                    continue
+                if fields["message_id"]:
+                    seen.add(fields["message_id"])
+                complaints.append(Complaint(channel='Email', received_at=now, sla_due_at=sla_due_at(now, None), **fields))
+            db.add_all(complaints)
+            db.flush()
+            # triage and acknowledgement run on the job workers, committed with the complaints;
+            # near-duplicates are linked to the earlier ticket instead, and only acknowledged
+            for c in complaints:
+                enqueue(db, 'triage' if link_if_duplicate(db, c) is None else 'acknowledge', c.id)
+            record_changes(db, [(None, snapshot(c)) for c in complaints])
+            # parsers finish out of order: the watermark only moves past UIDs that are all stored (or skipped)
+            pending = done | {uid for uid, _ in batch} | set(skip)
+            marked = []
+            try:
+                while self.fetched and self.fetched[0] in pending:
+                    marked.append(self.fetched.popleft())
+                if marked:
+                    advance_watermark(db, self.session, marked[-1])
+                db.commit()
+            except Exception:
+                self.fetched.extendleft(reversed(marked))
+                raise
+            done.clear()
+            done.update(pending.difference(marked))
+        finally:
+            db.close()
+        notify_jobs()
+        self.count += len(complaints)
+        for uid, _ in batch:
+            self.persisted.put(uid)
+
+    def flag_seen(self):
+        uids = []
+        while True:
+            try:
+                uids.append(self.persisted.get_nowait())
+            except queue.Empty:
+                break
+        if uids:
+            self.session.mark_seen(sorted(uids))
+
+    def wait_for_triage(self):
+        while not self.failed.is_set() and triage_backlog() >= config.INGEST_MAX_TRIAGE_BACKLOG:
+            STAGES["fetch"].waited()
+            time.sleep(config.INGEST_BACKLOG_WAIT)
+
+
+def run(session, uids: list) -> int:
+    """Push `uids` through the stages on `session` (owned by the calling thread); returns how many were stored."""
+    if not uids:
+        return 0
+    r = _Run(session)
+    parsers = [threading.Thread(target=r.parse_worker, name=f"ingest-parse-{i}", daemon=True)
+               for i in range(max(1, config.INGEST_PARSE_WORKERS))]
+    persister = threading.Thread(target=r.persist_worker, name="ingest-persist", daemon=True)
+    for t in parsers + [persister]:
+        t.start()
+    try:
+        fetch = STAGES["fetch"]
+        for i in range(0, len(uids), config.IMAP_FETCH_BATCH):
+            if r.failed.is_set():
+                break
+            r.wait_for_triage()
+            started = time.perf_counter()
+            rows = session.fetch(uids[i:i + config.IMAP_FETCH_BATCH])
+            fetch.record(len(rows), time.perf_counter() - started)
+            for uid, raw in rows:
+                r.fetched.append(uid)
+                _put(r.parse_q, (uid, raw), fetch)
+            r.flag_seen()
+    finally:
+        for _ in parsers:
+            r.parse_q.put(_DONE)
+        for t in parsers:
+            t.join()
+        r.persist_q.put(_DONE)
+        persister.join()
+    r.flag_seen()
+    return r.count
+
+
+def pipeline_stats() -> dict:
+    """Per-stage counters for the in-process stages, and queue depth of the triage/ack stages after them."""
+    out = {name: s.snapshot() for name, s in STAGES.items()}
+    with engine.connect() as conn:
+        jobs = conn.execute(
+            select(Job.kind, Job.status, func.count()).where(Job.kind.in_(('triage', 'acknowledge')))
+            .group_by(Job.kind, Job.status)
+        ).all()
+        acks = conn.execute(
+            select(OutboxMessage.status, func.count()).where(OutboxMessage.kind == 'ack').group_by(OutboxMessage.status)
+        ).all()
+    out["triage"] = {status: n for kind, status, n in jobs if kind == 'triage'}
+    out["acknowledge"] = {status: n for kind, status, n in jobs if kind == 'acknowledge'}
+    out["ack_outbox"] = dict(acks)
+    return out
@@ -0,0 +1,177 @@
+import threading
+import logging
+from datetime import datetime, timedelta
+from sqlalchemy import update, select
+from . import config
+from .database import SessionLocal, engine
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+# Set whenever new work is committed so idle workers wake up before the next poll
+_wakeup = threading.Event()
+
+
+def enqueue(db, kind: str, complaint_id: int = None, max_attempts: int = None):
+    """Add a job to `db` (caller commits, so the job is durable together with its complaint)."""
+    job = Job(
+        kind=kind,
+        complaint_id=complaint_id,
+        status='queued',
+        attempts=0,
+        max_attempts=max_attempts or config.QUEUE_MAX_ATTEMPTS,
+        run_after=datetime.utcnow(),
+    )
+    db.add(job)
+    return job
+
+
+def notify():
+    _wakeup.set()
+
+
+def claim_job(kinds: list[str] = None):
+    """Atomically move the oldest runnable job to 'running' and return (id, kind, complaint_id, attempts, max_attempts)."""
+    now = datetime.utcnow()
+    pick = select(Job.id).where(Job.status == 'queued', Job.run_after <= now)
+    if kinds:
+        pick = pick.where(Job.kind.in_(kinds))
+    pick = pick.order_by(Job.run_after, Job.id).limit(1).scalar_subquery()
+    stmt = (
+        update(Job)
+        .where(Job.id == pick, Job.status == 'queued')
+        .values(status='running', locked_at=now, attempts=Job.attempts + 1)
+        .returning(Job.id, Job.kind, Job.complaint_id, Job.attempts, Job.max_attempts)
+    )
+    with engine.begin() as conn:
+        row = conn.execute(stmt).first()
+    return row
+
+
+def complete_job(job_id: int):
+    with engine.begin() as conn:
+        conn.execute(
+            update(Job).where(Job.id == job_id)
+            .values(status='done', finished_at=datetime.utcnow(), locked_at=None, last_error=None)
+        )
+
+
+def fail_job(job_id: int, attempts: int, max_attempts: int, error: str):
+    """Reschedule with exponential backoff, or move to the 'dead' (dead-letter) state when out of attempts."""
+    now = datetime.utcnow()
+    if attempts >= max_attempts:
+        values = dict(status='dead', finished_at=now, locked_at=None, last_error=error)
+        logger.error("Job %s moved to dead-letter after %s attempts: %s", job_id, attempts, error)
+    else:
+        delay = min(config.QUEUE_BACKOFF_BASE * (2 ** (attempts - 1)), config.QUEUE_BACKOFF_MAX)
+        values = dict(status='queued', run_after=now + timedelta(seconds=delay), locked_at=None, last_error=error)
+        logger.warning("Job %s failed (attempt %s/%s), retrying in %.1fs: %s", job_id, attempts, max_attempts, delay, error)
+    with engine.begin() as conn:
+        conn.execute(update(Job).where(Job.id == job_id).values(**values))
+
+
+def recover_jobs():
+    """Requeue jobs left 'running' by a crashed or killed process. Call once at startup before workers run.
+
+    A job that was on its last attempt is dead-lettered instead, so one that takes the process down
+    every time it runs (OOM, a crash in a native library) is not retried forever.
+    """
+    now = datetime.utcnow()
+    with engine.begin() as conn:
+        dead = conn.execute(
+            update(Job).where(Job.status == 'running', Job.attempts >= Job.max_attempts)
+            .values(status='dead', finished_at=now, locked_at=None, last_error="Interrupted on its last attempt")
+        )
+        res = conn.execute(
+            update(Job).where(Job.status == 'running')
+            .values(status='queued', locked_at=None, run_after=now)
+        )
+    if dead.rowcount:
+        logger.error("Moved %s interrupted job(s) out of attempts to dead-letter", dead.rowcount)
+    if res.rowcount:
+        logger.warning("Recovered %s interrupted job(s)", res.rowcount)
+    return res.rowcount
+
+
+def requeue_job(job_id: int):
+    """Give a dead-lettered job a fresh set of attempts."""
+    with engine.begin() as conn:
+        res = conn.execute(
+            update(Job).where(Job.id == job_id, Job.status == 'dead')
+            .values(status='queued', attempts=0, run_after=datetime.utcnow(), finished_at=None, last_error=None)
+        )
+    notify()
+    return res.rowcount > 0
+
+
+def _run_triage(job):
+    from .utils.router import process_and_route
+    result = process_and_route(job.complaint_id)
+    if result is None:
+        raise LookupError(f"Complaint {job.complaint_id} not found")
+    # acknowledgement is a separate job so a failure there doesn't repeat the LLM triage
+    db = SessionLocal()
+    try:
+        enqueue(db, 'acknowledge', job.complaint_id)
+        db.commit()
+    finally:
+        db.close()
+    notify()
+
+
+def _run_acknowledge(job):
+    from .utils.notifier import send_acknowledgement
+    # only queues the email; SMTP retries happen in the outbox, not by re-running this job
+    send_acknowledgement(job.complaint_id)
+
+
+HANDLERS = {
+    'triage': _run_triage,
+    'acknowledge': _run_acknowledge,
+}
+
+
+def run_next_job():
+    """Claim and run a single job. Returns False when nothing was runnable."""
+    job = claim_job(list(HANDLERS))
+    if job is None:
+        return False
+    handler = HANDLERS[job.kind]
+    try:
+        handler(job)
+    except Exception as e:
+        logger.exception("Job %s (%s) failed", job.id, job.kind)
+        fail_job(job.id, job.attempts, job.max_attempts, f"{type(e).__name__}: {e}")
+    else:
+        complete_job(job.id)
+    return True
+
+
+def run_pending_jobs(limit: int = None):
+    """Drain runnable jobs on the calling thread (used by tests and one-off scripts)."""
+    n = 0
+    while (limit is None or n < limit) and run_next_job():
+        n += 1
+    return n
+
+
+def worker_loop(stop_event):
+    while not stop_event.is_set():
+        # cleared before claiming: a notify() from now on either finds its job claimed here or wakes the wait
+        _wakeup.clear()
+        try:
+            if run_next_job():
+                continue
+        except Exception:
+            logger.exception("Error in job worker loop")
+        _wakeup.wait(config.QUEUE_POLL_INTERVAL)
+
+
+def start_workers(stop_event, count: int = None):
+    count = config.QUEUE_WORKERS if count is None else count
+    threads = []
+    for i in range(count):
+        t = threading.Thread(target=worker_loop, args=(stop_event,), name=f"job-worker-{i}", daemon=True)
+        t.start()
+        threads.append(t)
+    return threads
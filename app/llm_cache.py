@@ -0,0 +1,181 @@
+import hashlib
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from sqlalchemy import select, delete, func
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from . import config
+from .database import engine
+from .models import LLMCacheEntry
+
+logger = logging.getLogger(__name__)
+
+# Prune the SQLite tier back to LLM_CACHE_DB_MAX_ENTRIES every this many writes
+_PRUNE_EVERY = 200
+
+
+def make_key(model: str, system: str, prompt: str, temperature: float) -> str:
+    raw = json.dumps([model, system or "", prompt, float(temperature)], ensure_ascii=False)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class LRUCache:
+    """Thread-safe in-process LRU with a per-entry TTL."""
+
+    def __init__(self, max_entries: int, ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            value, stored_at = item
+            if self.ttl and time.time() - stored_at > self.ttl:
+                del self._data[key]
+                self.expirations += 1
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def put(self, key, value, stored_at: float = None):
+        with self._lock:
+            self._data[key] = (value, stored_at or time.time())
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class LLMCache:
+    def __init__(self, max_entries: int, ttl: float, persist: bool, db_max_entries: int):
+        self.memory = LRUCache(max_entries, ttl)
+        self.ttl = ttl
+        self.persist = persist
+        self.db_max_entries = db_max_entries
+        self._lock = threading.Lock()
+        self._writes = 0
+        self.hits = 0
+        self.db_hits = 0
+        self.misses = 0
+        self.stores = 0
+
+    def get(self, key: str):
+        value = self.memory.get(key)
+        if value is not None:
+            with self._lock:
+                self.hits += 1
+            return value
+        if self.persist:
+            value, stored_at = self._db_get(key)
+            if value is not None:
+                # promote to the memory tier, keeping the original age so the TTL still applies
+                self.memory.put(key, value, stored_at)
+                with self._lock:
+                    self.hits += 1
+                    self.db_hits += 1
+                return value
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key: str, value: str, model: str = None):
+        if value is None:
+            return
+        now = time.time()
+        self.memory.put(key, value, now)
+        with self._lock:
+            self.stores += 1
+            self._writes += 1
+            prune = self._writes % _PRUNE_EVERY == 0
+        if self.persist:
+            self._db_put(key, value, model, now)
+            if prune:
+                self.prune()
+
+    def _db_get(self, key: str):
+        try:
+            with engine.connect() as conn:
+                row = conn.execute(
+                    select(LLMCacheEntry.response, LLMCacheEntry.created_at).where(LLMCacheEntry.key == key)
+                ).first()
+        except Exception:
+            logger.exception("LLM cache lookup failed")
+            return None, None
+        if row is None:
+            return None, None
+        if self.ttl and time.time() - row.created_at > self.ttl:
+            return None, None
+        return row.response, row.created_at
+
+    def _db_put(self, key: str, value: str, model: str, now: float):
+        stmt = sqlite_insert(LLMCacheEntry).values(key=key, model=model, response=value, created_at=now)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[LLMCacheEntry.key],
+            set_={"response": stmt.excluded.response, "created_at": stmt.excluded.created_at},
+        )
+        try:
+            with engine.begin() as conn:
+                conn.execute(stmt)
+        except Exception:
+            logger.exception("LLM cache store failed")
+
+    def prune(self):
+        """Drop expired rows and the oldest rows beyond db_max_entries from the SQLite tier."""
+        try:
+            with engine.begin() as conn:
+                if self.ttl:
+                    conn.execute(delete(LLMCacheEntry).where(LLMCacheEntry.created_at < time.time() - self.ttl))
+                count = conn.execute(select(func.count()).select_from(LLMCacheEntry)).scalar()
+                excess = count - self.db_max_entries
+                if excess > 0:
+                    oldest = select(LLMCacheEntry.key).order_by(LLMCacheEntry.created_at).limit(excess)
+                    conn.execute(delete(LLMCacheEntry).where(LLMCacheEntry.key.in_(oldest)))
+        except Exception:
+            logger.exception("LLM cache prune failed")
+
+    def clear(self):
+        self.memory.clear()
+        if self.persist:
+            with engine.begin() as conn:
+                conn.execute(delete(LLMCacheEntry))
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "enabled": config.LLM_CACHE_ENABLED,
+                "persist": self.persist,
+                "ttl_seconds": self.ttl,
+                "entries": len(self.memory),
+                "max_entries": self.memory.max_entries,
+                "hits": self.hits,
+                "db_hits": self.db_hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "stores": self.stores,
+                "evictions": self.memory.evictions,
+                "expirations": self.memory.expirations,
+            }
+
+
+cache = LLMCache(
+    max_entries=config.LLM_CACHE_MAX_ENTRIES,
+    ttl=config.LLM_CACHE_TTL,
+    persist=config.LLM_CACHE_PERSIST,
+    db_max_entries=config.LLM_CACHE_DB_MAX_ENTRIES,
+)
@@ -0,0 +1,168 @@
+import asyncio
+import logging
+import os
+import threading
+import httpx
+from . import config
+
+logger = logging.getLogger(__name__)
+
+# Default endpoints
+DEFAULT_OPENAI_URL = os.getenv("LLM_API_URL", "https://api.openai.com/v1/chat/completions")
+# GitHub Models URL (user can override with GITHUB_MODELS_URL env var)
+DEFAULT_GITHUB_MODELS_URL = os.getenv("GITHUB_MODELS_URL", "https://models.github.ai/inference/chat/completions")
+DEFAULT_GITHUB_API_VERSION = os.getenv('GITHUB_API_VERSION', '2022-11-28')
+
+
+def _http2_available() -> bool:
+    if not config.LLM_HTTP2:
+        return False
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def build_endpoint():
+    """Return (url, headers) based on available tokens and env vars.
+
+    Priority:
+    - If config.GITHUB_TOKEN is set, use GITHUB_MODELS_URL and GitHub headers.
+    - Otherwise use DEFAULT_OPENAI_URL and expect an OpenAI-style key in env LLM_API_KEY or OPENAI_API_KEY.
+    """
+    # If user set a GitHub token, prefer GitHub Models endpoint
+    gh_token = getattr(config, 'GITHUB_TOKEN', None)
+    if gh_token:
+        url = getattr(config, 'GITHUB_MODELS_URL', DEFAULT_GITHUB_MODELS_URL)
+        headers = {
+            'Accept': 'application/vnd.github+json',
+            'Authorization': f'Bearer {gh_token}',
+            'Content-Type': 'application/json',
+            'X-GitHub-Api-Version': getattr(config, 'GITHUB_API_VERSION', DEFAULT_GITHUB_API_VERSION),
+        }
+        return url, headers
+
+    # Fallback to OpenAI-style
+    url = os.getenv('LLM_API_URL', DEFAULT_OPENAI_URL)
+    api_key = os.getenv('LLM_API_KEY') or os.getenv('OPENAI_API_KEY') or os.getenv('OPENAI_KEY')
+    headers = {"Content-Type": "application/json"}
+    if api_key:
+        headers['Authorization'] = f'Bearer {api_key}'
+    return url, headers
+
+
+class LLMClient:
+    """Process-wide HTTP client for the LLM provider.
+
+    One pooled keep-alive connection set is shared by every caller (request handlers, job
+    workers, SLA/IMAP threads); `post` is the blocking API and `apost` the asyncio one.
+    In-flight requests are capped at `max_concurrency` for each API.
+    """
+
+    def __init__(self, max_connections: int = None, max_keepalive: int = None, keepalive_expiry: float = None,
+                 max_concurrency: int = None, timeout: float = None, connect_timeout: float = None):
+        self.limits = httpx.Limits(
+            max_connections=max_connections or config.LLM_POOL_MAX_CONNECTIONS,
+            max_keepalive_connections=max_keepalive or config.LLM_POOL_MAX_KEEPALIVE,
+            keepalive_expiry=keepalive_expiry or config.LLM_KEEPALIVE_EXPIRY,
+        )
+        self.timeout = httpx.Timeout(timeout or config.LLM_TIMEOUT, connect=connect_timeout or config.LLM_CONNECT_TIMEOUT)
+        self.max_concurrency = max_concurrency or config.LLM_MAX_CONCURRENCY
+        self.http2 = _http2_available()
+        self._lock = threading.Lock()
+        self._client = None
+        self._async_client = None
+        self._async_loop = None
+        self._async_sem = None
+        self._sem = threading.BoundedSemaphore(self.max_concurrency)
+        self._endpoint_key = None
+        self._endpoint = None
+
+    def endpoint(self):
+        """(url, headers) for the configured provider, rebuilt only when credentials or URLs change."""
+        key = (
+            getattr(config, 'GITHUB_TOKEN', None), getattr(config, 'GITHUB_MODELS_URL', None),
+            getattr(config, 'GITHUB_API_VERSION', None), os.getenv('LLM_API_URL'),
+            os.getenv('LLM_API_KEY'), os.getenv('OPENAI_API_KEY'), os.getenv('OPENAI_KEY'),
+        )
+        with self._lock:
+            if key != self._endpoint_key:
+                self._endpoint = build_endpoint()
+                self._endpoint_key = key
+            url, headers = self._endpoint
+        return url, dict(headers)
+
+    def _sync_client(self):
+        with self._lock:
+            if self._client is None:
+                self._client = httpx.Client(limits=self.limits, timeout=self.timeout, http2=self.http2)
+            return self._client
+
+    def _get_async_client(self):
+        loop = asyncio.get_running_loop()
+        stale = None
+        with self._lock:
+            # AsyncClient connections belong to the loop that opened them
+            if self._async_client is None or self._async_loop is not loop:
+                if self._async_client is not None:
+                    stale = (self._async_client, self._async_loop)
+                self._async_client = httpx.AsyncClient(limits=self.limits, timeout=self.timeout, http2=self.http2)
+                self._async_loop = loop
+                self._async_sem = asyncio.Semaphore(self.max_concurrency)
+            client, sem = self._async_client, self._async_sem
+        if stale:
+            _discard_async_client(*stale)
+        return client, sem
+
+    def post(self, url: str, headers: dict, payload: dict) -> httpx.Response:
+        client = self._sync_client()
+        with self._sem:
+            return client.post(url, headers=headers, json=payload)
+
+    async def apost(self, url: str, headers: dict, payload: dict) -> httpx.Response:
+        client, sem = self._get_async_client()
+        async with sem:
+            return await client.post(url, headers=headers, json=payload)
+
+    def close(self):
+        """Release both clients (at shutdown); an async client is closed on its own loop if that still runs."""
+        with self._lock:
+            sync_client, self._client = self._client, None
+            async_client, loop = self._async_client, self._async_loop
+            self._async_client = self._async_loop = None
+        if sync_client is not None:
+            sync_client.close()
+        if async_client is not None:
+            _discard_async_client(async_client, loop)
+
+    async def aclose(self):
+        with self._lock:
+            async_client = self._async_client
+            if async_client is not None and self._async_loop is not asyncio.get_running_loop():
+                async_client = None  # another loop's client: leave it to close()
+            else:
+                self._async_client = self._async_loop = None
+        if async_client is not None:
+            await async_client.aclose()
+
+
+def _discard_async_client(client: httpx.AsyncClient, loop):
+    """Close an AsyncClient that is no longer used, on its loop when it still runs, else on a throwaway loop."""
+    if loop is not None and loop.is_running():
+        asyncio.run_coroutine_threadsafe(client.aclose(), loop)
+        return
+
+    def run():
+        try:
+            asyncio.run(client.aclose())
+        except Exception as e:
+            # the sockets are closed by now; only the cleanup callbacks of the finished loop fail
+            logger.debug("Closing a stale async LLM client: %s", e)
+
+    t = threading.Thread(target=run, name="llm-async-close", daemon=True)
+    t.start()
+    t.join(5)
+
+
+client = LLMClient()
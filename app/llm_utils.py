@@ -1,61 +1,408 @@
 import os
+import re
 import json
+import asyncio
+import contextlib
+import contextvars
 import logging
-import requests
+import threading
+import httpx
+from urllib.parse import urlparse
 from . import config
-from datetime import datetime, timedelta
+from .llm_cache import cache as llm_cache, make_key as cache_key_for
+from .llm_client import client as llm_client
+from .utils.rules import RuleSet, RuleMatch
 import time
 
 logger = logging.getLogger(__name__)
 
-# Default endpoints
-DEFAULT_OPENAI_URL = os.getenv("LLM_API_URL", "https://api.openai.com/v1/chat/completions")
-# GitHub Models URL (user can override with GITHUB_MODELS_URL env var)
-DEFAULT_GITHUB_MODELS_URL = os.getenv("GITHUB_MODELS_URL", "https://models.github.ai/inference/chat/completions")
-DEFAULT_GITHUB_API_VERSION = os.getenv('GITHUB_API_VERSION', '2022-11-28')
-
 
 def _build_headers_and_url():
-    """Return (url, headers) based on available tokens and env vars.
+    """Return (url, headers) for the configured provider (memoized by the shared client)."""
+    return llm_client.endpoint()
+
+
+def _extract_content(data):
+    # OpenAI/GitHub-compatible response path: prefer choices[0].message.content
+    if isinstance(data, dict) and 'choices' in data and len(data['choices']) > 0:
+        choice = data['choices'][0]
+        # OpenAI shape
+        if isinstance(choice, dict) and 'message' in choice and 'content' in choice['message']:
+            return choice['message']['content']
+        # GitHub might nest differently; try to find 'content'
+        if isinstance(choice, dict) and 'content' in choice:
+            return choice['content']
+    # If provider returns text directly
+    if isinstance(data, dict) and 'text' in data:
+        return data['text']
+    # Last resort: return full JSON string
+    return json.dumps(data)
+
+
+LANES = ("urgent", "normal", "bulk")
+_lane = contextvars.ContextVar("llm_lane", default="normal")
+
+
+@contextlib.contextmanager
+def llm_priority(lane: str):
+    """Run the enclosed LLM calls in the given priority lane ("urgent", "normal" or "bulk")."""
+    token = _lane.set(lane if lane in LANES else "normal")
+    try:
+        yield
+    finally:
+        _lane.reset(token)
+
+
+_encoder = None
+_encoder_loaded = False
+
+
+def _get_encoder():
+    """The tiktoken encoding named by LLM_TOKENIZER, or None when tiktoken isn't installed."""
+    global _encoder, _encoder_loaded
+    if not _encoder_loaded:
+        try:
+            import tiktoken
+            _encoder = tiktoken.get_encoding(config.LLM_TOKENIZER)
+        except Exception:
+            _encoder = None
+        _encoder_loaded = True
+    return _encoder
+
+
+def estimate_tokens(text: str) -> int:
+    if not text:
+        return 1
+    enc = _get_encoder()
+    if enc is not None:
+        return len(enc.encode(text, disallowed_special=())) + 1
+    # ~4 characters per token for English text
+    return len(text) // 4 + 1
+
+
+def fit_text(text: str, max_tokens: int = None) -> str:
+    """Trim complaint text to a prompt budget of `max_tokens` (LLM_TEXT_MAX_TOKENS).
 
-    Priority:
-    - If config.GITHUB_TOKEN is set, use GITHUB_MODELS_URL and GitHub headers.
-    - Otherwise use DEFAULT_OPENAI_URL and expect an OpenAI-style key in env LLM_API_KEY or OPENAI_API_KEY.
+    Quoted history and signatures are always dropped; a text still over budget keeps its head and
+    tail (LLM_TEXT_HEAD_RATIO of the budget from the start) around an omission marker.
     """
-    # If user set a GitHub token, prefer GitHub Models endpoint
-    gh_token = getattr(config, 'GITHUB_TOKEN', None)
-    if gh_token:
-        url = getattr(config, 'GITHUB_MODELS_URL', DEFAULT_GITHUB_MODELS_URL)
-        headers = {
-            'Accept': 'application/vnd.github+json',
-            'Authorization': f'Bearer {gh_token}',
-            'Content-Type': 'application/json',
-            'X-GitHub-Api-Version': getattr(config, 'GITHUB_API_VERSION', DEFAULT_GITHUB_API_VERSION),
-        }
-        return url, headers
-
-    # Fallback to OpenAI-style
-    url = os.getenv('LLM_API_URL', DEFAULT_OPENAI_URL)
-    api_key = os.getenv('LLM_API_KEY') or os.getenv('OPENAI_API_KEY') or os.getenv('OPENAI_KEY')
-    headers = {"Content-Type": "application/json"}
-    if api_key:
-        headers['Authorization'] = f'Bearer {api_key}'
-    return url, headers
-
-
-def call_llm(prompt: str, system: str = None, temperature: float = 0.0, max_tokens: int = 512):
-    url, headers = _build_headers_and_url()
+    from .utils.extract_metadata import strip_quotes_and_signature
+    budget = max_tokens or config.LLM_TEXT_MAX_TOKENS
+    text = strip_quotes_and_signature(text or "")
+    if estimate_tokens(text) <= budget:
+        return text
+    budget -= 12  # room for the marker
+    head_n = int(budget * config.LLM_TEXT_HEAD_RATIO)
+    tail_n = budget - head_n
+    enc = _get_encoder()
+    if enc is not None:
+        ids = enc.encode(text, disallowed_special=())
+        head, tail = enc.decode(ids[:head_n]), enc.decode(ids[len(ids) - tail_n:]) if tail_n > 0 else ""
+    else:
+        head, tail = text[:head_n * 4], text[len(text) - tail_n * 4:] if tail_n > 0 else ""
+        # don't cut words in half
+        head = head[:head.rfind(" ")] if " " in head[-40:] else head
+        tail = tail[tail.find(" ") + 1:] if " " in tail[:40] else tail
+    omitted = len(text) - len(head) - len(tail)
+    return f"{head.rstrip()}\n[... {omitted} characters omitted ...]\n{tail.lstrip()}"
+
+
+class TokenUsage:
+    """LLM calls, tokens and latency accumulated inside a `track_usage()` block."""
+
+    def __init__(self):
+        self.calls = 0
+        self.cached = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.llm_ms = 0
+
+    def add(self, prompt_tokens: int, completion_tokens: int, ms: float):
+        self.calls += 1
+        self.prompt_tokens += prompt_tokens
+        self.completion_tokens += completion_tokens
+        self.llm_ms += int(ms)
+
+    def as_dict(self) -> dict:
+        return {"calls": self.calls, "cached": self.cached, "prompt_tokens": self.prompt_tokens,
+                "completion_tokens": self.completion_tokens, "llm_ms": self.llm_ms}
+
+
+_usage = contextvars.ContextVar("llm_usage", default=None)
+
+
+@contextlib.contextmanager
+def track_usage():
+    """Count the tokens and latency of the enclosed LLM calls (e.g. for one complaint)."""
+    usage = TokenUsage()
+    token = _usage.set(usage)
+    try:
+        yield usage
+    finally:
+        _usage.reset(token)
+
+
+def _record_usage(call, data, content: str):
+    usage = _usage.get()
+    if usage is None:
+        return
+    reported = data.get('usage') if isinstance(data, dict) else None
+    reported = reported if isinstance(reported, dict) else {}
+    # provider-reported counts when present, local estimates otherwise
+    prompt_tokens = reported.get('prompt_tokens') or call.prompt_tokens
+    completion_tokens = reported.get('completion_tokens') or estimate_tokens(content)
+    usage.add(int(prompt_tokens), int(completion_tokens), (time.perf_counter() - call.started) * 1000)
+
+
+class TokenBucket:
+    """Refills continuously at `per_minute` tokens per minute, holding at most one minute's worth."""
+
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.rate = self.capacity / 60.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def shortfall(self, n: float, floor: float) -> float:
+        """Tokens missing before `n` can be taken without dropping below `floor`."""
+        return max(0.0, n + floor - self.tokens)
+
+
+class RateLimiter:
+    """Requests/min and tokens/min buckets per (provider, model), with per-lane reserves and metrics."""
+
+    def __init__(self, rpm: int, tpm: int, reserve: dict, max_wait: dict):
+        self.rpm = rpm
+        self.tpm = tpm
+        self.reserve = reserve
+        self.max_wait = max_wait
+        self._lock = threading.Lock()
+        self._buckets = {}
+        self.metrics = {lane: {"admitted": 0, "throttled": 0, "shed": 0} for lane in LANES}
+
+    def _buckets_for(self, key):
+        b = self._buckets.get(key)
+        if b is None:
+            b = self._buckets[key] = (
+                TokenBucket(self.rpm) if self.rpm > 0 else None,
+                TokenBucket(self.tpm) if self.tpm > 0 else None,
+            )
+        return b
+
+    def try_acquire(self, key, tokens: int, lane: str) -> float:
+        """Take quota if available and return 0, otherwise return the seconds to wait before retrying."""
+        reserve = self.reserve.get(lane, 0.0)
+        with self._lock:
+            now = time.monotonic()
+            wait = 0.0
+            needs = []
+            for bucket, n in zip(self._buckets_for(key), (1, tokens)):
+                if bucket is None:
+                    continue
+                bucket.refill(now)
+                floor = bucket.capacity * reserve
+                # a request larger than the lane's share of the bucket could never be admitted
+                n = min(n, bucket.capacity - floor)
+                missing = bucket.shortfall(n, floor)
+                wait = max(wait, missing / bucket.rate)
+                needs.append((bucket, n))
+            if wait > 0:
+                return wait
+            for bucket, n in needs:
+                bucket.tokens -= n
+            return 0.0
+
+    def _record(self, lane: str, waited: bool, admitted: bool):
+        with self._lock:
+            m = self.metrics[lane]
+            if admitted:
+                m["admitted"] += 1
+                if waited:
+                    m["throttled"] += 1
+            else:
+                m["shed"] += 1
+
+    def acquire(self, key, tokens: int, lane: str) -> bool:
+        deadline = time.monotonic() + self.max_wait.get(lane, 0.0)
+        waited = False
+        while True:
+            wait = self.try_acquire(key, tokens, lane)
+            if wait == 0:
+                self._record(lane, waited, True)
+                return True
+            if time.monotonic() + wait > deadline:
+                self._record(lane, waited, False)
+                return False
+            waited = True
+            time.sleep(wait)
+
+    async def acquire_async(self, key, tokens: int, lane: str) -> bool:
+        deadline = time.monotonic() + self.max_wait.get(lane, 0.0)
+        waited = False
+        while True:
+            wait = self.try_acquire(key, tokens, lane)
+            if wait == 0:
+                self._record(lane, waited, True)
+                return True
+            if time.monotonic() + wait > deadline:
+                self._record(lane, waited, False)
+                return False
+            waited = True
+            await asyncio.sleep(wait)
+
+    def stats(self) -> dict:
+        with self._lock:
+            now = time.monotonic()
+            buckets = {}
+            for (provider, model), pair in self._buckets.items():
+                levels = {}
+                for name, bucket in zip(("requests", "tokens"), pair):
+                    if bucket is not None:
+                        bucket.refill(now)
+                        levels[name] = {"available": int(bucket.tokens), "per_minute": int(bucket.capacity)}
+                buckets[f"{provider}/{model}"] = levels
+            return {"lanes": {k: dict(v) for k, v in self.metrics.items()}, "buckets": buckets}
+
+
+class CircuitBreaker:
+    """closed -> open after repeated failures (or a 429); after the open period one probe is let through
+    (half-open) and its outcome closes or re-opens the circuit."""
+
+    def __init__(self, failure_threshold: int, open_seconds: float, max_open_seconds: float):
+        self.failure_threshold = failure_threshold
+        self.open_seconds = open_seconds
+        self.max_open_seconds = max_open_seconds
+        self._lock = threading.Lock()
+        self.state = "closed"
+        self.failures = 0
+        self.open_until = 0.0
+        self.last_open_seconds = open_seconds
+        self.probe_in_flight = False
+        self.rejected = 0
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open" and time.monotonic() >= self.open_until:
+                self.state = "half_open"
+                self.probe_in_flight = False
+            if self.state == "half_open" and not self.probe_in_flight:
+                self.probe_in_flight = True
+                return True
+            self.rejected += 1
+            return False
+
+    def cancel_probe(self):
+        """The admitted call never reached the provider; let another caller probe."""
+        with self._lock:
+            self.probe_in_flight = False
+
+    def record_success(self):
+        with self._lock:
+            self.state = "closed"
+            self.failures = 0
+            self.probe_in_flight = False
+            self.last_open_seconds = self.open_seconds
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == "half_open":
+                # failed probe: back off further before the next one
+                self._open(min(self.last_open_seconds * 2, self.max_open_seconds))
+            elif self.failures >= self.failure_threshold:
+                self._open(self.open_seconds)
+
+    def trip(self, seconds: float):
+        """Open immediately, e.g. for a provider 429 with Retry-After."""
+        with self._lock:
+            self._open(min(max(seconds, 1.0), self.max_open_seconds))
+
+    def _open(self, seconds: float):
+        self.state = "open"
+        self.open_until = time.monotonic() + seconds
+        self.last_open_seconds = seconds
+        self.probe_in_flight = False
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "state": self.state,
+                "consecutive_failures": self.failures,
+                "open_for_seconds": max(0.0, round(self.open_until - time.monotonic(), 1)) if self.state == "open" else 0.0,
+                "rejected": self.rejected,
+            }
+
+
+limiter = RateLimiter(config.LLM_RPM, config.LLM_TPM, config.LLM_LANE_RESERVE, config.LLM_LANE_MAX_WAIT)
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def breaker_for(provider: str) -> CircuitBreaker:
+    with _breakers_lock:
+        b = _breakers.get(provider)
+        if b is None:
+            b = _breakers[provider] = CircuitBreaker(
+                config.LLM_BREAKER_FAILURES, config.LLM_BREAKER_OPEN_SECONDS, config.LLM_BREAKER_MAX_OPEN_SECONDS)
+        return b
+
+
+def limiter_stats() -> dict:
+    with _breakers_lock:
+        breakers = {p: b.stats() for p, b in _breakers.items()}
+    return {**limiter.stats(), "breakers": breakers}
+
+
+class _PreparedCall:
+    def __init__(self, cache_key=None, cached=None, url=None, headers=None, payload=None, lane="normal", tokens=0,
+                 prompt_tokens=0):
+        self.cache_key = cache_key
+        self.cached = cached
+        self.url = url
+        self.headers = headers
+        self.payload = payload
+        self.lane = lane
+        self.tokens = tokens
+        self.prompt_tokens = prompt_tokens
+        self.started = time.perf_counter()
+        self.provider = urlparse(url).netloc if url else None
+        self.breaker = breaker_for(self.provider) if url else None
+
+    @property
+    def limiter_key(self):
+        return (self.provider, self.payload["model"])
+
+
+def _prepare_call(prompt: str, system: str, temperature: float, max_tokens: int, priority: str = None):
+    """Shared front half of call_llm/acall_llm.
+
+    When the returned call has no url (cache hit, missing credentials) it must not touch the network;
+    `cached` then holds the reply, if any.
+    """
+    # Serve repeated prompts from the response cache. This runs before admission control
+    # so cached answers keep flowing (and cost no quota) while the provider is throttled.
+    cache_key = None
+    if config.LLM_CACHE_ENABLED:
+        cache_key = cache_key_for(config.LLM_MODEL, system, prompt, temperature)
+        cached = llm_cache.get(cache_key)
+        if cached is not None:
+            usage = _usage.get()
+            if usage is not None:
+                usage.cached += 1
+            return _PreparedCall(cache_key, cached)
 
-    # Global cooldown to avoid hammering provider after a hard rate-limit
-    if getattr(call_llm, '_cooldown_until', None):
-        if datetime.utcnow() < call_llm._cooldown_until:
-            logger.warning("LLM global cooldown active until %s, skipping call", call_llm._cooldown_until)
-            return None
+    url, headers = _build_headers_and_url()
 
     # If no auth header present, warn and fall back
     if 'Authorization' not in headers:
         logger.warning("No LLM authorization header found; falling back to local heuristics")
-        return None
+        return _PreparedCall(cache_key)
 
     payload = {
         "model": config.LLM_MODEL,
@@ -66,144 +413,234 @@ def call_llm(prompt: str, system: str = None, temperature: float = 0.0, max_toke
     if system:
         payload["messages"].append({"role": "system", "content": system})
     payload["messages"].append({"role": "user", "content": prompt})
+    lane = priority if priority in LANES else _lane.get()
+    prompt_tokens = estimate_tokens(prompt) + (estimate_tokens(system) if system else 0)
+    return _PreparedCall(cache_key, None, url, headers, payload, lane, prompt_tokens + max_tokens, prompt_tokens)
+
+
+def _admit(call: _PreparedCall) -> bool:
+    if not call.breaker.allow():
+        logger.warning("LLM circuit for %s is %s, skipping call", call.provider, call.breaker.state)
+        return False
+    if not limiter.acquire(call.limiter_key, call.tokens, call.lane):
+        call.breaker.cancel_probe()
+        logger.warning("LLM call shed in lane %s: no quota within %ss", call.lane, limiter.max_wait.get(call.lane))
+        return False
+    return True
+
+
+async def _admit_async(call: _PreparedCall) -> bool:
+    if not call.breaker.allow():
+        logger.warning("LLM circuit for %s is %s, skipping call", call.provider, call.breaker.state)
+        return False
+    if not await limiter.acquire_async(call.limiter_key, call.tokens, call.lane):
+        call.breaker.cancel_probe()
+        logger.warning("LLM call shed in lane %s: no quota within %ss", call.lane, limiter.max_wait.get(call.lane))
+        return False
+    return True
+
+
+def _retry_after_seconds(resp) -> int:
+    # Rate limit reached. Try to determine cooldown from Retry-After header or provider message.
+    retry_after = None
+    ra = resp.headers.get('Retry-After') if resp is not None else None
+    if ra:
+        try:
+            retry_after = int(ra)
+        except Exception:
+            retry_after = None
 
-    # Try with limited retries for transient 429s
+    if not retry_after:
+        # attempt to parse seconds from JSON body message
+        try:
+            body = resp.json()
+            # Example provider body: {"error": {"message": "Please wait 71085 seconds"}}
+            msg = ''
+            if isinstance(body, dict):
+                # search for nested messages
+                if 'error' in body and isinstance(body['error'], dict):
+                    msg = body['error'].get('message', '') or body['error'].get('details', '')
+                else:
+                    # try flatten
+                    msg = json.dumps(body)
+            if isinstance(msg, str) and msg:
+                m = re.search(r"(\d{3,6})\s*seconds", msg)
+                if m:
+                    retry_after = int(m.group(1))
+        except Exception:
+            retry_after = None
+
+    # If we still don't know, assume a long wait; the circuit breaker caps it and probes earlier
+    return retry_after or 3600
+
+
+def _handle_http_error(resp, call: _PreparedCall) -> bool:
+    """Log/act on an error response. Returns True when the request should be retried with model-name variants."""
+    status = resp.status_code
+    text = resp.text
+    url, headers = call.url, call.headers
+
+    # Handle rate limits (429) - parse Retry-After header or provider message
+    if status == 429:
+        retry_after = _retry_after_seconds(resp)
+        # open the provider circuit; once it expires a single half-open probe checks whether quota is back
+        call.breaker.trip(retry_after)
+        logger.error("LLM rate limit reached: status=429, opening circuit for %s for %ss (retry_after=%s)",
+                     call.provider, min(retry_after, call.breaker.max_open_seconds), retry_after)
+        return False
+
+    if status >= 500:
+        call.breaker.record_failure()
+        logger.error("LLM HTTP error %s: %s", status, text)
+        return False
+
+    # any other answer means the provider itself is reachable
+    call.breaker.record_success()
+
+    # Handle auth errors with helpful guidance
+    if status == 401:
+        token = headers.get('Authorization', '')
+        # token may look like 'Bearer github_p...'
+        if 'github_' in token and 'openai' in url:
+            logger.error("401 Unauthorized: looks like you're using a GitHub token against an OpenAI-style URL. Set GITHUB_MODELS_URL (for GitHub Models) or LLM_API_URL (for OpenAI) correctly. Response: %s", text)
+        elif token.startswith('Bearer sk-') and ('github' in url or 'models.github' in url or 'models.github.ai' in url):
+            logger.error("401 Unauthorized: looks like you're using an OpenAI key against a GitHub Models URL. Use the matching provider+url (set GITHUB_TOKEN for GitHub Models or LLM_API_KEY/OPENAI_API_KEY for OpenAI). Response: %s", text)
+        else:
+            logger.error("LLM call failed: 401 Unauthorized. Response: %s", text)
+        return False
+
+    # If model unknown (GitHub/OpenAI returns 404 with unknown_model), try alternate model names
+    if status == 404 and text and 'unknown_model' in text.lower():
+        logger.warning("Model unknown response from LLM provider: %s. Attempting model-name fallbacks.", text)
+        return True
+
+    logger.error("LLM HTTP error %s: %s", status, text)
+    return False
+
+
+def _model_variants(original_model) -> list:
+    variants = []
+    if isinstance(original_model, str):
+        # If model specified with provider prefix, try variants without/with openai/
+        if original_model.startswith('github/'):
+            name = original_model.split('/', 1)[1]
+            variants.append(name)
+            variants.append('openai/' + name)
+        elif original_model.startswith('openai/'):
+            name = original_model.split('/', 1)[1]
+            variants.append(original_model)
+            variants.append(name)
+        else:
+            variants.append(original_model)
+            variants.append('openai/' + original_model)
+            variants.append(original_model.replace('github/', ''))
+            variants.append('gpt-4o-mini')
+    tried = []
+    for m in variants:
+        if m and m not in tried:
+            tried.append(m)
+    return tried
+
+
+def _finish(resp, call: _PreparedCall):
+    call.breaker.record_success()
+    data = resp.json()
+    content = _extract_content(data)
+    _record_usage(call, data, content)
+    if call.cache_key and content:
+        llm_cache.put(call.cache_key, content, model=config.LLM_MODEL)
+    return content
+
+
+def call_llm(prompt: str, system: str = None, temperature: float = 0.0, max_tokens: int = 512, priority: str = None):
+    call = _prepare_call(prompt, system, temperature, max_tokens, priority)
+    if call.url is None:
+        return call.cached
+    if not _admit(call):
+        return None
+    call.started = time.perf_counter()
+    url, headers, payload = call.url, call.headers, call.payload
+
+    # Try with limited retries for transient network errors
     max_retries = 3
     backoff = 1.0
-    attempt = 0
-    while True:
-        attempt += 1
+    for attempt in range(1, max_retries + 1):
         try:
-            resp = requests.post(url, headers=headers, json=payload, timeout=config.LLM_TIMEOUT)
-            try:
-                resp.raise_for_status()
-            except requests.exceptions.HTTPError as he:
-                status = resp.status_code
-                text = resp.text
-            # Handle auth errors with helpful guidance
-            if status == 401:
-                token = headers.get('Authorization', '')
-                # token may look like 'Bearer github_p...'
-                if 'github_' in token and 'openai' in url:
-                    logger.error("401 Unauthorized: looks like you're using a GitHub token against an OpenAI-style URL. Set GITHUB_MODELS_URL (for GitHub Models) or LLM_API_URL (for OpenAI) correctly. Response: %s", text)
-                elif token.startswith('Bearer sk-') and ('github' in url or 'models.github' in url or 'models.github.ai' in url):
-                    logger.error("401 Unauthorized: looks like you're using an OpenAI key against a GitHub Models URL. Use the matching provider+url (set GITHUB_TOKEN for GitHub Models or LLM_API_KEY/OPENAI_API_KEY for OpenAI). Response: %s", text)
-                else:
-                    logger.error("LLM call failed: 401 Unauthorized. Response: %s", text)
+            resp = llm_client.post(url, headers, payload)
+        except httpx.HTTPError as e:
+            logger.exception("LLM call failed on attempt %s: %s", attempt, e)
+            if attempt >= max_retries:
+                call.breaker.record_failure()
                 return None
+            time.sleep(backoff)
+            backoff *= 2
+            continue
 
-            # Handle rate limits (429) - parse Retry-After header or provider message
-            if status == 429:
-                # Rate limit reached. Try to determine cooldown from Retry-After header or provider message.
-                retry_after = None
-                ra = resp.headers.get('Retry-After') if resp is not None else None
-                if ra:
-                    try:
-                        retry_after = int(ra)
-                    except Exception:
-                        retry_after = None
-
-                if not retry_after:
-                    # attempt to parse seconds from JSON body message
-                    try:
-                        body = resp.json()
-                        # Example provider body: {"error": {"message": "Please wait 71085 seconds"}}
-                        msg = ''
-                        if isinstance(body, dict):
-                            # search for nested messages
-                            if 'error' in body and isinstance(body['error'], dict):
-                                msg = body['error'].get('message', '') or body['error'].get('details', '')
-                            else:
-                                # try flatten
-                                msg = json.dumps(body)
-                        if isinstance(msg, str) and msg:
-                            import re
-                            m = re.search(r"(\d{3,6})\s*seconds", msg)
-                            if m:
-                                retry_after = int(m.group(1))
-                    except Exception:
-                        retry_after = None
-
-                # If we still don't know, default to a conservative cooldown (1 hour)
-                if not retry_after:
-                    retry_after = 3600
-
-                cooldown_until = datetime.utcnow() + timedelta(seconds=retry_after)
-                # attach cooldown to the call_llm function to avoid further calls until reset
-                call_llm._cooldown_until = cooldown_until
-                logger.error("LLM rate limit reached: status=429, setting global cooldown until %s (retry_after=%s)", cooldown_until, retry_after)
+        if resp.is_error:
+            if not _handle_http_error(resp, call):
                 return None
-
-            # If model unknown (GitHub/OpenAI returns 404 with unknown_model), try alternate model names
-            if status == 404 and text and 'unknown_model' in text.lower():
-                logger.warning("Model unknown response from LLM provider: %s. Attempting model-name fallbacks.", text)
-                # Try a few variations
-                tried = []
-                original_model = payload.get('model')
-                variants = []
-                if isinstance(original_model, str):
-                    # If model specified with provider prefix, try variants without/with openai/
-                    if original_model.startswith('github/'):
-                        name = original_model.split('/', 1)[1]
-                        variants.append(name)
-                        variants.append('openai/' + name)
-                    elif original_model.startswith('openai/'):
-                        name = original_model.split('/', 1)[1]
-                        variants.append(original_model)
-                        variants.append(name)
-                    else:
-                        variants.append(original_model)
-                        variants.append('openai/' + original_model)
-                        variants.append(original_model.replace('github/', ''))
-                        variants.append('gpt-4o-mini')
-
-                for m in variants:
-                    if not m or m in tried:
-                        continue
-                    tried.append(m)
-                    payload['model'] = m
-                    logger.info("Retrying LLM request with model variant: %s", m)
-                    try:
-                        r2 = requests.post(url, headers=headers, json=payload, timeout=config.LLM_TIMEOUT)
-                        r2.raise_for_status()
-                        data = r2.json()
-                        # success on retry
-                        resp = r2
-                        break
-                    except requests.exceptions.RequestException:
-                        logger.warning("Variant %s failed", m)
-                        continue
-                else:
-                    logger.error("All model variants failed; please set LLM_MODEL to a valid model name for your provider.")
-                    return None
+            for m in _model_variants(payload.get('model')):
+                payload['model'] = m
+                logger.info("Retrying LLM request with model variant: %s", m)
+                try:
+                    r2 = llm_client.post(url, headers, payload)
+                except httpx.HTTPError:
+                    r2 = None
+                if r2 is not None and not r2.is_error:
+                    # success on retry
+                    resp = r2
+                    break
+                logger.warning("Variant %s failed", m)
             else:
-                logger.error("LLM HTTP error %s: %s", status, text)
+                logger.error("All model variants failed; please set LLM_MODEL to a valid model name for your provider.")
                 return None
-        except requests.exceptions.RequestException as e:
-            # If it's a rate limit (requests may surface 429 as HTTPError above), handle here as well
+        return _finish(resp, call)
+    return None
+
+
+async def acall_llm(prompt: str, system: str = None, temperature: float = 0.0, max_tokens: int = 512, priority: str = None):
+    """asyncio counterpart of call_llm, sharing its cache, admission control and connection pool."""
+    call = _prepare_call(prompt, system, temperature, max_tokens, priority)
+    if call.url is None:
+        return call.cached
+    if not await _admit_async(call):
+        return None
+    call.started = time.perf_counter()
+    url, headers, payload = call.url, call.headers, call.payload
+
+    max_retries = 3
+    backoff = 1.0
+    for attempt in range(1, max_retries + 1):
+        try:
+            resp = await llm_client.apost(url, headers, payload)
+        except httpx.HTTPError as e:
             logger.exception("LLM call failed on attempt %s: %s", attempt, e)
             if attempt >= max_retries:
+                call.breaker.record_failure()
                 return None
-            time.sleep(backoff)
+            await asyncio.sleep(backoff)
             backoff *= 2
             continue
 
-        data = resp.json()
-        # OpenAI/GitHub-compatible response path: prefer choices[0].message.content
-        if isinstance(data, dict) and 'choices' in data and len(data['choices']) > 0:
-            choice = data['choices'][0]
-            # OpenAI shape
-            if isinstance(choice, dict) and 'message' in choice and 'content' in choice['message']:
-                return choice['message']['content']
-            # GitHub might nest differently; try to find 'content'
-            if isinstance(choice, dict) and 'content' in choice:
-                return choice['content']
-        # If provider returns text directly
-        if isinstance(data, dict) and 'text' in data:
-            return data['text']
-        # Last resort: return full JSON string
-        return json.dumps(data)
-    # end while loop
+        if resp.is_error:
+            if not _handle_http_error(resp, call):
+                return None
+            for m in _model_variants(payload.get('model')):
+                payload['model'] = m
+                logger.info("Retrying LLM request with model variant: %s", m)
+                try:
+                    r2 = await llm_client.apost(url, headers, payload)
+                except httpx.HTTPError:
+                    r2 = None
+                if r2 is not None and not r2.is_error:
+                    resp = r2
+                    break
+                logger.warning("Variant %s failed", m)
+            else:
+                logger.error("All model variants failed; please set LLM_MODEL to a valid model name for your provider.")
+                return None
+        return _finish(resp, call)
+    return None
 
 
 def classify_complaint(text: str):
@@ -213,44 +650,19 @@ def classify_complaint(text: str):
         " [\"Billing Issue\", \"Product Defect\", \"Refund Request\", \"Technical Issue\","
         " \"Delivery Problem\", \"Service Quality\", \"Others\"].\n"
         "Return only a JSON object exactly like: {\"categories\": [..], \"confidence\": 0.0}"
-        "\nComplaint:\n" + text
+        "\nComplaint:\n" + fit_text(text)
     )
-    resp = call_llm(prompt)
+    resp = call_llm(prompt, max_tokens=config.LLM_MAX_TOKENS["classify"])
     if not resp:
         # fallback heuristic: keyword based
-        categories = []
-        low = text.lower()
-        if any(w in low for w in ["bill", "invoice", "charge"]):
-            categories.append("Billing Issue")
-        # detect product defects including phrases like 'stopped working'
-        if any(w in low for w in ["broken", "defect", "not working", "malfunction", "stopped working", "stopped"]):
-            categories.append("Product Defect")
-        if any(w in low for w in ["refund", "money back"]):
-            categories.append("Refund Request")
-        if any(w in low for w in ["error", "bug", "crash", "unable to", "fail"]):
-            categories.append("Technical Issue")
-        if any(w in low for w in ["deliver", "shipment", "late", "missing"]):
-            categories.append("Delivery Problem")
-        if any(w in low for w in ["rude", "bad service", "support", "experience"]):
-            categories.append("Service Quality")
-        if not categories:
-            categories = ["Others"]
-        return {"categories": categories, "confidence": 0.5}
+        return heuristic_classify(text)
 
     # try parse JSON out of resp
-    try:
-        obj = json.loads(resp)
-        return obj
-    except Exception:
-        # try to extract JSON substring
-        try:
-            start = resp.index("{")
-            end = resp.rindex("}")
-            obj = json.loads(resp[start:end+1])
-            return obj
-        except Exception:
-            logger.exception("Failed to parse LLM classification response")
-            return {"categories": ["Others"], "confidence": 0.0}
+    obj = parse_json_response(resp)
+    if obj is None:
+        logger.error("Failed to parse LLM classification response")
+        return {"categories": ["Others"], "confidence": 0.0}
+    return obj
 
 
 def severity_and_routing(text: str, categories: list[str], sentiment: str = None, keywords: list[str] = None):
@@ -259,75 +671,270 @@ def severity_and_routing(text: str, categories: list[str], sentiment: str = None
         "Based on this complaint text, assign a severity level (Low, Medium, High, Urgent)"
         " and choose the best routing department from the mapping. Return JSON like:"
         " {\"severity\": \"High\", \"routed_department\": \"Logistics\", \"justification\": \"...\"}\n"
-        "Complaint:\n" + text + "\nCategories:" + ",".join(categories)
+        "Complaint:\n" + fit_text(text) + "\nCategories:" + ",".join(categories)
     )
     if sentiment:
         prompt += "\nDetected sentiment:" + sentiment
     if keywords:
         prompt += "\nDetected keywords:" + ",".join(keywords)
 
-    resp = call_llm(prompt)
+    resp = call_llm(prompt, max_tokens=config.LLM_MAX_TOKENS["routing"])
     if not resp:
         # fallback based on keywords and sentiment rules (deterministic)
-        low = text.lower()
-        severity = "Low"
-
-        # If explicit urgent words appear, immediately escalate to Urgent
-        urgent_terms = ['urgent', 'asap', 'immediately', 'need it urgently']
-        text_has_urgent = any(t in low for t in urgent_terms)
-        keywords_l = [k.lower() for k in (keywords or [])]
-        keywords_has_urgent = any(t in keywords_l for t in urgent_terms)
-        if text_has_urgent or keywords_has_urgent:
-            severity = 'Urgent'
-
-        # Use sentiment as a secondary signal
-        if severity != 'Urgent':
-            if sentiment == 'Negative':
-                severity = 'High'
-            elif sentiment == 'Neutral':
-                severity = 'Medium'
-            elif sentiment == 'Positive':
-                severity = 'Low'
-
-        # Heuristics for categories and critical phrases
-        # Product defects that indicate failure are high priority; if customer explicitly asks urgency, escalate to Urgent
-        defect_indicators = ["not working", "stopped working", "stopped", "broken", "malfunction", "won't spin", "won't start"]
-        billing_indicators = ['refund', 'charged', 'overcharged', 'double charge', 'fraud']
-
-        if any(d in low for d in defect_indicators) or any(d in keywords_l for d in defect_indicators):
-            # If already marked Urgent, keep it; otherwise escalate to High
-            severity = severity if severity == 'Urgent' else max_severity(severity, 'High')
-
-        if any(b in low for b in billing_indicators) or any(b in keywords_l for b in billing_indicators):
-            severity = severity if severity == 'Urgent' else max_severity(severity, 'High')
-
-        # Late delivery is medium priority unless urgent requested
-        if any(w in low for w in ["late", "delay", "missing", "not here"]):
-            severity = severity if severity == 'Urgent' else max_severity(severity, 'Medium')
-
-        # Safety-critical words
-        if any(w in low for w in ["life-threatening", "danger", "hazard"]):
-            severity = 'Urgent'
+        return heuristic_severity_and_routing(text, categories, sentiment=sentiment, keywords=keywords)
 
+    obj = parse_json_response(resp)
+    if obj is None:
+        logger.error("Failed to parse LLM routing response")
         department = config.DEPARTMENT_MAP.get(categories[0], "General Support") if categories else "General Support"
-        justification = "Fallback heuristic: urgency and category rules"
-        return {"severity": severity, "routed_department": department, "justification": justification}
-
-    try:
-        obj = json.loads(resp)
-        return obj
-    except Exception:
-        try:
-            start = resp.index("{")
-            end = resp.rindex("}")
-            obj = json.loads(resp[start:end+1])
-            return obj
-        except Exception:
-            logger.exception("Failed to parse LLM routing response")
-            department = config.DEPARTMENT_MAP.get(categories[0], "General Support") if categories else "General Support"
-            return {"severity": "Medium", "routed_department": department, "justification": "Parsing fallback"}
+        return {"severity": "Medium", "routed_department": department, "justification": "Parsing fallback"}
+    return obj
 
 
 def max_severity(current: str, candidate: str) -> str:
     order = {"Low": 1, "Medium": 2, "High": 3, "Urgent": 4}
     return current if order.get(current, 0) >= order.get(candidate, 0) else candidate
+
+
+CATEGORIES = ["Billing Issue", "Product Defect", "Refund Request", "Technical Issue",
+              "Delivery Problem", "Service Quality", "Others"]
+SEVERITIES = ["Low", "Medium", "High", "Urgent"]
+SENTIMENTS = ["Positive", "Neutral", "Negative"]
+URGENT_TERMS = ['urgent', 'asap', 'immediately', 'need it urgently']
+SAFETY_TERMS = ["life-threatening", "danger", "hazard"]
+
+# Heuristic rule terms, matched as case-insensitive substrings. Category rules are listed in the
+# order categories are reported.
+CATEGORY_TERMS = {
+    "Billing Issue": ["bill", "invoice", "charge"],
+    # detect product defects including phrases like 'stopped working'
+    "Product Defect": ["broken", "defect", "not working", "malfunction", "stopped working", "stopped"],
+    "Refund Request": ["refund", "money back"],
+    "Technical Issue": ["error", "bug", "crash", "unable to", "fail"],
+    "Delivery Problem": ["deliver", "shipment", "late", "missing"],
+    "Service Quality": ["rude", "bad service", "support", "experience"],
+}
+SEVERITY_TERMS = {
+    "urgent": URGENT_TERMS,
+    "defect": ["not working", "stopped working", "stopped", "broken", "malfunction", "won't spin", "won't start"],
+    "billing": ['refund', 'charged', 'overcharged', 'double charge', 'fraud'],
+    "delay": ["late", "delay", "missing", "not here"],
+    "safety": SAFETY_TERMS,
+}
+
+# Compiled once at import; every heuristic check is answered from a single match of the text
+RULES = RuleSet({
+    **{"category:" + c: terms for c, terms in CATEGORY_TERMS.items()},
+    **SEVERITY_TERMS,
+})
+
+
+def looks_urgent(text: str) -> bool:
+    """Cheap pre-triage check used to put a ticket's LLM calls in the urgent priority lane."""
+    labels = RULES.match(text).labels
+    return 'urgent' in labels or 'safety' in labels
+
+
+def parse_json_response(resp: str):
+    """Parse a JSON object out of an LLM reply, tolerating surrounding prose. Returns None on failure."""
+    try:
+        return json.loads(resp)
+    except Exception:
+        pass
+    # try to extract JSON substring
+    try:
+        start = resp.index("{")
+        end = resp.rindex("}")
+        return json.loads(resp[start:end+1])
+    except Exception:
+        return None
+
+
+def heuristic_classify(text: str, match: RuleMatch = None):
+    match = match or RULES.match(text)
+    categories = [c for c in CATEGORY_TERMS if match.has("category:" + c)]
+    if not categories:
+        categories = ["Others"]
+    # rule -> term that triggered it, for explainability (full spans: RULES.match(text).explain())
+    matched = {c: match.triggers["category:" + c] for c in categories if match.has("category:" + c)}
+    return {"categories": categories, "confidence": 0.5, "matched": matched}
+
+
+def heuristic_severity_and_routing(text: str, categories: list[str], sentiment: str = None, keywords: list[str] = None,
+                                   match: RuleMatch = None):
+    match = match or RULES.match(text)
+    keyword_labels = RULES.match_keywords(keywords)
+    severity = "Low"
+
+    # If explicit urgent words appear, immediately escalate to Urgent
+    if match.has('urgent') or 'urgent' in keyword_labels:
+        severity = 'Urgent'
+
+    # Use sentiment as a secondary signal
+    if severity != 'Urgent':
+        if sentiment == 'Negative':
+            severity = 'High'
+        elif sentiment == 'Neutral':
+            severity = 'Medium'
+        elif sentiment == 'Positive':
+            severity = 'Low'
+
+    # Heuristics for categories and critical phrases
+    # Product defects that indicate failure are high priority; if customer explicitly asks urgency, escalate to Urgent
+    if match.has('defect') or 'defect' in keyword_labels:
+        # If already marked Urgent, keep it; otherwise escalate to High
+        severity = severity if severity == 'Urgent' else max_severity(severity, 'High')
+
+    if match.has('billing') or 'billing' in keyword_labels:
+        severity = severity if severity == 'Urgent' else max_severity(severity, 'High')
+
+    # Late delivery is medium priority unless urgent requested
+    if match.has('delay'):
+        severity = severity if severity == 'Urgent' else max_severity(severity, 'Medium')
+
+    # Safety-critical words
+    if match.has('safety'):
+        severity = 'Urgent'
+
+    department = config.DEPARTMENT_MAP.get(categories[0], "General Support") if categories else "General Support"
+    justification = "Fallback heuristic: urgency and category rules"
+    matched = {label: match.triggers[label] for label in SEVERITY_TERMS if match.has(label)}
+    matched.update({label: 'keyword' for label in keyword_labels if label not in matched})
+    return {"severity": severity, "routed_department": department, "justification": justification, "matched": matched}
+
+
+def validate_triage(obj) -> dict:
+    """Return only the fields of a fused triage reply that match the expected schema.
+
+    Invalid or missing fields are dropped so the caller can fall back per field.
+    """
+    valid = {}
+    if not isinstance(obj, dict):
+        return valid
+
+    cats = obj.get('categories')
+    if isinstance(cats, str):
+        cats = [cats]
+    if isinstance(cats, list):
+        cats = [c for c in cats if isinstance(c, str) and c in CATEGORIES]
+        if cats:
+            valid['categories'] = cats
+
+    conf = obj.get('confidence')
+    if isinstance(conf, (int, float)) and not isinstance(conf, bool) and 0.0 <= conf <= 1.0:
+        valid['confidence'] = float(conf)
+
+    sent = obj.get('sentiment')
+    if isinstance(sent, str) and sent.strip().capitalize() in SENTIMENTS:
+        valid['sentiment'] = sent.strip().capitalize()
+
+    sev = obj.get('severity')
+    if isinstance(sev, str) and sev.strip().capitalize() in SEVERITIES:
+        valid['severity'] = sev.strip().capitalize()
+
+    dept = obj.get('routed_department') or obj.get('department')
+    if isinstance(dept, str) and dept in config.DEPARTMENT_MAP.values():
+        valid['routed_department'] = dept
+
+    just = obj.get('justification')
+    if isinstance(just, str) and just.strip():
+        valid['justification'] = just.strip()
+    return valid
+
+
+def triage_complaint(text: str, keywords: list[str] = None):
+    """Classify, score sentiment, assign severity and route a complaint with a single LLM call.
+
+    Fields missing from (or invalid in) the LLM reply fall back to the local heuristics one by one;
+    their names are listed under "fallback_fields" in the result.
+    """
+    prompt = (
+        "You are a customer complaint triage AI. For the complaint below:\n"
+        "- classify it into one or more categories from the list: " + json.dumps(CATEGORIES) + "\n"
+        "- detect its sentiment as one of: " + json.dumps(SENTIMENTS) + "\n"
+        "- assign a severity level from: " + json.dumps(SEVERITIES) + "\n"
+        "- choose the best routing department from this category->department mapping: " + json.dumps(config.DEPARTMENT_MAP) + "\n"
+        "Return only a JSON object exactly like: {\"categories\": [..], \"confidence\": 0.0, \"sentiment\": \"Negative\","
+        " \"severity\": \"High\", \"routed_department\": \"Logistics\", \"justification\": \"...\"}"
+        "\nComplaint:\n" + fit_text(text)
+    )
+    if keywords:
+        prompt += "\nDetected keywords:" + ",".join(keywords)
+
+    resp = call_llm(prompt, max_tokens=config.LLM_MAX_TOKENS["triage"])
+    obj = parse_json_response(resp) if resp else None
+    if resp and obj is None:
+        logger.error("Failed to parse LLM triage response")
+    return complete_triage(text, validate_triage(obj), keywords)
+
+
+def complete_triage(text: str, result: dict, keywords: list[str] = None):
+    """Fill the fields missing from a validated triage result with the local heuristics."""
+    fallback_fields = []
+    # one rule match serves both heuristic fallbacks
+    needs_rules = 'categories' not in result or 'severity' not in result or 'routed_department' not in result
+    match = RULES.match(text) if needs_rules else None
+
+    if 'categories' not in result:
+        h = heuristic_classify(text, match)
+        result['categories'] = h['categories']
+        result.setdefault('confidence', h['confidence'])
+        fallback_fields.append('categories')
+    if 'confidence' not in result:
+        result['confidence'] = 0.5
+        fallback_fields.append('confidence')
+
+    if 'sentiment' not in result:
+        from .sentiment_analyzer import local_sentiment
+        result['sentiment'] = local_sentiment(text)
+        fallback_fields.append('sentiment')
+
+    if 'severity' not in result or 'routed_department' not in result:
+        h = heuristic_severity_and_routing(text, result['categories'], sentiment=result['sentiment'], keywords=keywords, match=match)
+        for field in ('severity', 'routed_department'):
+            if field not in result:
+                result[field] = h[field]
+                fallback_fields.append(field)
+        result.setdefault('justification', h['justification'])
+    result.setdefault('justification', '')
+
+    result['fallback_fields'] = fallback_fields
+    return result
+
+
+def batch_triage(items: list[dict]):
+    """Triage several complaints with one LLM call.
+
+    `items` are dicts with "id", "text" and optionally "keywords". Returns {id: result} with the same
+    shape as triage_complaint; items the reply leaves out or gets wrong fall back per field.
+    """
+    if not items:
+        return {}
+    payload = [{"id": it["id"], "complaint": fit_text(it["text"])} for it in items]
+    prompt = (
+        "You are a customer complaint triage AI. For EACH complaint in the JSON array below:\n"
+        "- classify it into one or more categories from the list: " + json.dumps(CATEGORIES) + "\n"
+        "- detect its sentiment as one of: " + json.dumps(SENTIMENTS) + "\n"
+        "- assign a severity level from: " + json.dumps(SEVERITIES) + "\n"
+        "- choose the best routing department from this category->department mapping: " + json.dumps(config.DEPARTMENT_MAP) + "\n"
+        "Return only a JSON object exactly like: {\"results\": [{\"id\": 1, \"categories\": [..], \"confidence\": 0.0,"
+        " \"sentiment\": \"Negative\", \"severity\": \"High\", \"routed_department\": \"Logistics\", \"justification\": \"...\"}]}"
+        " with one entry per complaint, echoing its id.\nComplaints:\n" + json.dumps(payload, ensure_ascii=False)
+    )
+    resp = call_llm(prompt, max_tokens=min(4096, config.LLM_MAX_TOKENS["batch_item"] * len(items)))
+    obj = parse_json_response(resp) if resp else None
+    if resp and obj is None:
+        logger.error("Failed to parse LLM batch triage response")
+
+    by_id = {}
+    rows = obj.get('results') if isinstance(obj, dict) else None
+    if isinstance(rows, list):
+        for row in rows:
+            if isinstance(row, dict) and 'id' in row:
+                by_id[str(row['id'])] = row
+
+    out = {}
+    for it in items:
+        valid = validate_triage(by_id.get(str(it["id"])))
+        out[it["id"]] = complete_triage(it["text"], valid, it.get("keywords"))
+    return out
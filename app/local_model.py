@@ -0,0 +1,372 @@
+"""Local classifier tier: hashed TF-IDF features + one-vs-rest logistic regression.
+
+Trained from the llm_classification / llm_routing labels already stored in the complaints table and
+saved as JSON, it lets process_and_route triage a ticket without calling the LLM when it is confident.
+
+    python -m app.local_model train [--db PATH] [--out PATH] [--holdout 0.2] [--include-heuristic]
+    python -m app.local_model stats [--db PATH] [--days N]   # local vs LLM triage from the stored complaints
+"""
+import argparse
+import json
+import logging
+import math
+import os
+import random
+import re
+import sqlite3
+import threading
+import zlib
+from collections import Counter
+from datetime import datetime
+from . import config
+from .llm_utils import CATEGORIES, SEVERITIES
+
+logger = logging.getLogger(__name__)
+
+N_FEATURES = 2 ** 18
+_WORD_RE = re.compile(r"[a-z0-9']{2,}")
+
+
+def features(text: str, n_features: int = N_FEATURES) -> dict:
+    """Signed hashed unigram+bigram counts with sublinear tf: {bucket: weight}."""
+    words = _WORD_RE.findall((text or "").lower())
+    grams = words + [a + " " + b for a, b in zip(words, words[1:])]
+    counts = Counter()
+    for g in grams:
+        h = zlib.crc32(g.encode("utf-8"))
+        counts[(h % n_features, 1.0 if h & 0x80000000 else -1.0)] += 1
+    vec = {}
+    for (idx, sign), c in counts.items():
+        vec[idx] = vec.get(idx, 0.0) + sign * (1.0 + math.log(c))
+    return vec
+
+
+def _sigmoid(z: float) -> float:
+    if z >= 0:
+        return 1.0 / (1.0 + math.exp(-z))
+    e = math.exp(z)
+    return e / (1.0 + e)
+
+
+class LocalModel:
+    def __init__(self, idf: dict, category_weights: dict, severity_weights: dict, meta: dict = None,
+                 n_features: int = N_FEATURES, default_idf: float = 1.0):
+        self.idf = idf
+        self.default_idf = default_idf
+        self.category_weights = category_weights  # label -> (bias, {bucket: w})
+        self.severity_weights = severity_weights
+        self.meta = meta or {}
+        self.n_features = n_features
+
+    def vectorize(self, text: str) -> dict:
+        vec = features(text, self.n_features)
+        for k in vec:
+            vec[k] *= self.idf.get(k, self.default_idf)
+        norm = math.sqrt(sum(v * v for v in vec.values())) or 1.0
+        return {k: v / norm for k, v in vec.items()}
+
+    @staticmethod
+    def _scores(weights: dict, vec: dict) -> dict:
+        out = {}
+        for label, (bias, w) in weights.items():
+            z = bias
+            for k, v in vec.items():
+                wk = w.get(k)
+                if wk is not None:
+                    z += wk * v
+            out[label] = _sigmoid(z)
+        return out
+
+    def predict(self, text: str) -> dict:
+        vec = self.vectorize(text)
+        cat_p = self._scores(self.category_weights, vec)
+        categories = [c for c in CATEGORIES if cat_p.get(c, 0.0) >= 0.5]
+        if not categories and cat_p:
+            categories = [max(cat_p, key=cat_p.get)]
+        # every per-category yes/no decision has to be confident
+        cat_conf = min((max(p, 1.0 - p) for p in cat_p.values()), default=0.0)
+
+        sev_p = self._scores(self.severity_weights, vec)
+        severity = max(sev_p, key=sev_p.get) if sev_p else None
+        total = sum(sev_p.values())
+        sev_conf = sev_p[severity] / total if severity and total else 0.0
+        return {
+            "categories": categories,
+            "severity": severity,
+            "category_confidence": round(cat_conf, 4),
+            "severity_confidence": round(sev_conf, 4),
+            "confidence": round(min(cat_conf, sev_conf), 4),
+        }
+
+    def to_json(self) -> dict:
+        def pack(weights):
+            return {label: {"bias": b, "w": {str(k): round(v, 6) for k, v in w.items()}} for label, (b, w) in weights.items()}
+        return {
+            "version": 1,
+            "n_features": self.n_features,
+            "default_idf": self.default_idf,
+            "idf": {str(k): round(v, 6) for k, v in self.idf.items()},
+            "categories": pack(self.category_weights),
+            "severity": pack(self.severity_weights),
+            "meta": self.meta,
+        }
+
+    @classmethod
+    def from_json(cls, data: dict):
+        def unpack(packed):
+            return {label: (d["bias"], {int(k): v for k, v in d["w"].items()}) for label, d in packed.items()}
+        return cls(
+            idf={int(k): v for k, v in data["idf"].items()},
+            category_weights=unpack(data["categories"]),
+            severity_weights=unpack(data["severity"]),
+            meta=data.get("meta", {}),
+            n_features=data.get("n_features", N_FEATURES),
+            default_idf=data.get("default_idf", 1.0),
+        )
+
+    def save(self, path: str):
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.to_json(), f)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: str):
+        with open(path, encoding="utf-8") as f:
+            return cls.from_json(json.load(f))
+
+
+# --- training -------------------------------------------------------------------------------------
+
+def _train_binary(xs: list, ys: list, epochs: int, lr: float, l2: float, seed: int):
+    """Logistic regression by SGD over sparse dict vectors. Returns (bias, weights)."""
+    rng = random.Random(seed)
+    w = {}
+    b = 0.0
+    pos = sum(ys)
+    # balance classes so rare categories are not drowned out
+    pos_weight = (len(ys) - pos) / pos if pos else 1.0
+    idx = list(range(len(xs)))
+    for epoch in range(epochs):
+        rng.shuffle(idx)
+        rate = lr / (1.0 + epoch)
+        for i in idx:
+            x, y = xs[i], ys[i]
+            z = b + sum(w.get(k, 0.0) * v for k, v in x.items())
+            g = (_sigmoid(z) - y) * (pos_weight if y else 1.0)
+            b -= rate * g
+            for k, v in x.items():
+                w[k] = w.get(k, 0.0) * (1.0 - rate * l2) - rate * g * v
+    return b, {k: v for k, v in w.items() if abs(v) > 1e-6}
+
+
+def train(texts: list, categories: list, severities: list, epochs: int = 8, lr: float = 0.5, l2: float = 1e-4,
+          seed: int = 13) -> LocalModel:
+    raw = [features(t) for t in texts]
+    df = Counter()
+    for vec in raw:
+        df.update(vec.keys())
+    n = len(raw)
+    idf = {k: math.log((1 + n) / (1 + c)) + 1.0 for k, c in df.items()}
+    model = LocalModel(idf, {}, {}, default_idf=math.log(1 + n) + 1.0)
+    xs = [model.vectorize(t) for t in texts]
+
+    for label in CATEGORIES:
+        ys = [1 if label in cats else 0 for cats in categories]
+        if 0 < sum(ys):
+            model.category_weights[label] = _train_binary(xs, ys, epochs, lr, l2, seed)
+    for label in SEVERITIES:
+        ys = [1 if s == label else 0 for s in severities]
+        if 0 < sum(ys):
+            model.severity_weights[label] = _train_binary(xs, ys, epochs, lr, l2, seed)
+    return model
+
+
+def is_llm_label(cls: dict, routing: dict) -> bool:
+    """True when both stored blobs came from the LLM rather than the heuristic fallbacks."""
+    if not isinstance(cls, dict) or not isinstance(routing, dict):
+        return False
+    if cls.get("source") == "local_model" or routing.get("source") == "local_model":
+        return False
+    fallback = set(routing.get("fallback_fields") or [])
+    if fallback & {"categories", "severity"}:
+        return False
+    if "matched" in cls or "matched" in routing:
+        return False
+    just = str(routing.get("justification") or "")
+    return not (just.startswith("Fallback heuristic") or just.startswith("Parsing fallback"))
+
+
+def load_training_rows(db_path: str, include_heuristic: bool = False):
+    """Yield (text, categories, severity) for labelled complaints, streaming from a read-only connection."""
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    try:
+        cur = conn.execute(
+            "SELECT description, llm_classification, llm_routing FROM complaints "
+            "WHERE llm_classification IS NOT NULL AND llm_routing IS NOT NULL ORDER BY id"
+        )
+        while True:
+            rows = cur.fetchmany(500)
+            if not rows:
+                break
+            for text, cls_raw, routing_raw in rows:
+                try:
+                    cls = json.loads(cls_raw)
+                    routing = json.loads(routing_raw)
+                except (TypeError, ValueError):
+                    continue
+                if not include_heuristic and not is_llm_label(cls, routing):
+                    continue
+                cats = [c for c in (cls.get("categories") or []) if c in CATEGORIES] if isinstance(cls, dict) else []
+                sev = routing.get("severity") if isinstance(routing, dict) else None
+                if text and cats and sev in SEVERITIES:
+                    yield text, cats, sev
+    finally:
+        conn.close()
+
+
+def evaluate(model: LocalModel, rows: list, threshold: float) -> dict:
+    """Agreement of the local model with the stored (LLM) labels, overall and above `threshold`."""
+    n = confident = cat_ok = sev_ok = conf_cat_ok = conf_sev_ok = 0
+    for text, cats, sev in rows:
+        p = model.predict(text)
+        n += 1
+        c_ok = set(p["categories"]) == set(cats)
+        s_ok = p["severity"] == sev
+        cat_ok += c_ok
+        sev_ok += s_ok
+        if p["confidence"] >= threshold:
+            confident += 1
+            conf_cat_ok += c_ok
+            conf_sev_ok += s_ok
+    return {
+        "rows": n,
+        "category_agreement": round(cat_ok / n, 4) if n else None,
+        "severity_agreement": round(sev_ok / n, 4) if n else None,
+        "threshold": threshold,
+        "coverage": round(confident / n, 4) if n else None,
+        "confident_category_agreement": round(conf_cat_ok / confident, 4) if confident else None,
+        "confident_severity_agreement": round(conf_sev_ok / confident, 4) if confident else None,
+    }
+
+
+# --- runtime --------------------------------------------------------------------------------------
+
+_lock = threading.Lock()
+_model = None
+_model_mtime = None
+stats = {"predictions": 0, "local": 0, "escalated": 0, "compared": 0, "category_agree": 0, "severity_agree": 0}
+
+
+def get_model():
+    """The model at LOCAL_MODEL_PATH, reloaded when the file changes; None when disabled or not trained."""
+    global _model, _model_mtime
+    if not config.LOCAL_MODEL_ENABLED:
+        return None
+    path = config.LOCAL_MODEL_PATH
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return None
+    with _lock:
+        if _model is None or mtime != _model_mtime:
+            try:
+                _model = LocalModel.load(path)
+                _model_mtime = mtime
+                logger.info("Loaded local classifier from %s", path)
+            except Exception:
+                logger.exception("Failed to load local classifier from %s", path)
+                _model = None
+        return _model
+
+
+def record(prediction: dict, used_locally: bool, final_categories: list = None, final_severity: str = None):
+    """Count local decisions and, for escalated tickets, whether the LLM agreed with the local guess."""
+    with _lock:
+        stats["predictions"] += 1
+        if used_locally:
+            stats["local"] += 1
+            return
+        stats["escalated"] += 1
+        if final_categories is not None and final_severity is not None:
+            stats["compared"] += 1
+            stats["category_agree"] += set(prediction["categories"]) == set(final_categories)
+            stats["severity_agree"] += prediction["severity"] == final_severity
+
+
+def runtime_stats() -> dict:
+    model = get_model()
+    with _lock:
+        s = dict(stats)
+    s["local_rate"] = round(s["local"] / s["predictions"], 4) if s["predictions"] else None
+    s["category_agreement"] = round(s["category_agree"] / s["compared"], 4) if s["compared"] else None
+    s["severity_agreement"] = round(s["severity_agree"] / s["compared"], 4) if s["compared"] else None
+    s["threshold"] = config.LOCAL_MODEL_THRESHOLD
+    s["model"] = model.meta if model else None
+    return s
+
+
+def stored_stats(db_path: str, days: int = None) -> dict:
+    """How many stored (original) complaints were triaged locally vs by the LLM or its heuristic fallback.
+
+    Agreement on escalated tickets is only known to the running service: GET /admin/local_model.
+    """
+    where = "llm_classification IS NOT NULL AND duplicate_of IS NULL"
+    params = []
+    if days:
+        where += " AND created_at >= datetime('now', ?)"
+        params.append(f"-{int(days)} days")
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    try:
+        triaged, local = conn.execute(
+            "SELECT count(*), coalesce(sum(CASE WHEN json_valid(llm_classification) "
+            "THEN json_extract(llm_classification, '$.source') = 'local_model' END), 0) "
+            f"FROM complaints WHERE {where}", params).fetchone()
+    finally:
+        conn.close()
+    return {"triaged": triaged, "local": local, "escalated_or_llm": triaged - local,
+            "local_rate": round(local / triaged, 4) if triaged else None, "days": days}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Train or inspect the local complaint classifier")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    t = sub.add_parser("train")
+    t.add_argument("--db", default=config.DB_PATH.replace("sqlite:///", ""))
+    t.add_argument("--out", default=config.LOCAL_MODEL_PATH)
+    t.add_argument("--holdout", type=float, default=0.2, help="fraction of rows held out to report agreement")
+    t.add_argument("--epochs", type=int, default=8)
+    t.add_argument("--include-heuristic", action="store_true", help="also learn from heuristic-fallback labels")
+    st = sub.add_parser("stats", help="local vs LLM triage of stored complaints (live counters: GET /admin/local_model)")
+    st.add_argument("--db", default=config.DB_PATH.replace("sqlite:///", ""))
+    st.add_argument("--days", type=int, default=None, help="only complaints created in the last N days")
+    args = parser.parse_args(argv)
+
+    if args.cmd == "stats":
+        print(json.dumps(stored_stats(args.db, args.days), indent=2))
+        return 0
+
+    rows = list(load_training_rows(args.db, args.include_heuristic))
+    if len(rows) < 10:
+        print(f"only {len(rows)} labelled rows in {args.db}; need at least 10 (try --include-heuristic)")
+        return 1
+    random.Random(7).shuffle(rows)
+    n_hold = int(len(rows) * args.holdout)
+    held, train_rows = rows[:n_hold], rows[n_hold:]
+    model = train([r[0] for r in train_rows], [r[1] for r in train_rows], [r[2] for r in train_rows], epochs=args.epochs)
+    report = evaluate(model, held, config.LOCAL_MODEL_THRESHOLD) if held else None
+    model.meta = {
+        "trained_at": datetime.utcnow().isoformat(),
+        "train_rows": len(train_rows),
+        "holdout": report,
+        "include_heuristic": args.include_heuristic,
+    }
+    model.save(args.out)
+    print(f"trained on {len(train_rows)} rows, saved to {args.out}")
+    if report:
+        print(json.dumps(report, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
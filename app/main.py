@@ -5,6 +5,10 @@ from .database import init_db
 from .routes import complaints, admin
 from .sla_monitor import start_sla_loop
 from .email_ingestor import start_polling_loop
+from .job_queue import recover_jobs, start_workers
+from .outbox import recover_outbox, start_outbox_workers
+from .config import QUEUE_WORKERS, OUTBOX_WORKERS
+from .sentiment_analyzer import load_lexicon
 import threading
 import os
 from .logging_config import setup_logging
@@ -16,12 +20,27 @@ app = FastAPI(title="AI Complaint Triage & Routing Agent")
 app.include_router(complaints.router)
 app.include_router(admin.router)
 
-# init DB
-init_db()
-
 # background threads
 stop_event = threading.Event()
 
+# init DB: schema changes now, row backfills in the background
+init_db(background_backfill=True, stop_event=stop_event)
+
+# Load the sentiment lexicon once, before the workers need it
+load_lexicon()
+
+# Resume jobs interrupted by a previous crash, then start the job workers
+recover_jobs()
+job_threads = start_workers(stop_event, QUEUE_WORKERS)
+
+# Same for outgoing mail: requeue interrupted sends, then start the outbox senders
+recover_outbox()
+outbox_threads = start_outbox_workers(stop_event, OUTBOX_WORKERS)
+
+# Send SLA alerts a previous run recorded but did not get to digest
+from .alert_digest import digest
+digest.notify()
+
 # Start SLA monitor thread
 sla_thread = threading.Thread(target=start_sla_loop, args=(stop_event, 300), daemon=True)
 sla_thread.start()
@@ -34,6 +53,16 @@ if os.getenv('IMAP_SERVER'):
 @app.on_event("shutdown")
 def shutdown_event():
     stop_event.set()
+    from .sla_monitor import notify as wake_sla
+    wake_sla()
+    from .alert_digest import digest
+    digest.stop()
+    from .outbox import notify as wake_outbox
+    wake_outbox()
+    from .utils.smtp_pool import close_pool
+    close_pool()
+    from .llm_client import client as llm_client
+    llm_client.close()
 
 if __name__ == '__main__':
     uvicorn.run('app.main:app', host='0.0.0.0', port=8000, reload=True)
@@ -0,0 +1,347 @@
+"""Versioned schema migrations for the SQLite database.
+
+Applied versions are recorded in `schema_version`. On startup a single query against that table
+decides whether anything is pending; a current schema costs nothing more (no create_all, no PRAGMA
+table_info). Otherwise:
+
+- a brand-new database is created from the models by create_all and stamped with the latest version;
+- an existing one gets create_all for tables new to the models, then each pending step in order, each
+  in its own transaction together with its `schema_version` row. A failing step rolls back and stops
+  startup instead of leaving a half-migrated schema.
+
+Steps alter existing tables and create what create_all cannot (the FTS5 index). Row backfills run after the schema change, `MIGRATION_BACKFILL_CHUNK`
+rows per transaction with a short pause in between, so writers keep getting the lock. main.py runs them
+in a background thread while the service is up; the CLI and other callers run them inline. Progress is
+stored, so an interrupted backfill resumes where it stopped.
+
+    python -m app.migrations status
+    python -m app.migrations upgrade
+
+To add a step, append a Migration with the next version; `upgrade(cur)` gets a cursor inside the
+transaction and returns True when its backfill should run.
+"""
+import argparse
+import logging
+import threading
+import time
+from datetime import datetime
+from sqlalchemy import text
+from . import config
+from .config import SLA_THRESHOLDS
+from .database import Base, engine
+
+logger = logging.getLogger(__name__)
+
+
+class Migration:
+    def __init__(self, version: int, name: str, upgrade, backfill=None):
+        self.version = version
+        self.name = name
+        self.upgrade = upgrade
+        # backfill(conn, after_id, limit) -> last id handled, or None when nothing is left
+        self.backfill = backfill
+
+
+def _columns(cur, table: str) -> set:
+    return {r[1] for r in cur.execute(f"PRAGMA table_info('{table}')").fetchall()}
+
+
+def _add_columns(cur, table: str, columns) -> list:
+    existing = _columns(cur, table)
+    added = []
+    for column, ddl in columns:
+        if column not in existing:
+            cur.execute(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}")
+            added.append(column)
+    return added
+
+
+def _llm_blobs(cur):
+    _add_columns(cur, 'complaints', (('llm_classification', 'TEXT'), ('llm_routing', 'TEXT')))
+
+
+def _sla_due_at(cur):
+    # rows stored before the column existed need a deadline; later NULLs (e.g. duplicates) are deliberate
+    return bool(_add_columns(cur, 'complaints', (('sla_due_at', 'DATETIME'),)))
+
+
+def _backfill_sla_due_at(conn, after_id: int, limit: int):
+    ids = conn.exec_driver_sql("SELECT id FROM complaints WHERE id > ? ORDER BY id LIMIT ?", (after_id, limit)).all()
+    if not ids:
+        return None
+    last_id = ids[-1][0]
+    # the deadline the scanner used to compute on the fly (unknown severity = 72h)
+    hours = " ".join(f"WHEN '{sev}' THEN {h}" for sev, h in SLA_THRESHOLDS.items())
+    conn.exec_driver_sql(
+        f"UPDATE complaints SET sla_due_at = datetime(created_at, '+' || "
+        f"(CASE COALESCE(severity, 'Medium') {hours} ELSE 72 END) || ' hours') "
+        f"WHERE id > ? AND id <= ? AND sla_due_at IS NULL AND created_at IS NOT NULL", (after_id, last_id))
+    conn.exec_driver_sql("UPDATE complaints SET sla_violation = 0 WHERE id > ? AND id <= ? AND sla_violation IS NULL",
+                         (after_id, last_id))
+    return last_id
+
+
+def _listing_and_sla_indexes(cur):
+    cur.execute("CREATE INDEX IF NOT EXISTS ix_complaints_created_at_id ON complaints (created_at, id)")
+    cur.execute("CREATE INDEX IF NOT EXISTS ix_complaints_sla ON complaints (status, sla_violation, sla_due_at)")
+
+
+def _dedup(cur):
+    _add_columns(cur, 'complaints', (('message_id', 'VARCHAR(512)'), ('idempotency_key', 'VARCHAR(255)'),
+                                     ('duplicate_of', 'INTEGER'), ('simhash', 'INTEGER')))
+    cur.execute("CREATE UNIQUE INDEX IF NOT EXISTS ux_complaints_message_id ON complaints (message_id)")
+    cur.execute("CREATE UNIQUE INDEX IF NOT EXISTS ux_complaints_idempotency_key ON complaints (idempotency_key)")
+    cur.execute("CREATE INDEX IF NOT EXISTS ix_complaints_duplicate_of ON complaints (duplicate_of)")
+
+
+def _llm_usage(cur):
+    _add_columns(cur, 'complaints', (('llm_calls', 'INTEGER'), ('prompt_tokens', 'INTEGER'),
+                                     ('completion_tokens', 'INTEGER'), ('llm_ms', 'INTEGER')))
+
+
+def _filter_indexes(cur):
+    cur.execute("CREATE INDEX IF NOT EXISTS ix_complaints_status_created ON complaints (status, created_at, id)")
+    cur.execute("CREATE INDEX IF NOT EXISTS ix_complaints_severity_created ON complaints (severity, created_at, id)")
+    cur.execute("CREATE INDEX IF NOT EXISTS ix_complaints_department_created ON complaints (department, created_at, id)")
+    cur.execute("CREATE INDEX IF NOT EXISTS ix_complaints_llm_cost ON complaints (prompt_tokens + completion_tokens) "
+                "WHERE llm_calls > 0")
+    cur.execute("CREATE INDEX IF NOT EXISTS ix_jobs_kind_status ON jobs (kind, status)")
+    cur.execute("CREATE INDEX IF NOT EXISTS ix_jobs_status_id ON jobs (status, id)")
+    cur.execute("CREATE INDEX IF NOT EXISTS ix_outbox_kind_status ON outbox (kind, status)")
+
+
+def _tag_rows(cur):
+    # complaint_keywords is new and comes from create_all; complaint_categories gains the listing key
+    _add_columns(cur, 'complaint_categories', (('created_at', 'DATETIME'),))
+    cur.execute("DROP INDEX IF EXISTS ix_complaint_categories_category")
+    cur.execute("CREATE INDEX IF NOT EXISTS ix_complaint_categories_category_created "
+                "ON complaint_categories (category, created_at, complaint_id)")
+    return cur.execute("SELECT 1 FROM complaints LIMIT 1").fetchone() is not None
+
+
+def _backfill_tag_rows(conn, after_id: int, limit: int):
+    from .summary import split_keywords
+    rows = conn.exec_driver_sql("SELECT id, keywords FROM complaints WHERE id > ? ORDER BY id LIMIT ?",
+                                (after_id, limit)).all()
+    if not rows:
+        return None
+    last_id = rows[-1][0]
+    conn.exec_driver_sql(
+        "UPDATE complaint_categories SET created_at = "
+        "(SELECT created_at FROM complaints WHERE complaints.id = complaint_categories.complaint_id) "
+        "WHERE complaint_id > ? AND complaint_id <= ?", (after_id, last_id))
+    keywords = [(cid, kw, cid) for cid, value in rows for kw in split_keywords(value)]
+    if keywords:
+        conn.exec_driver_sql(
+            "INSERT OR IGNORE INTO complaint_keywords (complaint_id, keyword, created_at) "
+            "SELECT ?, ?, created_at FROM complaints WHERE id = ?", keywords)
+    return last_id
+
+
+def _full_text_index(cur):
+    from .models import COMPLAINTS_FTS_DDL
+    for ddl in COMPLAINTS_FTS_DDL:
+        cur.execute(ddl)
+    # indexes the stored rows in this step's transaction, so the triggers never see an unindexed row
+    cur.execute("INSERT INTO complaints_fts (complaints_fts) VALUES ('rebuild')")
+
+
+def _changed_at(cur):
+    from .models import COMPLAINTS_CHANGED_AT_DDL
+    cur.execute("CREATE INDEX IF NOT EXISTS ix_complaints_updated_at_id ON complaints (updated_at, id)")
+    for ddl in COMPLAINTS_CHANGED_AT_DDL:
+        cur.execute(ddl)
+    return cur.execute("SELECT 1 FROM complaints WHERE updated_at IS NULL LIMIT 1").fetchone() is not None
+
+
+def _backfill_changed_at(conn, after_id: int, limit: int):
+    from .models import CHANGED_AT_SQL
+    ids = conn.exec_driver_sql("SELECT id FROM complaints WHERE id > ? ORDER BY id LIMIT ?", (after_id, limit)).all()
+    if not ids:
+        return None
+    last_id = ids[-1][0]
+    # stamped now rather than with created_at: an export that ran while the backfill was pending has a watermark
+    # past created_at, and would otherwise never pick these rows up
+    conn.exec_driver_sql(f"UPDATE complaints SET updated_at = {CHANGED_AT_SQL} "
+                         "WHERE id > ? AND id <= ? AND updated_at IS NULL", (after_id, last_id))
+    return last_id
+
+
+def _summary_rows(cur):
+    # category rows and counters for complaints stored before they existed (keyword rows come from step 7)
+    return cur.execute("SELECT 1 FROM complaints LIMIT 1").fetchone() is not None
+
+
+def _backfill_summary_rows(conn, after_id: int, limit: int):
+    from .summary import set_categories, reset_counters
+    rows = conn.exec_driver_sql("SELECT id, categories FROM complaints WHERE id > ? ORDER BY id LIMIT ?",
+                                (after_id, limit)).all()
+    if not rows:
+        # last chunk: recount, in the transaction that marks the backfill done
+        if config.SUMMARY_COUNTERS:
+            reset_counters(conn)
+        return None
+    # replaces the rows of each complaint, so it is idempotent and agrees with concurrent writers
+    set_categories(conn, {cid: categories for cid, categories in rows})
+    return rows[-1][0]
+
+
+MIGRATIONS = [
+    Migration(1, "complaints LLM result blobs", _llm_blobs),
+    Migration(2, "complaints.sla_due_at", _sla_due_at, _backfill_sla_due_at),
+    Migration(3, "listing and SLA scanner indexes", _listing_and_sla_indexes),
+    Migration(4, "duplicate detection columns", _dedup),
+    Migration(5, "LLM usage per complaint", _llm_usage),
+    Migration(6, "listing filter and LLM cost indexes", _filter_indexes),
+    Migration(7, "keyword rows and category listing key", _tag_rows, _backfill_tag_rows),
+    Migration(8, "full-text index on complaints", _full_text_index),
+    Migration(9, "complaints change time for incremental export", _changed_at, _backfill_changed_at),
+    Migration(10, "category rows and summary counters for existing complaints", _summary_rows, _backfill_summary_rows),
+]
+LATEST = MIGRATIONS[-1].version
+
+_SCHEMA_VERSION_DDL = (
+    "CREATE TABLE IF NOT EXISTS schema_version ("
+    "version INTEGER PRIMARY KEY, name VARCHAR(255) NOT NULL, applied_at DATETIME NOT NULL, "
+    "backfill_after INTEGER, backfilled_at DATETIME)"
+)
+
+
+def applied_versions(eng=None):
+    """{version: (backfill_after, backfilled_at)} of applied migrations, or None without a schema_version table."""
+    from sqlalchemy.exc import OperationalError
+    eng = eng or engine
+    try:
+        with eng.connect() as conn:
+            rows = conn.exec_driver_sql("SELECT version, backfill_after, backfilled_at FROM schema_version").all()
+    except OperationalError:
+        return None
+    return {v: (after, done) for v, after, done in rows}
+
+
+def pending_backfills(applied: dict) -> list:
+    return [m for m in MIGRATIONS if m.backfill and m.version in applied and applied[m.version][1] is None]
+
+
+def backfill_done(db, version: int) -> bool:
+    """Whether migration `version` is applied with its backfill finished (db: a session or connection)."""
+    row = db.execute(text("SELECT backfilled_at FROM schema_version WHERE version = :v"), {"v": version}).first()
+    return row is not None and row[0] is not None
+
+
+def _now() -> str:
+    return datetime.utcnow().isoformat(sep=' ')
+
+
+def upgrade(eng=None) -> list:
+    """Apply pending schema steps; returns the versions applied. Backfills are left to run_backfills."""
+    eng = eng or engine
+    from . import models  # noqa: F401  (registers every table on Base)
+    raw = eng.raw_connection()
+    dbapi = raw.driver_connection
+    isolation = dbapi.isolation_level
+    dbapi.isolation_level = None  # explicit BEGIN/COMMIT, so DDL is transactional too
+    try:
+        cur = dbapi.cursor()
+        fresh = cur.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'complaints'").fetchone() is None
+        cur.execute(_SCHEMA_VERSION_DDL)
+        done = {r[0] for r in cur.execute("SELECT version FROM schema_version").fetchall()}
+    finally:
+        dbapi.isolation_level = isolation
+        raw.close()
+
+    # tables new to the models (everything, on a fresh database); existing tables are left alone
+    Base.metadata.create_all(bind=eng)
+
+    raw = eng.raw_connection()
+    dbapi = raw.driver_connection
+    dbapi.isolation_level = None
+    applied = []
+    try:
+        cur = dbapi.cursor()
+        for m in MIGRATIONS:
+            if m.version in done:
+                continue
+            cur.execute("BEGIN IMMEDIATE")
+            try:
+                needs_backfill = False if fresh else bool(m.upgrade(cur))
+                cur.execute(
+                    "INSERT INTO schema_version (version, name, applied_at, backfill_after, backfilled_at) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (m.version, m.name, _now(), 0, None if m.backfill and needs_backfill else _now()))
+                cur.execute("COMMIT")
+            except Exception:
+                cur.execute("ROLLBACK")
+                logger.exception("Migration %s (%s) failed", m.version, m.name)
+                raise
+            applied.append(m.version)
+            logger.info("Applied migration %s: %s", m.version, m.name)
+    finally:
+        dbapi.isolation_level = isolation
+        raw.close()
+    return applied
+
+
+def run_backfills(eng=None, stop_event: threading.Event = None, chunk_size: int = None, pause: float = None) -> int:
+    """Run pending backfills chunk by chunk (one transaction each); returns the chunks committed. Resumable."""
+    eng = eng or engine
+    chunk_size = chunk_size or config.MIGRATION_BACKFILL_CHUNK
+    pause = config.MIGRATION_BACKFILL_PAUSE if pause is None else pause
+    total = 0
+    for m in pending_backfills(applied_versions(eng) or {}):
+        after = applied_versions(eng)[m.version][0] or 0
+        logger.info("Backfilling migration %s (%s) after id %s", m.version, m.name, after)
+        while stop_event is None or not stop_event.is_set():
+            with eng.begin() as conn:
+                last = m.backfill(conn, after, chunk_size)
+                if last is None:
+                    conn.exec_driver_sql("UPDATE schema_version SET backfilled_at = ? WHERE version = ?", (_now(), m.version))
+                else:
+                    conn.exec_driver_sql("UPDATE schema_version SET backfill_after = ? WHERE version = ?", (last, m.version))
+            if last is None:
+                logger.info("Backfill of migration %s done", m.version)
+                break
+            total += 1
+            after = last
+            if pause:
+                time.sleep(pause)
+    return total
+
+
+def migrate(eng=None, background_backfill: bool = False, stop_event: threading.Event = None):
+    """Bring the schema to LATEST. The fast path is one SELECT on schema_version."""
+    eng = eng or engine
+    if eng.dialect.name != 'sqlite':
+        Base.metadata.create_all(bind=eng)
+        return
+    applied = applied_versions(eng)
+    if applied is None or any(m.version not in applied for m in MIGRATIONS):
+        upgrade(eng)
+        applied = applied_versions(eng)
+    if not pending_backfills(applied):
+        return
+    if background_backfill:
+        threading.Thread(target=run_backfills, args=(eng, stop_event), name="migration-backfill", daemon=True).start()
+    else:
+        run_backfills(eng, stop_event)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Show or apply schema migrations")
+    parser.add_argument('command', choices=['status', 'upgrade'])
+    args = parser.parse_args(argv)
+
+    if args.command == 'upgrade':
+        migrate()
+    applied = applied_versions() or {}
+    for m in MIGRATIONS:
+        state = 'pending'
+        if m.version in applied:
+            after, done = applied[m.version]
+            state = 'applied' if done or not m.backfill else f'applied, backfilling after id {after}'
+        print(f"{m.version:4d}  {m.name:40s} {state}")
+    return 0 if all(m.version in applied for m in MIGRATIONS) else 1
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
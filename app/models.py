@@ -1,8 +1,13 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime, Boolean
-from sqlalchemy.sql import func
+from sqlalchemy import Column, Integer, String, Text, DateTime, Boolean, Float, Index, DDL, event
+from sqlalchemy.sql import func, literal_column
 from sqlalchemy.types import JSON
 from .database import Base
 
+# change time with millisecond precision (written out to microseconds, like SQLAlchemy's own DateTime strings),
+# taken inside the write so rows committed later never get an earlier value
+CHANGED_AT_SQL = "strftime('%Y-%m-%d %H:%M:%f000', 'now')"
+_changed_at = literal_column(CHANGED_AT_SQL)
+
 class Complaint(Base):
     __tablename__ = "complaints"
 
@@ -22,8 +27,209 @@ class Complaint(Base):
     acknowledged_at = Column(DateTime, nullable=True)
     resolved_at = Column(DateTime, nullable=True)
     sla_violation = Column(Boolean, default=False)
+    sla_due_at = Column(DateTime, nullable=True)  # created_at + SLA_THRESHOLDS[severity]
     llm_classification = Column(Text, nullable=True)
     llm_routing = Column(Text, nullable=True)
+    # duplicate detection (app.dedup)
+    message_id = Column(String(512), nullable=True)  # normalized Message-ID of an emailed complaint
+    idempotency_key = Column(String(255), nullable=True)  # Idempotency-Key header of POST /submit_complaint
+    duplicate_of = Column(Integer, nullable=True, index=True)  # the original ticket a near-duplicate is linked to
+    simhash = Column(Integer, nullable=True)  # 64-bit SimHash of the description, stored signed
+    # LLM usage of the latest triage (app.llm_utils.track_usage); a batch request is shared out evenly
+    llm_calls = Column(Integer, nullable=True)
+    prompt_tokens = Column(Integer, nullable=True)
+    completion_tokens = Column(Integer, nullable=True)
+    llm_ms = Column(Integer, nullable=True)  # time spent waiting for LLM replies
+
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), default=_changed_at, onupdate=_changed_at)
+
+    __table_args__ = (
+        # keyset pagination of complaint listings (app.utils.pagination)
+        Index("ix_complaints_created_at_id", "created_at", "id"),
+        # listing filters, each followed by the listing order so a filtered page is read in index order
+        Index("ix_complaints_status_created", "status", "created_at", "id"),
+        Index("ix_complaints_severity_created", "severity", "created_at", "id"),
+        Index("ix_complaints_department_created", "department", "created_at", "id"),
+        # SLA scanner: newly overdue open complaints and the next deadline (app.sla_monitor)
+        Index("ix_complaints_sla", "status", "sla_violation", "sla_due_at"),
+        Index("ux_complaints_message_id", "message_id", unique=True),
+        Index("ux_complaints_idempotency_key", "idempotency_key", unique=True),
+        # incremental export: rows changed after a (updated_at, id) watermark (app.export)
+        Index("ix_complaints_updated_at_id", "updated_at", "id"),
+    )
+
+# costliest triaged tickets first (GET /admin/llm_usage); only tickets that called the LLM are indexed
+Index("ix_complaints_llm_cost", Complaint.prompt_tokens + Complaint.completion_tokens,
+      sqlite_where=Complaint.llm_calls > 0)
+
+# Full-text index over subject, description and keywords (app.search). An external-content FTS5 table
+# stores only the index; triggers keep it in step with every write to complaints. Created together with
+# the complaints table here, and by migration 8 on databases that predate it.
+_FTS_COLUMNS = "subject, description, keywords"
+COMPLAINTS_FTS_DDL = (
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS complaints_fts USING fts5({_FTS_COLUMNS}, content='complaints', "
+    "content_rowid='id', tokenize='porter unicode61 remove_diacritics 2')",
+    f"CREATE TRIGGER IF NOT EXISTS complaints_fts_insert AFTER INSERT ON complaints BEGIN "
+    f"INSERT INTO complaints_fts (rowid, {_FTS_COLUMNS}) VALUES (new.id, new.subject, new.description, new.keywords); END",
+    f"CREATE TRIGGER IF NOT EXISTS complaints_fts_delete AFTER DELETE ON complaints BEGIN "
+    f"INSERT INTO complaints_fts (complaints_fts, rowid, {_FTS_COLUMNS}) "
+    f"VALUES ('delete', old.id, old.subject, old.description, old.keywords); END",
+    f"CREATE TRIGGER IF NOT EXISTS complaints_fts_update AFTER UPDATE OF {_FTS_COLUMNS} ON complaints "
+    f"WHEN old.subject IS NOT new.subject OR old.description IS NOT new.description OR old.keywords IS NOT new.keywords "
+    f"BEGIN INSERT INTO complaints_fts (complaints_fts, rowid, {_FTS_COLUMNS}) "
+    f"VALUES ('delete', old.id, old.subject, old.description, old.keywords); "
+    f"INSERT INTO complaints_fts (rowid, {_FTS_COLUMNS}) VALUES (new.id, new.subject, new.description, new.keywords); END",
+)
+
+# updated_at for writes that bypass the model (raw SQL inserts and updates, migration backfills). Created with
+# the complaints table here, and by migration 9 on databases that predate it.
+COMPLAINTS_CHANGED_AT_DDL = (
+    f"CREATE TRIGGER IF NOT EXISTS complaints_changed_insert AFTER INSERT ON complaints WHEN new.updated_at IS NULL "
+    f"BEGIN UPDATE complaints SET updated_at = {CHANGED_AT_SQL} WHERE id = new.id; END",
+    f"CREATE TRIGGER IF NOT EXISTS complaints_changed_update AFTER UPDATE ON complaints "
+    f"WHEN new.updated_at IS old.updated_at "
+    f"BEGIN UPDATE complaints SET updated_at = {CHANGED_AT_SQL} WHERE id = new.id; END",
+)
+for _ddl in COMPLAINTS_FTS_DDL + COMPLAINTS_CHANGED_AT_DDL:
+    # DDL() applies %-formatting to its statement
+    event.listen(Complaint.__table__, "after_create", DDL(_ddl.replace('%', '%%')).execute_if(dialect="sqlite"))
+
+
+class ComplaintCategory(Base):
+    """One row per (complaint, category); the normalized form of Complaint.categories for GROUP BY and filters."""
+    __tablename__ = "complaint_categories"
+
+    complaint_id = Column(Integer, primary_key=True)
+    category = Column(String(100), primary_key=True)
+    created_at = Column(DateTime(timezone=True), nullable=True)  # the complaint's, copied as stored
+
+    __table_args__ = (
+        # GET /get_complaints?category=..., read in listing order
+        Index("ix_complaint_categories_category_created", "category", "created_at", "complaint_id"),
+    )
+
+
+class ComplaintKeyword(Base):
+    """One row per (complaint, keyword); the normalized form of Complaint.keywords for filters and trends."""
+    __tablename__ = "complaint_keywords"
+
+    complaint_id = Column(Integer, primary_key=True)
+    keyword = Column(String(100), primary_key=True)
+    created_at = Column(DateTime(timezone=True), nullable=True)  # the complaint's, copied as stored
+
+    __table_args__ = (
+        # GET /get_complaints?keyword=..., read in listing order
+        Index("ix_complaint_keywords_keyword_created", "keyword", "created_at", "complaint_id"),
+        # GET /stats/keywords: the keywords of a time window
+        Index("ix_complaint_keywords_created", "created_at", "keyword"),
+    )
+
+
+class ComplaintSignature(Base):
+    """SimHash bands of a complaint's description, keyed for near-duplicate lookups per customer (app.dedup)."""
+    __tablename__ = "complaint_signatures"
+
+    customer_email = Column(String(255), primary_key=True)  # lower-cased
+    band = Column(Integer, primary_key=True)
+    value = Column(Integer, primary_key=True)
+    complaint_id = Column(Integer, primary_key=True)
+
+
+class SummaryCounter(Base):
+    """Materialized GET /get_summary counts, maintained by app.summary alongside complaint writes."""
+    __tablename__ = "summary_counters"
+
+    dimension = Column(String(50), primary_key=True)  # total, category, severity, status, sla_violation
+    bucket = Column(String(100), primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
+
+
+class Job(Base):
+    """Durable background work item (triage, acknowledgement, ...) processed by app.job_queue workers."""
+    __tablename__ = "jobs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    kind = Column(String(50), nullable=False)
+    complaint_id = Column(Integer, nullable=True, index=True)
+    status = Column(String(20), nullable=False, default="queued")  # queued, running, done, dead
+    attempts = Column(Integer, nullable=False, default=0)
+    max_attempts = Column(Integer, nullable=False, default=5)
+    run_after = Column(DateTime, nullable=True)
+    locked_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+    last_error = Column(Text, nullable=True)
+
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+
+    __table_args__ = (
+        Index("ix_jobs_status_run_after", "status", "run_after"),
+        Index("ix_jobs_kind_status", "kind", "status"),  # triage queue depth (GET /admin/ingest)
+        Index("ix_jobs_status_id", "status", "id"),  # GET /admin/jobs?status=dead, newest first
+    )
+
+
+class OutboxMessage(Base):
+    """Outgoing email waiting for (or done with) delivery by the app.outbox senders."""
+    __tablename__ = "outbox"
+
+    id = Column(Integer, primary_key=True, index=True)
+    kind = Column(String(20), nullable=False, default="email")  # ack, alert, email, sla (pending SLA alert)
+    complaint_id = Column(Integer, nullable=True, index=True)
+    to_email = Column(String(255), nullable=False)
+    subject = Column(String(512), nullable=False)
+    body = Column(Text, nullable=False)
+    dedup_key = Column(String(300), nullable=True, unique=True)  # "<recipient>|<key>": one message per recipient and key
+    status = Column(String(20), nullable=False, default="queued")  # queued, sending, sent, dead; sla: pending, digested
+    attempts = Column(Integer, nullable=False, default=0)
+    max_attempts = Column(Integer, nullable=False, default=6)
+    run_after = Column(DateTime, nullable=True)
+    locked_at = Column(DateTime, nullable=True)
+    sent_at = Column(DateTime, nullable=True)
+    last_error = Column(Text, nullable=True)
 
     created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    __table_args__ = (
+        Index("ix_outbox_status_run_after", "status", "run_after"),
+        Index("ix_outbox_kind_status", "kind", "status"),  # acknowledgement queue depth (GET /admin/ingest)
+    )
+
+
+class MailboxState(Base):
+    """IMAP ingestion watermark: the highest UID already stored as a complaint, per mailbox and UIDVALIDITY."""
+    __tablename__ = "mailbox_state"
+
+    mailbox = Column(String(512), primary_key=True)  # user@server/folder
+    uidvalidity = Column(Integer, nullable=True)
+    last_uid = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+
+class LLMCacheEntry(Base):
+    """Persistent tier of the LLM response cache (see app.llm_cache)."""
+    __tablename__ = "llm_cache"
+
+    key = Column(String(64), primary_key=True)
+    model = Column(String(255), nullable=True)
+    response = Column(Text, nullable=False)
+    created_at = Column(Float, nullable=False, index=True)  # unix time, compared against LLM_CACHE_TTL
+
+
+class RetriageRun(Base):
+    """Progress of a bulk re-triage (app.retriage); last_id is the resume point."""
+    __tablename__ = "retriage_runs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    status = Column(String(20), nullable=False, default="running")  # running, done, failed, cancelled
+    start_after_id = Column(Integer, nullable=False, default=0)
+    last_id = Column(Integer, nullable=False, default=0)
+    processed = Column(Integer, nullable=False, default=0)
+    total = Column(Integer, nullable=True)
+    chunk_size = Column(Integer, nullable=False)
+    batch_size = Column(Integer, nullable=False)
+    error = Column(Text, nullable=True)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
@@ -0,0 +1,242 @@
+"""Outgoing mail queue (`outbox` table) and its background senders.
+
+Callers add messages with `queue_email` inside their own transaction, so an acknowledgement or alert is
+durable as soon as it is committed and never waits on the SMTP server. Sender threads claim batches of
+due messages, send each batch over one pooled SMTP session (app.utils.smtp_pool) and write the results
+back in one transaction. Transient failures are retried with exponential backoff; permanent (5xx)
+rejections and messages out of attempts end up 'dead'. A message carrying a dedup key is queued at
+most once per recipient.
+"""
+import logging
+import smtplib
+import threading
+import time
+from collections import deque
+from datetime import datetime, timedelta
+from email.mime.text import MIMEText
+from sqlalchemy import select, update, func
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from . import config
+from .database import engine
+from .models import OutboxMessage, Complaint
+from .utils.smtp_pool import get_pool, smtp_configured
+
+logger = logging.getLogger(__name__)
+
+_wakeup = threading.Event()
+_stats_lock = threading.Lock()
+_latencies = deque(maxlen=1000)  # seconds per accepted message, most recent last
+stats = {"sent": 0, "retried": 0, "dead": 0, "batches": 0}
+
+
+def notify():
+    _wakeup.set()
+
+
+def queue_email(db, to_email: str, subject: str, body: str, kind: str = "email", complaint_id: int = None,
+                dedup: str = None) -> bool:
+    """Add a message to `db` (caller commits, then calls notify()); False if skipped or already queued."""
+    if not to_email:
+        return False
+    if not smtp_configured():
+        logger.warning("SMTP not configured, skipping %s email to %s", kind, to_email)
+        return False
+    stmt = sqlite_insert(OutboxMessage).values(
+        kind=kind,
+        complaint_id=complaint_id,
+        to_email=to_email,
+        subject=subject,
+        body=body,
+        dedup_key=f"{to_email.strip().lower()}|{dedup}" if dedup else None,
+        status="queued",
+        attempts=0,
+        max_attempts=config.OUTBOX_MAX_ATTEMPTS,
+        run_after=datetime.utcnow(),
+    ).on_conflict_do_nothing(index_elements=[OutboxMessage.dedup_key])
+    return db.execute(stmt).rowcount == 1
+
+
+def claim_batch(limit: int = None):
+    """Atomically move up to `limit` due messages to 'sending' and return them, oldest first."""
+    now = datetime.utcnow()
+    pick = (
+        select(OutboxMessage.id)
+        .where(OutboxMessage.status == "queued", OutboxMessage.run_after <= now)
+        .order_by(OutboxMessage.run_after, OutboxMessage.id)
+        .limit(limit or config.OUTBOX_BATCH_SIZE)
+    )
+    stmt = (
+        update(OutboxMessage)
+        .where(OutboxMessage.id.in_(pick), OutboxMessage.status == "queued")
+        .values(status="sending", locked_at=now, attempts=OutboxMessage.attempts + 1)
+        .returning(OutboxMessage.id, OutboxMessage.kind, OutboxMessage.complaint_id, OutboxMessage.to_email,
+                   OutboxMessage.subject, OutboxMessage.body, OutboxMessage.attempts, OutboxMessage.max_attempts)
+    )
+    with engine.begin() as conn:
+        rows = conn.execute(stmt).all()
+    return sorted(rows, key=lambda r: r.id)
+
+
+def _mime(row):
+    msg = MIMEText(row.body)
+    msg["Subject"] = row.subject
+    msg["From"] = config.SMTP_USER
+    msg["To"] = row.to_email
+    return msg.as_string()
+
+
+def _is_permanent(e) -> bool:
+    if isinstance(e, smtplib.SMTPRecipientsRefused):
+        return all(code >= 500 for code, _ in e.recipients.values())
+    return isinstance(e, smtplib.SMTPResponseException) and e.smtp_code >= 500
+
+
+def deliver(rows) -> list:
+    """Send `rows` over one pooled session; returns [(row, error or None, permanent)] for every row."""
+    results = []
+    pending = deque(rows)
+    try:
+        with get_pool().connection() as conn:
+            while pending:
+                row = pending[0]
+                started = time.perf_counter()
+                try:
+                    conn.sendmail(config.SMTP_USER, [row.to_email], _mime(row))
+                except (smtplib.SMTPRecipientsRefused, smtplib.SMTPSenderRefused, smtplib.SMTPDataError) as e:
+                    # the server refused this message; the session is still good for the next one
+                    results.append((row, f"{type(e).__name__}: {e}", _is_permanent(e)))
+                else:
+                    with _stats_lock:
+                        _latencies.append(time.perf_counter() - started)
+                    results.append((row, None, False))
+                pending.popleft()
+    except Exception as e:
+        # connect/auth failure or a dropped session: this message and the rest of the batch retry later
+        logger.warning("SMTP session failed with %d message(s) unsent: %s", len(pending), e)
+        results.extend((row, f"{type(e).__name__}: {e}", False) for row in pending)
+    return results
+
+
+def record_results(results: list):
+    """Write delivery results back in one transaction (and stamp acknowledged_at on sent acks)."""
+    now = datetime.utcnow()
+    sent = [row for row, error, _ in results if error is None]
+    counts = {"sent": len(sent), "retried": 0, "dead": 0}
+    with engine.begin() as conn:
+        if sent:
+            conn.execute(
+                update(OutboxMessage).where(OutboxMessage.id.in_([r.id for r in sent]))
+                .values(status="sent", sent_at=now, locked_at=None, last_error=None)
+            )
+            acked = [r.complaint_id for r in sent if r.kind == "ack" and r.complaint_id is not None]
+            if acked:
+                conn.execute(
+                    update(Complaint).where(Complaint.id.in_(acked), Complaint.acknowledged_at.is_(None))
+                    .values(acknowledged_at=now)
+                )
+        for row, error, permanent in results:
+            if error is None:
+                continue
+            if permanent or row.attempts >= row.max_attempts:
+                values = dict(status="dead", locked_at=None, last_error=error)
+                counts["dead"] += 1
+                logger.error("Outbox message %s to %s moved to dead-letter after %s attempts: %s",
+                             row.id, row.to_email, row.attempts, error)
+            else:
+                delay = min(config.OUTBOX_BACKOFF_BASE * (2 ** (row.attempts - 1)), config.OUTBOX_BACKOFF_MAX)
+                values = dict(status="queued", run_after=now + timedelta(seconds=delay), locked_at=None, last_error=error)
+                counts["retried"] += 1
+            conn.execute(update(OutboxMessage).where(OutboxMessage.id == row.id).values(**values))
+    with _stats_lock:
+        for k, n in counts.items():
+            stats[k] += n
+        stats["batches"] += 1
+    return counts
+
+
+def send_next_batch() -> int:
+    """Claim, send and record one batch; returns how many messages it held (0 when nothing was due)."""
+    if not smtp_configured():
+        return 0
+    rows = claim_batch()
+    if not rows:
+        return 0
+    record_results(deliver(rows))
+    return len(rows)
+
+
+def run_outbox_once(limit: int = None) -> int:
+    """Drain due messages on the calling thread (used by tests and one-off scripts)."""
+    n = 0
+    while limit is None or n < limit:
+        sent = send_next_batch()
+        if not sent:
+            break
+        n += sent
+    return n
+
+
+def recover_outbox():
+    """Requeue messages left 'sending' by a crashed process. Call once at startup before senders run."""
+    with engine.begin() as conn:
+        res = conn.execute(
+            update(OutboxMessage).where(OutboxMessage.status == "sending")
+            .values(status="queued", locked_at=None, run_after=datetime.utcnow())
+        )
+    if res.rowcount:
+        logger.warning("Recovered %s interrupted outbox message(s)", res.rowcount)
+    return res.rowcount
+
+
+def requeue_message(message_id: int) -> bool:
+    """Give a dead-lettered message a fresh set of attempts."""
+    with engine.begin() as conn:
+        res = conn.execute(
+            update(OutboxMessage).where(OutboxMessage.id == message_id, OutboxMessage.status == "dead")
+            .values(status="queued", attempts=0, run_after=datetime.utcnow(), last_error=None)
+        )
+    notify()
+    return res.rowcount > 0
+
+
+def outbox_stats() -> dict:
+    """Queue depth per status, delivery counters and send latency over the last 1000 messages."""
+    with engine.connect() as conn:
+        depth = dict(conn.execute(select(OutboxMessage.status, func.count()).group_by(OutboxMessage.status)).all())
+        oldest = conn.execute(
+            select(func.min(OutboxMessage.run_after)).where(OutboxMessage.status == "queued")
+        ).scalar()
+    with _stats_lock:
+        lat = sorted(_latencies)
+        out = dict(stats)
+    out["depth"] = depth
+    out["oldest_queued_age_seconds"] = max(0.0, (datetime.utcnow() - oldest).total_seconds()) if oldest else 0.0
+    out["latency_ms"] = {
+        "samples": len(lat),
+        "avg": round(1000 * sum(lat) / len(lat), 2) if lat else None,
+        "p50": round(1000 * lat[len(lat) // 2], 2) if lat else None,
+        "p95": round(1000 * lat[min(len(lat) - 1, int(len(lat) * 0.95))], 2) if lat else None,
+    }
+    out["pool"] = get_pool().snapshot()
+    return out
+
+
+def sender_loop(stop_event):
+    while not stop_event.is_set():
+        try:
+            if send_next_batch():
+                continue
+        except Exception:
+            logger.exception("Error in outbox sender loop")
+        _wakeup.wait(config.OUTBOX_POLL_INTERVAL)
+        _wakeup.clear()
+
+
+def start_outbox_workers(stop_event, count: int = None):
+    count = config.OUTBOX_WORKERS if count is None else count
+    threads = []
+    for i in range(count):
+        t = threading.Thread(target=sender_loop, args=(stop_event,), name=f"outbox-sender-{i}", daemon=True)
+        t.start()
+        threads.append(t)
+    return threads
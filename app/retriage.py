@@ -0,0 +1,209 @@
+"""Bulk re-triage of stored complaints, e.g. after DEPARTMENT_MAP changes.
+
+Original complaints are read in id order, `chunk_size` rows at a time. Each chunk is split into batches of
+`batch_size` complaints that share one LLM request (run `concurrency` at a time in the "bulk" priority
+lane), and the chunk's results are written back with one bulk UPDATE in the same transaction that
+advances the run's `last_id`, so an interrupted run resumes exactly where it stopped. Near-duplicates
+are not triaged themselves; they copy the new triage of their original.
+
+    python -m app.retriage [--after-id N] [--resume RUN_ID] [--chunk-size N] [--batch-size N] [--concurrency N]
+"""
+import argparse
+import json
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from sqlalchemy import select, update, func
+from . import config
+from .database import SessionLocal, init_db
+from .dedup import update_duplicates
+from .llm_utils import batch_triage, llm_priority, track_usage
+from .models import Complaint, RetriageRun
+from .summary import snapshot, split_categories, record_changes, set_categories, set_keywords
+from .sla_monitor import sla_due_at, notify as wake_sla_monitor
+from .utils.keywords import extract_keywords
+from .utils.router import triage_blobs
+
+logger = logging.getLogger(__name__)
+
+# run id -> Event, for runs started in this process
+_cancel_events = {}
+
+
+def start_run(after_id: int = 0, chunk_size: int = None, batch_size: int = None):
+    db = SessionLocal()
+    try:
+        total = db.execute(select(func.count()).select_from(Complaint)
+                           .where(Complaint.id > after_id, Complaint.duplicate_of.is_(None))).scalar()
+        run = RetriageRun(
+            status='running',
+            start_after_id=after_id,
+            last_id=after_id,
+            processed=0,
+            total=total,
+            chunk_size=chunk_size or config.RETRIAGE_CHUNK_SIZE,
+            batch_size=batch_size or config.RETRIAGE_BATCH_SIZE,
+            started_at=datetime.utcnow(),
+        )
+        db.add(run)
+        db.commit()
+        return run.id
+    finally:
+        db.close()
+
+
+def resume_run(run_id: int):
+    """Mark a stopped run as running again; it continues after its last committed id."""
+    db = SessionLocal()
+    try:
+        run = db.get(RetriageRun, run_id)
+        if run is None:
+            raise LookupError(f"Retriage run {run_id} not found")
+        if run.status == 'done':
+            return run.id
+        run.status = 'running'
+        run.error = None
+        run.finished_at = None
+        db.commit()
+        return run.id
+    finally:
+        db.close()
+
+
+def _triage_batch(rows):
+    items = []
+    created = {r.id: r.created_at for r in rows}
+    for r in rows:
+        cid, text = r.id, r.description
+        items.append({"id": cid, "text": text or "", "keywords": extract_keywords(text or "")})
+    with llm_priority('bulk'), track_usage() as usage:
+        results = batch_triage(items)
+    n = len(items)
+    updates = []
+    for i, it in enumerate(items):
+        t = results[it["id"]]
+        cls, sr = triage_blobs(t)
+        updates.append({
+            "id": it["id"],
+            "categories": ",".join(t['categories']),
+            "sentiment": t['sentiment'],
+            "severity": t['severity'],
+            "sla_due_at": sla_due_at(created[it["id"]], t['severity']),
+            "department": t['routed_department'],
+            "keywords": ",".join(it["keywords"]) if it["keywords"] else None,
+            "llm_classification": json.dumps(cls),
+            "llm_routing": json.dumps(sr),
+            # the batch request's usage, shared out evenly
+            "llm_calls": usage.calls // n + (i < usage.calls % n),
+            "prompt_tokens": usage.prompt_tokens // n + (i < usage.prompt_tokens % n),
+            "completion_tokens": usage.completion_tokens // n + (i < usage.completion_tokens % n),
+            "llm_ms": usage.llm_ms // n,
+        })
+    return updates
+
+
+def process_run(run_id: int, concurrency: int = None, progress=None, cancel_event: threading.Event = None):
+    """Work through a run until it finishes, fails or is cancelled. Returns the final run status."""
+    concurrency = concurrency or config.RETRIAGE_CONCURRENCY
+    db = SessionLocal()
+    try:
+        run = db.get(RetriageRun, run_id)
+        if run is None:
+            raise LookupError(f"Retriage run {run_id} not found")
+        last_id, chunk_size, batch_size = run.last_id, run.chunk_size, run.batch_size
+        db.commit()
+
+        with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix=f"retriage-{run_id}") as pool:
+            while True:
+                if cancel_event is not None and cancel_event.is_set():
+                    run.status = 'cancelled'
+                    break
+                rows = db.execute(
+                    select(Complaint.id, Complaint.description, Complaint.categories, Complaint.severity,
+                           Complaint.status, Complaint.sla_violation, Complaint.created_at)
+                    .where(Complaint.id > last_id, Complaint.duplicate_of.is_(None))
+                    .order_by(Complaint.id)
+                    .limit(chunk_size)
+                ).all()
+                if not rows:
+                    run.status = 'done'
+                    break
+                batches = [rows[i:i + batch_size] for i in range(0, len(rows), batch_size)]
+                updates = []
+                for part in pool.map(_triage_batch, batches):
+                    updates.extend(part)
+
+                # results, category/keyword rows, summary counters and the resume point are committed together
+                db.execute(update(Complaint), updates)
+                set_categories(db, {u["id"]: u["categories"] for u in updates})
+                set_keywords(db, {u["id"]: u["keywords"] for u in updates})
+                before = {r.id: snapshot(r) for r in rows}
+                record_changes(db, [
+                    (before[u["id"]], (tuple(split_categories(u["categories"])), u["severity"]) + before[u["id"]][2:])
+                    for u in updates
+                ])
+                update_duplicates(db, [u["id"] for u in updates])
+                last_id = rows[-1].id
+                run.last_id = last_id
+                run.processed += len(rows)
+                db.commit()
+                wake_sla_monitor()
+                if progress:
+                    progress(run.processed, run.total, last_id)
+                logger.info("Retriage run %s: %s/%s complaints, last_id=%s", run_id, run.processed, run.total, last_id)
+        run.finished_at = datetime.utcnow()
+        db.commit()
+        return run.status
+    except Exception as e:
+        db.rollback()
+        logger.exception("Retriage run %s failed", run_id)
+        db.execute(update(RetriageRun).where(RetriageRun.id == run_id).values(status='failed', error=f"{type(e).__name__}: {e}"))
+        db.commit()
+        return 'failed'
+    finally:
+        db.close()
+
+
+def start_background(run_id: int, concurrency: int = None):
+    cancel = threading.Event()
+    _cancel_events[run_id] = cancel
+    t = threading.Thread(target=process_run, args=(run_id, concurrency, None, cancel), name=f"retriage-run-{run_id}", daemon=True)
+    t.start()
+    return t
+
+
+def cancel(run_id: int) -> bool:
+    ev = _cancel_events.get(run_id)
+    if ev is None:
+        return False
+    ev.set()
+    return True
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Re-triage stored complaints in bulk")
+    parser.add_argument('--after-id', type=int, default=0, help="start after this complaint id")
+    parser.add_argument('--resume', type=int, default=None, metavar='RUN_ID', help="continue an interrupted run")
+    parser.add_argument('--chunk-size', type=int, default=None)
+    parser.add_argument('--batch-size', type=int, default=None)
+    parser.add_argument('--concurrency', type=int, default=None)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    init_db()
+    if args.resume:
+        run_id = resume_run(args.resume)
+    else:
+        run_id = start_run(args.after_id, args.chunk_size, args.batch_size)
+
+    def progress(done, total, last_id):
+        print(f"run {run_id}: {done}/{total or '?'} complaints (last id {last_id})", flush=True)
+
+    status = process_run(run_id, args.concurrency, progress)
+    print(f"run {run_id}: {status}")
+    return 0 if status == 'done' else 1
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -1,8 +1,10 @@
-from fastapi import APIRouter, Header, HTTPException
+from fastapi import APIRouter, Header, HTTPException, Query, Response
 from ..database import SessionLocal
-from ..models import Complaint
+from typing import Optional
+from ..models import Complaint, Job, RetriageRun
 from ..config import ADMIN_API_KEY
-from ..utils.serializers import complaint_to_dict
+from ..utils.serializers import complaint_to_dict, job_to_dict, retriage_run_to_dict
+from ..utils.pagination import complaint_filters, complaint_listing
 
 router = APIRouter()
 
@@ -12,13 +14,35 @@ def check_api_key(x_api_key: str = Header(None)):
         raise HTTPException(status_code=401, detail="Unauthorized")
 
 @router.get("/admin/complaints")
-def list_all_complaints(x_api_key: str = Header(None)):
+def list_all_complaints(response: Response, x_api_key: str = Header(None), status: Optional[str] = None,
+                        severity: Optional[str] = None, department: Optional[str] = None, date_from: Optional[str] = None,
+                        date_to: Optional[str] = None, category: Optional[str] = None, keyword: Optional[str] = None,
+                        limit: Optional[int] = Query(None, ge=1), cursor: Optional[str] = None,
+                        fields: Optional[str] = None, order: str = "asc", format: str = "json"):
     check_api_key(x_api_key)
-    db = SessionLocal()
-    items = db.query(Complaint).all()
-    resp = [complaint_to_dict(c) for c in items]
-    db.close()
-    return resp
+    filters = complaint_filters(status, severity, department, date_from, date_to, category, keyword)
+    return complaint_listing(response, filters, limit=limit, cursor=cursor, fields=fields, order=order, format=format)
+
+@router.get("/admin/export")
+def export_complaints(x_api_key: str = Header(None), format: str = "ndjson", columns: Optional[str] = None,
+                      date_from: Optional[str] = None, date_to: Optional[str] = None, after: Optional[str] = None,
+                      chunk_size: Optional[int] = Query(None, ge=1, le=100000)):
+    """Stream every matching complaint added or changed after `after`; X-Export-Watermark is the `after` of the next run."""
+    check_api_key(x_api_key)
+    import sqlite3
+    from fastapi.responses import StreamingResponse
+    from ..export import Export, output_kind
+    try:
+        export = Export(format, columns, date_from, date_to, after, chunk_size)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except sqlite3.Error as e:
+        raise HTTPException(status_code=503, detail=f"Database unavailable: {e}")
+    extension, media_type = output_kind(format)
+    return StreamingResponse(export.stream(), media_type=media_type, headers={
+        "X-Export-Watermark": export.watermark,
+        "Content-Disposition": f'attachment; filename="complaints.{extension}"',
+    })
 
 @router.post("/admin/alert/{id}")
 def manual_alert(id: int, x_api_key: str = Header(None)):
@@ -44,3 +68,163 @@ def get_complaint_detail(id: int, x_api_key: str = Header(None)):
     if not c:
         raise HTTPException(status_code=404, detail="Not found")
     return complaint_to_dict(c)
+
+
+@router.get("/admin/jobs")
+def list_jobs(status: Optional[str] = None, complaint_id: Optional[int] = None, limit: int = 100, x_api_key: str = Header(None)):
+    check_api_key(x_api_key)
+    db = SessionLocal()
+    q = db.query(Job)
+    if status:
+        q = q.filter(Job.status == status)
+    if complaint_id is not None:
+        q = q.filter(Job.complaint_id == complaint_id)
+    items = q.order_by(Job.id.desc()).limit(limit).all()
+    resp = [job_to_dict(j) for j in items]
+    db.close()
+    return resp
+
+
+@router.post("/admin/jobs/{id}/retry")
+def retry_job(id: int, x_api_key: str = Header(None)):
+    check_api_key(x_api_key)
+    from ..job_queue import requeue_job
+    if not requeue_job(id):
+        raise HTTPException(status_code=404, detail="No dead-lettered job with that id")
+    return {"id": id, "status": "queued"}
+
+
+@router.get("/admin/llm_cache")
+def llm_cache_stats(x_api_key: str = Header(None)):
+    check_api_key(x_api_key)
+    from ..llm_cache import cache
+    return cache.stats()
+
+
+@router.delete("/admin/llm_cache")
+def llm_cache_clear(x_api_key: str = Header(None)):
+    check_api_key(x_api_key)
+    from ..llm_cache import cache
+    cache.clear()
+    return {"cleared": True}
+
+
+@router.get("/admin/llm_limits")
+def llm_limits(x_api_key: str = Header(None)):
+    check_api_key(x_api_key)
+    from ..llm_utils import limiter_stats
+    return limiter_stats()
+
+
+@router.get("/admin/llm_usage")
+def llm_usage(x_api_key: str = Header(None), top: int = Query(10, ge=0, le=100)):
+    """Prompt/completion tokens and LLM time per triaged ticket, with the costliest tickets."""
+    check_api_key(x_api_key)
+    from sqlalchemy import func
+    db = SessionLocal()
+    try:
+        used = Complaint.llm_calls > 0
+        tickets, calls, prompt, completion, ms = db.query(
+            func.count(), func.sum(Complaint.llm_calls), func.sum(Complaint.prompt_tokens),
+            func.sum(Complaint.completion_tokens), func.sum(Complaint.llm_ms),
+        ).filter(used).one()
+        costliest = db.query(Complaint.id, Complaint.prompt_tokens, Complaint.completion_tokens, Complaint.llm_ms) \
+            .filter(used).order_by((Complaint.prompt_tokens + Complaint.completion_tokens).desc()).limit(top).all()
+    finally:
+        db.close()
+    per_ticket = lambda total: round(total / tickets, 1) if tickets else None
+    return {
+        "tickets": tickets,
+        "llm_calls": calls or 0,
+        "prompt_tokens": prompt or 0,
+        "completion_tokens": completion or 0,
+        "avg_prompt_tokens": per_ticket(prompt or 0),
+        "avg_completion_tokens": per_ticket(completion or 0),
+        "avg_llm_ms": per_ticket(ms or 0),
+        "costliest": [{"id": r.id, "prompt_tokens": r.prompt_tokens, "completion_tokens": r.completion_tokens,
+                       "llm_ms": r.llm_ms} for r in costliest],
+    }
+
+
+@router.get("/admin/db")
+def database_stats(x_api_key: str = Header(None)):
+    """SQLite pragmas in effect, connection pool usage and writer-lock contention."""
+    check_api_key(x_api_key)
+    from ..database import db_stats
+    return db_stats()
+
+
+@router.get("/admin/alerts")
+def alert_stats(x_api_key: str = Header(None)):
+    check_api_key(x_api_key)
+    from ..alert_digest import digest
+    return digest.snapshot()
+
+
+@router.get("/admin/outbox")
+def outbox_stats(x_api_key: str = Header(None)):
+    """Outgoing mail queue depth, send latency and SMTP pool usage."""
+    check_api_key(x_api_key)
+    from ..outbox import outbox_stats
+    return outbox_stats()
+
+
+@router.post("/admin/outbox/{id}/retry")
+def retry_outbox_message(id: int, x_api_key: str = Header(None)):
+    check_api_key(x_api_key)
+    from ..outbox import requeue_message
+    if not requeue_message(id):
+        raise HTTPException(status_code=404, detail="No dead-lettered message with that id")
+    return {"id": id, "status": "queued"}
+
+
+@router.get("/admin/ingest")
+def ingest_stats(x_api_key: str = Header(None)):
+    """Throughput of the email ingest stages and depth of the triage/acknowledgement queues."""
+    check_api_key(x_api_key)
+    from ..ingest_pipeline import pipeline_stats
+    return pipeline_stats()
+
+
+@router.get("/admin/local_model")
+def local_model_stats(x_api_key: str = Header(None)):
+    """How many tickets the local classifier handled, and how often escalated ones agreed with the LLM."""
+    check_api_key(x_api_key)
+    from ..local_model import runtime_stats
+    return runtime_stats()
+
+
+@router.post("/admin/retriage", status_code=202)
+def start_retriage(after_id: int = 0, resume_run_id: Optional[int] = None, chunk_size: Optional[int] = None,
+                   batch_size: Optional[int] = None, concurrency: Optional[int] = None, x_api_key: str = Header(None)):
+    check_api_key(x_api_key)
+    from .. import retriage
+    if resume_run_id is not None:
+        try:
+            run_id = retriage.resume_run(resume_run_id)
+        except LookupError:
+            raise HTTPException(status_code=404, detail="Not found")
+    else:
+        run_id = retriage.start_run(after_id, chunk_size, batch_size)
+    retriage.start_background(run_id, concurrency)
+    return {"run_id": run_id, "status": "running"}
+
+
+@router.get("/admin/retriage/{run_id}")
+def retriage_status(run_id: int, x_api_key: str = Header(None)):
+    check_api_key(x_api_key)
+    db = SessionLocal()
+    r = db.get(RetriageRun, run_id)
+    db.close()
+    if not r:
+        raise HTTPException(status_code=404, detail="Not found")
+    return retriage_run_to_dict(r)
+
+
+@router.post("/admin/retriage/{run_id}/cancel")
+def cancel_retriage(run_id: int, x_api_key: str = Header(None)):
+    check_api_key(x_api_key)
+    from .. import retriage
+    if not retriage.cancel(run_id):
+        raise HTTPException(status_code=404, detail="No active run with that id in this process")
+    return {"run_id": run_id, "cancelling": True}
@@ -1,11 +1,13 @@
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Response
+from sqlalchemy.exc import IntegrityError
 from pydantic import BaseModel
 from typing import Optional, List
 from ..database import SessionLocal, init_db
-from ..models import Complaint
-from ..utils.serializers import complaint_to_dict
-from ..utils.router import process_and_route
-from ..utils.notifier import send_acknowledgement
+from ..models import Complaint, Job
+from ..utils.serializers import complaint_to_dict, job_to_dict
+from ..utils.pagination import complaint_filters, complaint_listing
+from ..job_queue import enqueue, notify
+from .. import summary, sla_monitor, dedup
 from datetime import datetime
 
 router = APIRouter()
@@ -17,66 +19,100 @@ class SubmitComplaint(BaseModel):
     subject: Optional[str] = None
     channel: Optional[str] = "Web"
 
-@router.post("/submit_complaint")
-def submit_complaint(payload: SubmitComplaint):
+@router.post("/submit_complaint", status_code=202)
+def submit_complaint(payload: SubmitComplaint, response: Response, idempotency_key: Optional[str] = Header(None)):
     db = SessionLocal()
-    c = Complaint(
-        customer_name=payload.customer_name,
-        customer_email=payload.customer_email,
-        channel=payload.channel,
-        subject=payload.subject,
-        description=payload.complaint_description,
-        received_at=datetime.utcnow()
-    )
-    db.add(c)
-    db.commit()
-    db.refresh(c)
+    try:
+        if idempotency_key:
+            existing = db.query(Complaint).filter(Complaint.idempotency_key == idempotency_key).first()
+            if existing:
+                return _replay(db, existing, response)
+        now = datetime.utcnow()
+        c = Complaint(
+            customer_name=payload.customer_name,
+            customer_email=payload.customer_email,
+            channel=payload.channel,
+            subject=payload.subject,
+            description=payload.complaint_description,
+            received_at=now,
+            sla_due_at=sla_monitor.sla_due_at(now, None),  # refined once triage assigns a severity
+            idempotency_key=idempotency_key,
+        )
+        db.add(c)
+        try:
+            db.flush()
+        except IntegrityError:
+            # the same key committed by a concurrent request
+            db.rollback()
+            return _replay(db, db.query(Complaint).filter(Complaint.idempotency_key == idempotency_key).one(), response)
+        original_id = dedup.link_if_duplicate(db, c)
+        summary.record_change(db, None, summary.snapshot(c))
+        # Triage and acknowledgement run on the background job workers; the job is
+        # committed together with the complaint so nothing is lost on a crash.
+        # A near-duplicate is linked to the earlier ticket instead of being triaged again; it is only acknowledged.
+        job = enqueue(db, 'triage', c.id) if original_id is None else None
+        if original_id is not None:
+            enqueue(db, 'acknowledge', c.id)
+        db.commit()
+        db.refresh(c)
+        notify()
 
-    # Process classification/routing
-    result = process_and_route(c.id)
+        return {"id": c.id, "job_id": job.id if job else None, "status": "queued" if job else "duplicate",
+                "duplicate_of": original_id, "complaint": complaint_to_dict(c)}
+    finally:
+        db.close()
 
-    # Send acknowledgement
-    send_acknowledgement(c.id)
 
-    resp = {"id": c.id, "processed": result, "complaint": complaint_to_dict(c)}
-    db.close()
-    return resp
+def _replay(db, c, response):
+    """Response for a repeated Idempotency-Key: the ticket created the first time."""
+    response.status_code = 200
+    job = db.query(Job).filter(Job.kind == 'triage', Job.complaint_id == c.id).order_by(Job.id).first()
+    return {"id": c.id, "job_id": job.id if job else None, "status": "existing",
+            "duplicate_of": c.duplicate_of, "complaint": complaint_to_dict(c)}
 
 @router.get("/get_complaints")
-def get_complaints(status: Optional[str] = None, severity: Optional[str] = None, department: Optional[str] = None, date_from: Optional[str] = None, date_to: Optional[str] = None):
+def get_complaints(response: Response, status: Optional[str] = None, severity: Optional[str] = None, department: Optional[str] = None,
+                   date_from: Optional[str] = None, date_to: Optional[str] = None, category: Optional[str] = None,
+                   keyword: Optional[str] = None, limit: Optional[int] = Query(None, ge=1),
+                   cursor: Optional[str] = None, fields: Optional[str] = None, order: str = "asc", format: str = "json"):
+    # Keyset-paginated: pass the X-Next-Cursor response header back as `cursor` for the next page
+    filters = complaint_filters(status, severity, department, date_from, date_to, category, keyword)
+    return complaint_listing(response, filters, limit=limit, cursor=cursor, fields=fields, order=order, format=format)
+
+@router.get("/jobs/{job_id}")
+def get_job(job_id: int):
     db = SessionLocal()
-    q = db.query(Complaint)
-    if status:
-        q = q.filter(Complaint.status == status)
-    if severity:
-        q = q.filter(Complaint.severity == severity)
-    if department:
-        q = q.filter(Complaint.department == department)
-    if date_from:
-        q = q.filter(Complaint.created_at >= date_from)
-    if date_to:
-        q = q.filter(Complaint.created_at <= date_to)
-    items = q.all()
-    resp = [complaint_to_dict(c) for c in items]
+    j = db.query(Job).filter(Job.id == job_id).first()
     db.close()
-    return resp
+    if not j:
+        raise HTTPException(status_code=404, detail="Not found")
+    return job_to_dict(j)
 
 @router.get("/get_summary")
 def get_summary():
     db = SessionLocal()
-    total = db.query(Complaint).count()
-    by_category = {}
-    by_severity = {}
-    sla_violations = db.query(Complaint).filter(Complaint.sla_violation == True).count()
-    complaints = db.query(Complaint).all()
-    for c in complaints:
-        cats = (c.categories or 'Others').split(',')
-        for cat in cats:
-            by_category[cat] = by_category.get(cat, 0) + 1
-        sev = c.severity or 'Medium'
-        by_severity[sev] = by_severity.get(sev, 0) + 1
-    db.close()
-    return {"total": total, "by_category": by_category, "by_severity": by_severity, "sla_violations": sla_violations}
+    try:
+        return summary.get_summary(db)
+    finally:
+        db.close()
+
+@router.get("/search")
+def search_complaints(response: Response, q: str, status: Optional[str] = None, severity: Optional[str] = None,
+                      department: Optional[str] = None, date_from: Optional[str] = None, date_to: Optional[str] = None,
+                      limit: Optional[int] = Query(None, ge=1), cursor: Optional[str] = None, fields: Optional[str] = None):
+    # Ranked full-text search over subject, description and keywords; pages continue from X-Next-Cursor
+    from ..search import search
+    filters = complaint_filters(status, severity, department, date_from, date_to)
+    return search(response, q, filters, limit=limit, cursor=cursor, fields=fields)
+
+@router.get("/stats/keywords")
+def keyword_trends(days: int = Query(7, ge=1, le=365), limit: int = Query(20, ge=1, le=200)):
+    # most frequent keywords of the last `days`, next to their count in the `days` before
+    db = SessionLocal()
+    try:
+        return summary.trending_keywords(db, days, limit)
+    finally:
+        db.close()
 
 @router.patch("/update_status/{id}")
 def update_status(id: int, status: str):
@@ -85,12 +121,16 @@ def update_status(id: int, status: str):
     if not c:
         db.close()
         raise HTTPException(status_code=404, detail="Not found")
+    before = summary.snapshot(c)
     c.status = status
+    summary.record_change(db, before, summary.snapshot(c))
     if status == 'Resolved':
         c.resolved_at = datetime.utcnow()
     db.add(c)
     db.commit()
     db.close()
+    # a reopened ticket is back on the scanner's watch list
+    sla_monitor.notify()
     return {"id": id, "status": status}
 
 @router.post("/trigger_ingest")
@@ -0,0 +1,132 @@
+"""Full-text search over complaints (GET /search).
+
+`complaints_fts` is an FTS5 index over subject, description and keywords (see app.models), kept in
+step with the complaints table by triggers. Results are ranked by BM25 with SEARCH_WEIGHTS per column
+and carry a highlighted snippet of the best-matching column. Like the complaint listings, pages
+continue from an opaque cursor, here holding the last row's (score, id).
+
+Query syntax: words are ANDed and stemmed ("refunds" finds "refund"), "a phrase" in double quotes,
+word* for a prefix, and OR between two terms. Anything else is treated as plain text, so user input
+never reaches FTS5 as raw query syntax.
+
+    python -m app.search rebuild    # re-index every complaint from the table
+    python -m app.search optimize   # merge the index segments after a large import
+"""
+import argparse
+import base64
+import json
+import logging
+import re
+from fastapi import HTTPException
+from sqlalchemy import select, table, column, literal_column, func, tuple_, literal
+from sqlalchemy.exc import OperationalError
+from . import config
+from .database import engine, init_db
+from .models import Complaint
+from .utils.pagination import parse_fields
+from .utils.serializers import complaint_to_dict
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_FIELDS = "id,subject,status,severity,department,created_at"
+
+_fts = table("complaints_fts", column("rowid"))
+_fts_ref = literal_column("complaints_fts")
+_TERM_RE = re.compile(r'"([^"]*)"?|(\S+)')
+_WORD_RE = re.compile(r"\w+")
+
+
+def fts_query(q: str) -> str:
+    """User query -> FTS5 MATCH expression of quoted terms; '' when it has no searchable words."""
+    parts = []
+    for phrase, word in _TERM_RE.findall(q or ''):
+        if word == 'OR':
+            if parts and parts[-1] != 'OR':
+                parts.append('OR')
+            continue
+        tokens = _WORD_RE.findall((phrase or word).lower())
+        if not tokens:
+            continue
+        prefix = '*' if word.endswith('*') else ''
+        parts.append('"' + ' '.join(tokens) + '"' + prefix)
+    if parts and parts[-1] == 'OR':
+        parts.pop()
+    return ' '.join(parts)
+
+
+def _encode_cursor(score: float, complaint_id: int) -> str:
+    raw = json.dumps([score, complaint_id], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def _decode_cursor(cursor: str):
+    try:
+        score, complaint_id = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        return float(score), int(complaint_id)
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+
+def build_search_query(match: str, fields: list, filters: list = (), cursor: str = None, limit: int = None):
+    """Matching complaints, best first: the `fields` columns plus BM25 score and a highlighted snippet."""
+    columns = []
+    for f in fields:
+        col = getattr(Complaint, f)
+        if col not in columns:
+            columns.append(col)
+    score = func.bm25(_fts_ref, *config.SEARCH_WEIGHTS)
+    snippet = func.snippet(_fts_ref, -1, '<mark>', '</mark>', '…', config.SEARCH_SNIPPET_TOKENS)
+    stmt = (
+        select(*columns, score.label("_score"), snippet.label("_snippet"), Complaint.id.label("_id"))
+        .select_from(_fts.join(Complaint, Complaint.id == _fts.c.rowid))
+        .where(_fts_ref.op("MATCH")(match), *filters)
+    )
+    if cursor:
+        after_score, after_id = _decode_cursor(cursor)
+        stmt = stmt.where(tuple_(score, Complaint.id) > tuple_(literal(after_score), literal(after_id)))
+    # bm25() is lower for better matches
+    stmt = stmt.order_by(score, Complaint.id)
+    if limit is not None:
+        stmt = stmt.limit(limit)
+    return stmt
+
+
+def search(response, q: str, filters: list = (), limit: int = None, cursor: str = None, fields: str = None):
+    """Body of GET /search: one page of ranked matches, the next cursor in X-Next-Cursor."""
+    match = fts_query(q)
+    if not match:
+        raise HTTPException(status_code=400, detail="q must contain at least one word")
+    try:
+        names = parse_fields(fields or DEFAULT_FIELDS)
+        if cursor:
+            _decode_cursor(cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    limit = min(limit or config.SEARCH_PAGE_SIZE, config.SEARCH_MAX_PAGE_SIZE)
+    try:
+        with engine.connect() as conn:
+            rows = conn.execute(build_search_query(match, names, filters, cursor, limit + 1)).all()
+    except OperationalError as e:
+        logger.warning("Search %r (%s) failed: %s", q, match, e)
+        raise HTTPException(status_code=400, detail="Unsupported search query")
+    if len(rows) > limit:
+        rows = rows[:limit]
+        response.headers["X-Next-Cursor"] = _encode_cursor(rows[-1]._score, rows[-1]._id)
+    return [dict(complaint_to_dict(r, names), score=-r._score, snippet=r._snippet) for r in rows]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Maintain the complaints full-text index")
+    parser.add_argument('command', choices=['rebuild', 'optimize'])
+    args = parser.parse_args(argv)
+
+    init_db()
+    with engine.begin() as conn:
+        conn.exec_driver_sql("INSERT INTO complaints_fts (complaints_fts) VALUES (?)", (args.command,))
+    print(f"complaints_fts: {args.command} done")
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
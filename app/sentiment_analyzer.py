@@ -1,32 +1,159 @@
-from textblob import TextBlob
-from .llm_utils import call_llm
-from .config import LLM_MODEL
+import importlib.util
 import logging
+import os
+import re
+import threading
+from xml.etree import ElementTree
+from . import config
+from .llm_utils import call_llm, fit_text
 
 logger = logging.getLogger(__name__)
 
+NEGATIONS = frozenset(("no", "not", "n't", "never"))
+# URLs and e-mail addresses stay single (unknown) tokens so words inside them are not scored
+_TOKEN_RE = re.compile(r"(?:https?://|www\.)\S+|[^\s@]+@\S+|n't|[a-z0-9][a-z0-9'-]*|[^\sa-z0-9]")
+
+# word -> (polarity, subjectivity, intensity, is_modifier), loaded once
+_lexicon = None
+_lexicon_lock = threading.Lock()
+
+
+def _default_lexicon_path():
+    spec = importlib.util.find_spec("textblob")
+    if spec is None or not spec.submodule_search_locations:
+        return None
+    return os.path.join(list(spec.submodule_search_locations)[0], "en", "en-sentiment.xml")
+
+
+def load_lexicon(path: str = None) -> dict:
+    """Parse the pattern/TextBlob sentiment lexicon into {word: (polarity, subjectivity, intensity, is_modifier)}.
+
+    Scores of all senses are averaged per part of speech and then across parts of speech, as TextBlob
+    does; adverbs (RB) act as intensity modifiers for the next word.
+    """
+    global _lexicon
+    with _lexicon_lock:
+        if _lexicon is not None and path is None:
+            return _lexicon
+        path = path or config.SENTIMENT_LEXICON_PATH or _default_lexicon_path()
+        senses = {}
+        if path and os.path.exists(path):
+            for _, el in ElementTree.iterparse(path):
+                if el.tag != "word":
+                    continue
+                form = el.get("form")
+                if form:
+                    psi = (float(el.get("polarity", 0.0)), float(el.get("subjectivity", 0.0)), float(el.get("intensity", 1.0)))
+                    senses.setdefault(form, {}).setdefault(el.get("pos"), []).append(psi)
+                el.clear()
+        else:
+            logger.warning("Sentiment lexicon not found (%s); every text will score Neutral", path)
+
+        lexicon = {}
+        adverbs = {}
+        for form, by_pos in senses.items():
+            per_pos = {pos: tuple(sum(v) / len(v) for v in zip(*psis)) for pos, psis in by_pos.items()}
+            p, s, i = (sum(v) / len(v) for v in zip(*per_pos.values()))
+            lexicon[form] = (p, s, i, "RB" in by_pos)
+            if "JJ" in per_pos:
+                # "terrible" -> "terribly", "real" -> "really" (these override the lexicon's own adverbs)
+                stem = form[:-1] + "i" if form.endswith("y") else form
+                stem = stem[:-2] if stem.endswith("le") else stem
+                adverbs[stem + "ly"] = per_pos["JJ"] + (True,)
+        lexicon.update(adverbs)
+        _lexicon = lexicon
+        logger.info("Loaded sentiment lexicon: %d words from %s", len(lexicon), path)
+        return _lexicon
+
+
+def _clamp(x: float) -> float:
+    return -1.0 if x < -1.0 else 1.0 if x > 1.0 else x
+
+
+def score_many(texts) -> list:
+    """Polarity in [-1, 1] for each text, in one pass over the tokens with the lexicon held in memory.
+
+    Known words are averaged; a preceding adverb scales the next word by its intensity ("very good"),
+    a negation flips and halves it ("not good" = slightly bad), and "!" boosts the previous word.
+    """
+    lex = _lexicon if _lexicon is not None else load_lexicon()
+    get = lex.get
+    findall = _TOKEN_RE.findall
+    out = []
+    for text in texts:
+        ps = []  # [polarity, intensity, negated] per assessed word
+        m = None  # preceding modifier word
+        n = None  # preceding negation
+        for w in findall((text or "").lower().replace("n't", " n't")):
+            entry = get(w)
+            if entry is not None:
+                p, _, i, is_mod = entry
+                if m is None:
+                    ps.append([p, i, False])
+                else:
+                    cur = ps[-1]
+                    cur[0] = _clamp(p * cur[1])
+                    cur[1] = i
+                if n is not None:
+                    ps[-1][1] = 1.0 / ps[-1][1] if ps[-1][1] else 1.0
+                    ps[-1][2] = True
+                m = w if is_mod else None
+                n = w if w in NEGATIONS else None
+            else:
+                if w in NEGATIONS:
+                    n = w
+                elif n and len(w.strip("'")) > 1:
+                    n = None
+                if n is not None and m is not None and m.endswith("ly"):
+                    # "really not good"
+                    ps[-1][2] = True
+                    n = None
+                elif m and len(w) > 2:
+                    m = None
+                if w == "!" and ps:
+                    ps[-1][0] = _clamp(ps[-1][0] * 1.25)
+        if ps:
+            out.append(sum(p * -0.5 if neg else p for p, _, neg in ps) / len(ps))
+        else:
+            out.append(0.0)
+    return out
+
+
+def score(text: str) -> float:
+    return score_many([text])[0]
+
+
+def polarity_label(polarity: float) -> str:
+    if polarity > 0.1:
+        return "Positive"
+    if polarity < -0.1:
+        return "Negative"
+    return "Neutral"
+
+
+def local_sentiment_many(texts) -> list:
+    return [polarity_label(p) for p in score_many(texts)]
+
 
 def analyze_sentiment(text: str):
-    # Try LLM first (if available)
-    try:
-        prompt = "Detect sentiment of the following text as Positive, Neutral, or Negative. Return only the label.\nText:\n" + text
-        resp = call_llm(prompt)
-        if resp:
-            label = resp.strip().splitlines()[0]
-            if label.lower() in ["positive", "neutral", "negative"]:
-                return label.capitalize()
-    except Exception:
-        logger.exception("LLM sentiment failed, falling back to TextBlob")
+    # The LLM is only asked when enabled; the lexicon scorer is the default
+    if config.LLM_SENTIMENT:
+        try:
+            prompt = "Detect sentiment of the following text as Positive, Neutral, or Negative. Return only the label.\nText:\n" + fit_text(text)
+            resp = call_llm(prompt, max_tokens=config.LLM_MAX_TOKENS["sentiment"])
+            if resp:
+                label = resp.strip().splitlines()[0]
+                if label.lower() in ["positive", "neutral", "negative"]:
+                    return label.capitalize()
+        except Exception:
+            logger.exception("LLM sentiment failed, falling back to the lexicon scorer")
 
-    # Fallback to TextBlob
+    return local_sentiment(text)
+
+
+def local_sentiment(text: str):
     try:
-        tb = TextBlob(text)
-        polarity = tb.sentiment.polarity
-        if polarity > 0.1:
-            return "Positive"
-        if polarity < -0.1:
-            return "Negative"
-        return "Neutral"
+        return polarity_label(score(text))
     except Exception:
-        logger.exception("TextBlob sentiment failed")
+        logger.exception("Lexicon sentiment failed")
         return "Neutral"
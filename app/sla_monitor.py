@@ -1,51 +1,117 @@
 import threading
-import time
 import logging
 from datetime import datetime, timedelta
+from sqlalchemy import select, update, func, text
 from .database import SessionLocal
 from .models import Complaint
 from .config import SLA_THRESHOLDS
-from .utils.notifier import alert_admin
+from . import config
+from .summary import record_changes, split_categories
+from .alert_digest import digest
 from sqlalchemy.exc import OperationalError
 
 logger = logging.getLogger(__name__)
 
+# set when a complaint gets a new deadline, so a sleeping scanner re-plans its wait
+_wakeup = threading.Event()
 
-def check_sla_once():
+# Distinct statuses by jumping through ix_complaints_sla one index seek at a time, so the scans below
+# can use (status = ? AND sla_violation = ? AND sla_due_at <= ?) ranges instead of `status != 'Resolved'`.
+_STATUSES = text(
+    "WITH RECURSIVE s(status) AS ("
+    " SELECT MIN(status) FROM complaints"
+    " UNION ALL SELECT (SELECT MIN(status) FROM complaints WHERE status > s.status) FROM s WHERE s.status IS NOT NULL"
+    ") SELECT status FROM s WHERE status IS NOT NULL"
+)
+
+
+def sla_due_at(created_at, severity):
+    """Deadline for a complaint created at `created_at` with `severity` (None counts as Medium)."""
+    if created_at is None:
+        return None
+    return created_at + timedelta(hours=SLA_THRESHOLDS.get(severity or 'Medium', 72))
+
+
+def notify():
+    _wakeup.set()
+
+
+def _open_statuses(db):
+    return [s for (s,) in db.execute(_STATUSES) if s != 'Resolved']
+
+
+def check_sla_once(now: datetime = None):
+    """Flag newly overdue complaints with one bulk UPDATE and alert on each; returns how many were flagged."""
+    now = now or datetime.utcnow()
     db = SessionLocal()
-    now = datetime.utcnow()
     try:
-        complaints = db.query(Complaint).filter(Complaint.status != 'Resolved').all()
+        statuses = _open_statuses(db)
+        if not statuses:
+            return 0
+        rows = db.execute(
+            update(Complaint)
+            .where(Complaint.status.in_(statuses), Complaint.sla_violation == False, Complaint.sla_due_at <= now)
+            .values(sla_violation=True)
+            .returning(Complaint.id, Complaint.department, Complaint.severity, Complaint.subject, Complaint.status,
+                       Complaint.categories, Complaint.received_at, Complaint.created_at, Complaint.sla_due_at)
+        ).all()
+        record_changes(db, [
+            ((tuple(split_categories(r.categories)), r.severity, r.status, False),
+             (tuple(split_categories(r.categories)), r.severity, r.status, True))
+            for r in rows
+        ])
+        # the alerts are committed with the flag; the digest sender batches them into emails
+        digest.record(db, [
+            {"id": v.id, "department": v.department, "severity": v.severity, "subject": v.subject,
+             "received_at": v.received_at, "created_at": v.created_at, "sla_due_at": v.sla_due_at}
+            for v in rows
+        ], now)
+        db.commit()
     except OperationalError as e:
         logger.error("Database schema error during SLA check: %s", e)
-        db.close()
+        db.rollback()
         return 0
-    violations = []
-    for c in complaints:
-        severity = c.severity or 'Medium'
-        hours = SLA_THRESHOLDS.get(severity, 72)
-        due = c.created_at + timedelta(hours=hours) if c.created_at else None
-        if due and now > due and not c.sla_violation:
-            c.sla_violation = True
-            db.add(c)
-            violations.append(c)
-    db.commit()
-    db.close()
-
-    for v in violations:
-        subj = f"SLA Violation for Ticket #{v.id}"
-        msg = f"Ticket {v.id} assigned to {v.department} is overdue. Severity={v.severity}.\nSubject: {v.subject}\nReceived: {v.received_at}\nCreated: {v.created_at}"
-        alert_admin(subj, msg)
+    finally:
+        db.close()
+
+    for v in rows:
         logger.warning("SLA violation detected: %s", v.id)
+    if rows:
+        digest.notify()
+
+    return len(rows)
 
-    return len(violations)
+
+def next_deadline():
+    """Earliest sla_due_at among open, not yet flagged complaints (one index seek per status), or None."""
+    db = SessionLocal()
+    try:
+        earliest = None
+        for status in _open_statuses(db):
+            due = db.execute(
+                select(func.min(Complaint.sla_due_at))
+                .where(Complaint.status == status, Complaint.sla_violation == False, Complaint.sla_due_at.is_not(None))
+            ).scalar()
+            if due is not None and (earliest is None or due < earliest):
+                earliest = due
+        return earliest
+    finally:
+        db.close()
 
 
 def start_sla_loop(stop_event, interval_seconds=300):
+    """Scan, then sleep until the next deadline (at most `interval_seconds`) or until notify()."""
     while not stop_event.is_set():
+        timeout = interval_seconds
         try:
             n = check_sla_once()
-            logger.info("SLA check completed, violations=%s", n)
+            if n:
+                logger.info("SLA check completed, violations=%s", n)
+            due = next_deadline()
+            if due is not None:
+                wait = (due - datetime.utcnow()).total_seconds() + config.SLA_DEADLINE_SLACK
+                timeout = min(interval_seconds, max(config.SLA_MIN_SLEEP, wait))
         except Exception:
             logger.exception("Error in SLA loop")
-        time.sleep(interval_seconds)
+        _wakeup.wait(timeout)
+        _wakeup.clear()
@@ -0,0 +1,259 @@
+"""Complaint summary for GET /get_summary and keyword trends for GET /stats/keywords.
+
+Categories and keywords are normalized into `complaint_categories` and `complaint_keywords` so they
+can be counted with GROUP BY and filtered through an index. Each row carries the complaint's
+created_at, so a filtered listing and a time window are index range scans. With SUMMARY_COUNTERS on,
+every write that changes a counted field also applies the matching +1/-1 deltas to `summary_counters`
+in the same transaction, and the summary becomes a read of a few dozen rows.
+
+    python -m app.summary check     # compare the counters with a GROUP BY recount (exit 1 on drift)
+    python -m app.summary rebuild   # refill the category and keyword rows and recompute the counters
+"""
+import argparse
+import json
+import logging
+from collections import Counter
+from datetime import datetime, timedelta
+from sqlalchemy import select, func, delete, exists, bindparam, type_coerce, String
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from . import config
+from .database import SessionLocal, init_db
+from .migrations import backfill_done
+from .models import Complaint, ComplaintCategory, ComplaintKeyword, SummaryCounter
+
+logger = logging.getLogger(__name__)
+
+# the migration whose backfill fills the category rows and counters for complaints stored before them
+COUNTERS_MIGRATION = 10
+_counters_ready = False
+
+# defaults the summary has always used for untriaged complaints
+DEFAULT_CATEGORY = 'Others'
+DEFAULT_SEVERITY = 'Medium'
+DEFAULT_STATUS = 'New'
+
+
+def split_categories(value) -> list:
+    if isinstance(value, (list, tuple)):
+        items = value
+    else:
+        items = (value or '').split(',')
+    return list(dict.fromkeys(s.strip() for s in items if s and s.strip()))
+
+
+def split_keywords(value) -> list:
+    return list(dict.fromkeys(k.lower() for k in split_categories(value)))
+
+
+def snapshot(c) -> tuple:
+    """The counted fields of a complaint (ORM instance or row): (categories, severity, status, sla_violation)."""
+    return (tuple(split_categories(c.categories)), c.severity, c.status, bool(c.sla_violation))
+
+
+def buckets(snap) -> list:
+    categories, severity, status, sla_violation = snap
+    out = [('total', '')]
+    out += [('category', cat) for cat in (categories or (DEFAULT_CATEGORY,))]
+    out.append(('severity', severity or DEFAULT_SEVERITY))
+    out.append(('status', status or DEFAULT_STATUS))
+    if sla_violation:
+        out.append(('sla_violation', ''))
+    return out
+
+
+def record_changes(db, changes):
+    """Apply counter deltas for (before, after) snapshot pairs; None stands for "no row"."""
+    if not config.SUMMARY_COUNTERS:
+        return
+    deltas = Counter()
+    for before, after in changes:
+        if before is not None:
+            deltas.subtract(buckets(before))
+        if after is not None:
+            deltas.update(buckets(after))
+    params = [{"dimension": d, "bucket": b, "count": n} for (d, b), n in deltas.items() if n]
+    if not params:
+        return
+    stmt = sqlite_insert(SummaryCounter)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[SummaryCounter.dimension, SummaryCounter.bucket],
+        set_={"count": SummaryCounter.count + stmt.excluded.count},
+    )
+    db.execute(stmt, params)
+
+
+def record_change(db, before, after):
+    record_changes(db, [(before, after)])
+
+
+def _set_tags(db, model, column, values_by_id: dict, split):
+    if not values_by_id:
+        return
+    db.execute(delete(model).where(model.complaint_id.in_(list(values_by_id))))
+    rows = [{"cid": cid, "tag": tag} for cid, values in values_by_id.items() for tag in split(values)]
+    if rows:
+        # created_at is copied as stored, so the tag index orders rows exactly like the complaint listing
+        source = select(bindparam("cid"), bindparam("tag"), Complaint.created_at).where(Complaint.id == bindparam("cid"))
+        db.execute(sqlite_insert(model.__table__).from_select(["complaint_id", column.key, "created_at"], source)
+                   .on_conflict_do_nothing(), rows)
+
+
+def set_categories(db, categories_by_id: dict):
+    """Replace the complaint_categories rows of the given (already flushed) complaints."""
+    _set_tags(db, ComplaintCategory, ComplaintCategory.category, categories_by_id, split_categories)
+
+
+def set_keywords(db, keywords_by_id: dict):
+    """Replace the complaint_keywords rows of the given (already flushed) complaints."""
+    _set_tags(db, ComplaintKeyword, ComplaintKeyword.keyword, keywords_by_id, split_keywords)
+
+
+def _as_summary(counts: dict) -> dict:
+    return {
+        "total": counts.get(('total', ''), 0),
+        "by_category": {b: n for (d, b), n in counts.items() if d == 'category' and n},
+        "by_severity": {b: n for (d, b), n in counts.items() if d == 'severity' and n},
+        "by_status": {b: n for (d, b), n in counts.items() if d == 'status' and n},
+        "sla_violations": counts.get(('sla_violation', ''), 0),
+    }
+
+
+def recount(db) -> dict:
+    """Every counter computed from the complaint tables with GROUP BY: {(dimension, bucket): count}."""
+    counts = {('total', ''): db.execute(select(func.count(Complaint.id))).scalar()}
+    severity = func.coalesce(func.nullif(Complaint.severity, ''), DEFAULT_SEVERITY)
+    for sev, n in db.execute(select(severity, func.count()).group_by(severity)):
+        counts[('severity', sev)] = n
+    status = func.coalesce(func.nullif(Complaint.status, ''), DEFAULT_STATUS)
+    for st, n in db.execute(select(status, func.count()).group_by(status)):
+        counts[('status', st)] = n
+    for cat, n in db.execute(select(ComplaintCategory.category, func.count()).group_by(ComplaintCategory.category)):
+        counts[('category', cat)] = n
+    uncategorized = db.execute(
+        select(func.count(Complaint.id)).where(~exists().where(ComplaintCategory.complaint_id == Complaint.id))
+    ).scalar()
+    if uncategorized:
+        key = ('category', DEFAULT_CATEGORY)
+        counts[key] = counts.get(key, 0) + uncategorized
+    counts[('sla_violation', '')] = db.execute(select(func.count(Complaint.id)).where(Complaint.sla_violation == True)).scalar()
+    return {k: n for k, n in counts.items() if n}
+
+
+def stored_counts(db) -> dict:
+    return {(d, b): n for d, b, n in db.execute(select(SummaryCounter.dimension, SummaryCounter.bucket, SummaryCounter.count)) if n}
+
+
+def get_summary(db) -> dict:
+    if config.SUMMARY_COUNTERS and counters_ready(db):
+        counts = stored_counts(db)
+        if counts:
+            return _as_summary(counts)
+    return _as_summary(recount(db))
+
+
+def _stored_time(dt: datetime) -> str:
+    # the text form CURRENT_TIMESTAMP stores created_at in, so the comparison stays a range on the raw column
+    return dt.strftime('%Y-%m-%d %H:%M:%S')
+
+
+def trending_keywords(db, days: int = 7, limit: int = 20, now: datetime = None) -> dict:
+    """Most frequent keywords of the last `days`, with their count in the `days` before for comparison."""
+    now = now or datetime.utcnow()
+    start, previous_start = now - timedelta(days=days), now - timedelta(days=2 * days)
+    created = type_coerce(ComplaintKeyword.created_at, String)
+    n = func.count().label("n")
+    top = db.execute(
+        select(ComplaintKeyword.keyword, n).where(created >= _stored_time(start))
+        .group_by(ComplaintKeyword.keyword).order_by(n.desc(), ComplaintKeyword.keyword).limit(limit)
+    ).all()
+    previous = {}
+    if top:
+        previous = dict(db.execute(
+            select(ComplaintKeyword.keyword, func.count())
+            .where(ComplaintKeyword.keyword.in_([r.keyword for r in top]),
+                   created >= _stored_time(previous_start), created < _stored_time(start))
+            .group_by(ComplaintKeyword.keyword)
+        ).all())
+    return {
+        "since": start.isoformat(),
+        "days": days,
+        "keywords": [{"keyword": r.keyword, "count": r.n, "previous": previous.get(r.keyword, 0),
+                      "change": r.n - previous.get(r.keyword, 0)} for r in top],
+    }
+
+
+def drift(expected: dict, actual: dict) -> dict:
+    keys = set(expected) | set(actual)
+    return {f"{d}:{b}": {"expected": expected.get((d, b), 0), "stored": actual.get((d, b), 0)}
+            for d, b in sorted(keys) if expected.get((d, b), 0) != actual.get((d, b), 0)}
+
+
+def rebuild_tags(db, chunk_size: int = 1000) -> int:
+    """Refill complaint_categories and complaint_keywords from the Complaint columns, in id-ordered chunks."""
+    db.execute(delete(ComplaintCategory))
+    db.execute(delete(ComplaintKeyword))
+    last_id, n = 0, 0
+    while True:
+        rows = db.execute(
+            select(Complaint.id, Complaint.categories, Complaint.keywords)
+            .where(Complaint.id > last_id).order_by(Complaint.id).limit(chunk_size)
+        ).all()
+        if not rows:
+            return n
+        set_categories(db, {r.id: r.categories for r in rows if r.categories})
+        set_keywords(db, {r.id: r.keywords for r in rows if r.keywords})
+        last_id = rows[-1].id
+        n += len(rows)
+
+
+def reset_counters(db) -> dict:
+    """Replace summary_counters with a GROUP BY recount; returns the new counts."""
+    # deleting first takes SQLite's write lock, so no complaint write can slip in between recount and insert
+    db.execute(delete(SummaryCounter))
+    expected = recount(db)
+    if expected:
+        db.execute(sqlite_insert(SummaryCounter), [{"dimension": d, "bucket": b, "count": n} for (d, b), n in expected.items()])
+    return expected
+
+
+def rebuild(db) -> dict:
+    """Recompute the category/keyword rows and summary_counters from the complaints; returns the new counts."""
+    # rebuild_tags deletes first, so the write lock is held from here to the recount
+    rebuild_tags(db)
+    return reset_counters(db)
+
+
+def counters_ready(db) -> bool:
+    """False while migration 10 is still filling in the tag rows and counters of older complaints."""
+    global _counters_ready
+    if not _counters_ready:
+        _counters_ready = backfill_done(db, COUNTERS_MIGRATION)
+    return _counters_ready
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check or rebuild the materialized complaint summary")
+    parser.add_argument('command', choices=['check', 'rebuild'])
+    args = parser.parse_args(argv)
+
+    init_db()
+    db = SessionLocal()
+    try:
+        if args.command == 'check':
+            diff = drift(recount(db), stored_counts(db))
+            print(json.dumps(diff, indent=2) if diff else "summary counters are consistent")
+            return 1 if diff else 0
+        before = stored_counts(db)
+        expected = rebuild(db)
+        db.commit()
+        diff = drift(expected, before)
+        print(f"rebuilt {len(expected)} counters; corrected {len(diff)}")
+        if diff:
+            print(json.dumps(diff, indent=2))
+        return 0
+    finally:
+        db.close()
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -1,34 +1,197 @@
-from email import message
+"""Bounded body extraction for emailed complaints.
+
+Raw messages are fed to a `BytesFeedParser` in chunks, and feeding stops after EMAIL_MAX_BYTES, so a
+huge attachment is never fully parsed. Only text parts that are not attachments are decoded, and at most
+EMAIL_PART_MAX_BYTES of each; the encoded payload is cut before decoding. text/plain is preferred.
+text/html parts (a multipart/alternative without plain text, or an HTML-only message) go through a
+single linear scan that drops markup, scripts and styles. Quoted replies and signatures are stripped
+(EMAIL_STRIP_QUOTES) so they don't reach the LLM prompt. The result is capped at EMAIL_TEXT_MAX_CHARS.
+"""
+import base64
+import binascii
+import quopri
 import re
+from email import message
+from email.header import decode_header
+from email.feedparser import BytesFeedParser
+from email.policy import compat32
+from html import unescape
+from .. import config
+
+FEED_CHUNK = 64 * 1024
+
+_BASE64_JUNK = re.compile(r"[^A-Za-z0-9+/=]")
+_BLANK_RUNS = re.compile(r"\n{3,}")
+_SPACE_RUNS = re.compile(r"[ \t\r\f\v]+")
+_REPLY_HEADER = re.compile(r"^(on\s.{1,300}\swrote:|-{2,}\s*original message\s*-{2,}|_{20,})$", re.I)
+_MOBILE_SIGNATURE = re.compile(r"^(sent from my \w+|get outlook for \w+)", re.I)
+
+
+def parse_email_stream(chunks, max_bytes: int = None) -> message.Message:
+    """Build a Message from an iterable of byte chunks, ignoring everything after `max_bytes`."""
+    limit = config.EMAIL_MAX_BYTES if max_bytes is None else max_bytes
+    parser = BytesFeedParser(policy=compat32)
+    fed = 0
+    for chunk in chunks:
+        if limit and fed + len(chunk) > limit:
+            parser.feed(chunk[:limit - fed])
+            break
+        parser.feed(chunk)
+        fed += len(chunk)
+    return parser.close()
+
+
+def parse_email_bytes(raw: bytes, max_bytes: int = None) -> message.Message:
+    view = memoryview(raw)
+    return parse_email_stream((bytes(view[i:i + FEED_CHUNK]) for i in range(0, len(view), FEED_CHUNK)), max_bytes)
+
+
+def _to_bytes(s: str) -> bytes:
+    try:
+        return s.encode('ascii', 'surrogateescape')
+    except UnicodeEncodeError:
+        return s.encode('utf-8', 'replace')
+
+
+def decode_part(part: message.Message, limit: int) -> bytes:
+    """The first `limit` decoded bytes of a leaf part, decoding no more of the payload than that needs."""
+    payload = part.get_payload()
+    if not isinstance(payload, str):
+        return b""
+    cte = str(part.get('Content-Transfer-Encoding', '')).strip().lower()
+    if cte == 'base64':
+        # 4 characters per 3 bytes, plus room for the line breaks (76 characters per line)
+        encoded = _BASE64_JUNK.sub('', payload[:limit * 4 // 3 + limit // 50 + 8])
+        encoded = encoded[:len(encoded) // 4 * 4]
+        try:
+            return base64.b64decode(encoded)[:limit]
+        except (binascii.Error, ValueError):
+            return b""
+    if cte == 'quoted-printable':
+        return quopri.decodestring(_to_bytes(payload[:limit * 3]))[:limit]
+    return _to_bytes(payload[:limit])
+
+
+def _charset_decode(data: bytes, charset: str) -> str:
+    try:
+        return data.decode(charset or 'utf-8', errors='replace')
+    except LookupError:
+        return data.decode('utf-8', errors='replace')
+
+
+def header_text(value) -> str:
+    """A header as str: RFC 2047 encoded words decoded, raw 8-bit bytes read as UTF-8 (else Latin-1).
+
+    With compat32 a header holding raw non-ASCII bytes comes back as an `email.header.Header`, not a str.
+    """
+    if value is None:
+        return None
+    out = []
+    for chunk, charset in decode_header(value):
+        if isinstance(chunk, str):
+            out.append(chunk)
+        elif charset in (None, 'unknown-8bit'):
+            try:
+                out.append(chunk.decode('utf-8'))
+            except UnicodeDecodeError:
+                out.append(chunk.decode('latin-1'))
+        else:
+            out.append(_charset_decode(chunk, charset))
+    return "".join(out)
+
+
+_SKIP_TAGS = {'script', 'style', 'head', 'title', 'noscript', 'template'}
+_BLOCK_TAGS = {'p', 'div', 'br', 'tr', 'li', 'ul', 'ol', 'table', 'section', 'article', 'blockquote',
+               'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'hr', 'pre'}
+_TAG_NAME = re.compile(r"/?\s*([a-zA-Z][a-zA-Z0-9]*)")
+
+
+def html_to_text(html: str, max_chars: int = None) -> str:
+    """Visible text of an HTML document, with block elements on their own lines.
+
+    A single forward scan with str.find: every character is looked at a bounded number of times
+    whatever the markup (unclosed tags included), and the scan stops once `max_chars` of text are found.
+    """
+    max_chars = max_chars or config.EMAIL_TEXT_MAX_CHARS
+    lower = html.lower()
+    out, size, i, n = [], 0, 0, len(html)
+    while i < n and size < max_chars:
+        j = html.find('<', i)
+        if j < 0:
+            j = n
+        if j > i:
+            text = unescape(html[i:j])
+            out.append(text)
+            size += len(text)
+        if j >= n:
+            break
+        if html.startswith('<!--', j):
+            k = html.find('-->', j + 4)
+            i = n if k < 0 else k + 3
+            continue
+        k = html.find('>', j + 1)
+        if k < 0:
+            break  # an unclosed tag runs to the end of the document
+        m = _TAG_NAME.match(html, j + 1, k)
+        name = m.group(1).lower() if m else ''
+        closing = html[j + 1:j + 2] == '/'
+        i = k + 1
+        if name in _SKIP_TAGS and not closing and not html[j:k].endswith('/'):
+            end = lower.find('</' + name, i)
+            end = n if end < 0 else lower.find('>', end)
+            i = n if end < 0 else end + 1
+        elif name in _BLOCK_TAGS:
+            out.append("\n")
+    lines = (_SPACE_RUNS.sub(' ', line).strip() for line in "".join(out).split("\n"))
+    return _BLANK_RUNS.sub("\n\n", "\n".join(lines)).strip()
+
+
+def strip_quotes_and_signature(text: str) -> str:
+    """Drop quoted lines ("> ..."), everything from a reply header ("On ... wrote:") and the signature."""
+    lines = text.splitlines()
+    kept = []
+    for i, line in enumerate(lines):
+        s = line.strip()
+        nxt = lines[i + 1].strip() if i + 1 < len(lines) else ''
+        if s.startswith('>'):
+            continue
+        if line.rstrip() == '--' or _MOBILE_SIGNATURE.match(s):
+            break
+        if _REPLY_HEADER.match(s) or (s.lower().startswith('on ') and _REPLY_HEADER.match(f"{s} {nxt}")):
+            break
+        if s.lower().startswith('from:') and nxt.lower().startswith(('sent:', 'date:')):
+            break  # Outlook-style reply header
+        kept.append(line)
+    stripped = "\n".join(kept).strip()
+    return stripped or text.strip()  # nothing but a quote: keep it rather than lose the message
 
 
 def extract_text_from_email(msg: message.Message) -> str:
-    # Walk email parts to extract text/plain or fallback to html
-    text = []
-    if msg.is_multipart():
-        for part in msg.walk():
-            ctype = part.get_content_type()
-            disp = str(part.get('Content-Disposition'))
-            if ctype == 'text/plain' and 'attachment' not in disp:
-                payload = part.get_payload(decode=True)
-                if payload:
-                    try:
-                        text.append(payload.decode(part.get_content_charset() or 'utf-8', errors='ignore'))
-                    except Exception:
-                        text.append(payload.decode('utf-8', errors='ignore'))
+    part_limit = config.EMAIL_PART_MAX_BYTES
+    total_limit = config.EMAIL_TEXT_MAX_CHARS
+    plain, html = [], []
+    size = 0
+    for part in msg.walk():
+        if part.is_multipart() or size >= total_limit:
+            continue
+        ctype = part.get_content_type()
+        if ctype not in ('text/plain', 'text/html') or 'attachment' in str(part.get('Content-Disposition', '')).lower():
+            continue
+        text = _charset_decode(decode_part(part, part_limit), part.get_content_charset())
+        if not text.strip():
+            continue
+        (plain if ctype == 'text/plain' else html).append(text)
+        if ctype == 'text/plain':
+            size += len(text)
+
+    if plain:
+        body = "\n".join(plain)
     else:
-        payload = msg.get_payload(decode=True)
-        if payload:
-            try:
-                text.append(payload.decode(msg.get_content_charset() or 'utf-8', errors='ignore'))
-            except Exception:
-                text.append(payload.decode('utf-8', errors='ignore'))
-
-    body = '\n'.join(text).strip()
-    if not body:
-        # fallback - try to get from html by stripping tags
-        html = msg.get_payload(decode=True)
-        if html:
-            s = html.decode('utf-8', errors='ignore')
-            body = re.sub('<[^<]+?>', '', s)
-    return body
+        body = "\n".join(html_to_text(h, total_limit) for h in html)
+    if config.EMAIL_STRIP_QUOTES:
+        body = strip_quotes_and_signature(body)
+    return body[:total_limit].strip()
+
+
+def extract_text(raw: bytes) -> str:
+    return extract_text_from_email(parse_email_bytes(raw))
@@ -1,16 +1,17 @@
-import smtplib
 from email.mime.text import MIMEText
 from .. import config
 import logging
-from datetime import datetime
 from ..database import SessionLocal
 from ..models import Complaint
+from ..outbox import queue_email, notify as notify_outbox
+from .smtp_pool import get_pool, smtp_configured
 
 logger = logging.getLogger(__name__)
 
 
 def send_email(to_email: str, subject: str, body: str):
-    if not config.SMTP_USER or not config.SMTP_PASSWORD or not config.SMTP_SERVER:
+    """Send one message right away over a pooled SMTP session (mail from the app goes through the outbox)."""
+    if not smtp_configured():
         logger.warning("SMTP not configured, skipping send_email")
         return False
 
@@ -20,11 +21,8 @@ def send_email(to_email: str, subject: str, body: str):
     msg['To'] = to_email
 
     try:
-        s = smtplib.SMTP(config.SMTP_SERVER, config.SMTP_PORT)
-        s.starttls()
-        s.login(config.SMTP_USER, config.SMTP_PASSWORD)
-        s.sendmail(config.SMTP_USER, [to_email], msg.as_string())
-        s.quit()
+        with get_pool().connection() as s:
+            s.sendmail(config.SMTP_USER, [to_email], msg.as_string())
         return True
     except Exception:
         logger.exception("Failed to send email")
@@ -41,24 +39,48 @@ def send_acknowledgement(complaint_id: int):
     subj = f"Complaint Received - [Ticket #{c.id}]"
     dept = c.department or "General Support"
     category = c.categories or 'your issue'
-    body = (
-        f"Dear {c.customer_name or c.customer_email},\n\n"
-        f"We've received your complaint (Ticket #{c.id}) regarding {category}.\n"
-        f"Our {dept} team will review your case and contact you as soon as possible.\n\n"
-        "Regards,\nCustomer Support AI Agent"
-    )
-    sent = send_email(to_email, subj, body)
-    if sent:
-        c.acknowledged_at = datetime.utcnow()
-        db.add(c)
-        db.commit()
+    if c.duplicate_of:
+        # a near-duplicate is not triaged on its own: point the customer at the ticket already open
+        body = (
+            f"Dear {c.customer_name or c.customer_email},\n\n"
+            f"We've received your message (Ticket #{c.id}). It looks like it concerns the issue in your earlier "
+            f"Ticket #{c.duplicate_of}, so we've added it to that case.\n"
+            "You don't need to write again; we will contact you as soon as possible.\n\n"
+            "Regards,\nCustomer Support AI Agent"
+        )
+    else:
+        body = (
+            f"Dear {c.customer_name or c.customer_email},\n\n"
+            f"We've received your complaint (Ticket #{c.id}) regarding {category}.\n"
+            f"Our {dept} team will review your case and contact you as soon as possible.\n\n"
+            "Regards,\nCustomer Support AI Agent"
+        )
+    # delivered by the outbox senders, which set acknowledged_at once the server accepts it;
+    # the dedup key keeps a retried job from queuing a second acknowledgement
+    queued = queue_email(db, to_email, subj, body, kind='ack', complaint_id=c.id, dedup=f"ack:{c.id}")
+    db.commit()
     db.close()
-    return sent
+    if queued:
+        notify_outbox()
+    return queued
+
+
+def alert_admin_many(messages: list):
+    """Queue [(subject, message), ...] for ADMIN_EMAIL in one transaction; returns how many were queued."""
+    if not config.ADMIN_EMAIL:
+        for subject, message in messages:
+            logger.warning("Admin alert: %s - %s", subject, message)
+        return 0
+    db = SessionLocal()
+    try:
+        queued = sum(queue_email(db, config.ADMIN_EMAIL, subject, message, kind='alert') for subject, message in messages)
+        db.commit()
+    finally:
+        db.close()
+    if queued:
+        notify_outbox()
+    return queued
 
 
 def alert_admin(subject: str, message: str):
-    if config.ADMIN_EMAIL:
-        return send_email(config.ADMIN_EMAIL, subject, message)
-    else:
-        logger.warning("Admin alert: %s - %s", subject, message)
-        return False
+    return alert_admin_many([(subject, message)]) > 0
@@ -0,0 +1,158 @@
+"""Keyset-paginated, projected complaint listings (GET /get_complaints, GET /admin/complaints).
+
+Pages are ordered by (created_at, id) and continue from an opaque cursor holding the last row's key,
+so every page is an index range scan regardless of how deep the client has paged. A category or
+keyword filter reads the page from that tag table's (tag, created_at, complaint_id) index instead,
+which holds the same key, so cursors mean the same thing with or without it. `fields` selects
+only the columns a view needs, and the NDJSON mode streams rows from the cursor instead of building
+a list.
+"""
+import base64
+import json
+import logging
+from fastapi import HTTPException
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select, tuple_, literal, type_coerce, exists, String
+from .. import config
+from ..database import engine
+from ..models import Complaint, ComplaintCategory, ComplaintKeyword
+from .serializers import COMPLAINT_FIELDS, complaint_to_dict
+
+logger = logging.getLogger(__name__)
+
+ORDERS = ("asc", "desc")
+FORMATS = ("json", "ndjson")
+
+# created_at as stored; comparing the raw text keeps the cursor exact whatever the timestamp format
+_created_raw = type_coerce(Complaint.created_at, String)
+
+
+def parse_fields(fields: str = None) -> list:
+    """Comma-separated output fields -> list; None/empty means every field."""
+    if not fields:
+        return list(COMPLAINT_FIELDS)
+    names = [f.strip() for f in fields.split(",") if f.strip()]
+    unknown = [f for f in names if f not in COMPLAINT_FIELDS]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+    return names
+
+
+def encode_cursor(created_at: str, complaint_id: int) -> str:
+    raw = json.dumps([created_at, complaint_id], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str):
+    try:
+        created_at, complaint_id = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        return str(created_at), int(complaint_id)
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+
+class TagFilter:
+    """Complaints with a row for `value` in a tag table (complaint_categories, complaint_keywords)."""
+
+    def __init__(self, model, column, value):
+        self.model = model
+        self.clause = column == value
+
+
+def complaint_filters(status=None, severity=None, department=None, date_from=None, date_to=None,
+                      category=None, keyword=None) -> list:
+    clauses = []
+    if category:
+        clauses.append(TagFilter(ComplaintCategory, ComplaintCategory.category, category.strip()))
+    if keyword:
+        clauses.append(TagFilter(ComplaintKeyword, ComplaintKeyword.keyword, keyword.strip().lower()))
+    # the first tag filter drives the query, so the date range goes on its copy of created_at
+    created = clauses[0].model.created_at if clauses else Complaint.created_at
+    if status:
+        clauses.append(Complaint.status == status)
+    if severity:
+        clauses.append(Complaint.severity == severity)
+    if department:
+        clauses.append(Complaint.department == department)
+    if date_from:
+        clauses.append(created >= date_from)
+    if date_to:
+        clauses.append(created <= date_to)
+    return clauses
+
+
+def build_complaint_query(fields: list, filters: list = (), cursor: str = None, order: str = "asc", limit: int = None):
+    """SELECT of just the columns behind `fields`, plus the keyset columns, after `cursor`."""
+    columns = []
+    for f in fields:
+        col = getattr(Complaint, f)
+        if col not in columns:
+            columns.append(col)
+    tags = [f for f in filters if isinstance(f, TagFilter)]
+    clauses = [f for f in filters if not isinstance(f, TagFilter)]
+    created, ident = _created_raw, Complaint.id
+    if tags:
+        driver = tags[0].model
+        created, ident = type_coerce(driver.created_at, String), driver.complaint_id
+    stmt = select(*columns, created.label("_cursor_created"), ident.label("_cursor_id"))
+    if tags:
+        stmt = stmt.select_from(driver).join(Complaint, Complaint.id == driver.complaint_id).where(tags[0].clause)
+        clauses += [exists().where(t.model.complaint_id == Complaint.id, t.clause) for t in tags[1:]]
+    stmt = stmt.where(*clauses)
+    key = tuple_(created, ident)
+    if cursor:
+        created_at, complaint_id = decode_cursor(cursor)
+        after = tuple_(literal(created_at), literal(complaint_id))
+        stmt = stmt.where(key > after if order == "asc" else key < after)
+    if order == "asc":
+        stmt = stmt.order_by(created, ident)
+    else:
+        stmt = stmt.order_by(created.desc(), ident.desc())
+    if limit is not None:
+        stmt = stmt.limit(limit)
+    return stmt
+
+
+def fetch_page(stmt_builder, limit: int, fields: list):
+    """Run one page; returns (items, next_cursor or None)."""
+    with engine.connect() as conn:
+        rows = conn.execute(stmt_builder(limit + 1)).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1]._cursor_created, rows[-1]._cursor_id)
+    return [complaint_to_dict(r, fields) for r in rows], next_cursor
+
+
+def stream_ndjson(stmt, fields: list, batch_size: int = 500):
+    """Yield one JSON line per row, fetching `batch_size` rows at a time from an open cursor."""
+    with engine.connect() as conn:
+        result = conn.execution_options(yield_per=batch_size).execute(stmt)
+        for row in result:
+            yield json.dumps(complaint_to_dict(row, fields)) + "\n"
+
+
+def complaint_listing(response, filters: list, limit: int = None, cursor: str = None, fields: str = None,
+                      order: str = "asc", format: str = "json"):
+    """Shared body of the listing endpoints: a page (cursor in X-Next-Cursor) or an NDJSON stream."""
+    if order not in ORDERS:
+        raise HTTPException(status_code=400, detail=f"order must be one of {', '.join(ORDERS)}")
+    if format not in FORMATS:
+        raise HTTPException(status_code=400, detail=f"format must be one of {', '.join(FORMATS)}")
+    try:
+        names = parse_fields(fields)
+        if cursor:
+            decode_cursor(cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    if format == "ndjson":
+        # streams everything after the cursor unless a limit is given
+        stmt = build_complaint_query(names, filters, cursor, order, limit)
+        return StreamingResponse(stream_ndjson(stmt, names), media_type="application/x-ndjson")
+
+    limit = min(limit or config.COMPLAINTS_PAGE_SIZE, config.COMPLAINTS_MAX_PAGE_SIZE)
+    items, next_cursor = fetch_page(lambda n: build_complaint_query(names, filters, cursor, order, n), limit, names)
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return items
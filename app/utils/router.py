@@ -1,49 +1,129 @@
 import logging
 import json
-from ..llm_utils import classify_complaint, severity_and_routing
-from ..sentiment_analyzer import analyze_sentiment
+import time
+from ..llm_utils import classify_complaint, severity_and_routing, triage_complaint, llm_priority, looks_urgent, track_usage
+from ..sentiment_analyzer import analyze_sentiment, local_sentiment
 from .keywords import extract_keywords
 from ..database import SessionLocal
 from ..models import Complaint
+from .. import config, local_model, dedup
+from ..summary import snapshot, record_change, set_categories, set_keywords
+from .. import sla_monitor
 from ..config import DEPARTMENT_MAP
 
 logger = logging.getLogger(__name__)
 
 
-def process_and_route(complaint_id: int):
-    db = SessionLocal()
-    c = db.query(Complaint).filter(Complaint.id == complaint_id).first()
-    if not c:
-        db.close()
-        return
-
+def _triage_sequential(text: str):
     # classify
-    cls = classify_complaint(c.description)
+    cls = classify_complaint(text)
     categories = cls.get('categories') if isinstance(cls, dict) else []
     confidence = cls.get('confidence', 0) if isinstance(cls, dict) else 0
-    # store raw llm classification JSON when available
-    llm_class_raw = None
-    try:
-        llm_class_raw = json.dumps(cls) if not isinstance(cls, str) else str(cls)
-    except Exception:
-        llm_class_raw = str(cls)
     if not categories:
         categories = ["Others"]
 
     # sentiment
-    sentiment = analyze_sentiment(c.description)
+    sentiment = analyze_sentiment(text)
 
     # extract keywords (LLM-based extractor preferred)
-    keywords = extract_keywords(c.description)
+    keywords = extract_keywords(text)
 
     # severity and routing (pass sentiment and keywords for better fallback)
-    sr = severity_and_routing(c.description, categories, sentiment=sentiment, keywords=keywords)
+    sr = severity_and_routing(text, categories, sentiment=sentiment, keywords=keywords)
     severity = sr.get('severity') if isinstance(sr, dict) else 'Medium'
     department = sr.get('routed_department') if isinstance(sr, dict) else DEPARTMENT_MAP.get(categories[0], 'General Support')
+    return cls, sr, categories, confidence, sentiment, keywords, severity, department
+
+
+def triage_blobs(t: dict):
+    """Split a fused/batch triage result into the stored llm_classification and llm_routing blobs."""
+    cls = {'categories': t['categories'], 'confidence': t['confidence']}
+    sr = {
+        'severity': t['severity'],
+        'routed_department': t['routed_department'],
+        'justification': t['justification'],
+        'sentiment': t['sentiment'],
+        'fallback_fields': t['fallback_fields'],
+    }
+    return cls, sr
+
+
+def _triage_fused(text: str):
+    keywords = extract_keywords(text)
+    t = triage_complaint(text, keywords=keywords)
+    cls, sr = triage_blobs(t)
+    return cls, sr, t['categories'], t['confidence'], t['sentiment'], keywords, t['severity'], t['routed_department']
+
+
+def _triage_local(text: str, prediction: dict):
+    categories = prediction['categories'] or ["Others"]
+    severity = prediction['severity']
+    department = DEPARTMENT_MAP.get(categories[0], 'General Support')
+    sentiment = local_sentiment(text)
+    keywords = extract_keywords(text)
+    cls = {'categories': categories, 'confidence': prediction['confidence'], 'source': 'local_model'}
+    sr = {
+        'severity': severity,
+        'routed_department': department,
+        'justification': f"Local model (confidence {prediction['confidence']:.2f})",
+        'sentiment': sentiment,
+        'source': 'local_model',
+    }
+    return cls, sr, categories, prediction['confidence'], sentiment, keywords, severity, department
+
+
+def process_and_route(complaint_id: int, mode: str = None, priority: str = None):
+    """Triage a stored complaint and persist the result.
+
+    `mode` overrides config.TRIAGE_MODE ("fused" or "sequential") so both paths can be compared.
+    `priority` is the LLM lane for non-urgent tickets ("normal" by default, "bulk" for reprocessing).
+    When a local model is trained and confident about the ticket, the LLM is not called at all.
+    """
+    mode = (mode or config.TRIAGE_MODE or 'fused').lower()
+    db = SessionLocal()
+    c = db.query(Complaint).filter(Complaint.id == complaint_id).first()
+    if not c:
+        db.close()
+        return
+
+    before = snapshot(c)
+
+    # urgent-looking tickets get LLM quota ahead of normal and bulk traffic
+    lane = 'urgent' if looks_urgent(c.description) else (priority or 'normal')
+    started = time.perf_counter()
+    usage = None
+    model = local_model.get_model()
+    prediction = model.predict(c.description) if model else None
+    if prediction and prediction['confidence'] >= config.LOCAL_MODEL_THRESHOLD:
+        mode = 'local'
+        cls, sr, categories, confidence, sentiment, keywords, severity, department = _triage_local(c.description, prediction)
+        local_model.record(prediction, True)
+    else:
+        with llm_priority(lane), track_usage() as usage:
+            if mode == 'sequential':
+                cls, sr, categories, confidence, sentiment, keywords, severity, department = _triage_sequential(c.description)
+            else:
+                mode = 'fused'
+                cls, sr, categories, confidence, sentiment, keywords, severity, department = _triage_fused(c.description)
+        if prediction:
+            # escalated: compare the local guess with the LLM answer (heuristic fallbacks don't count)
+            if local_model.is_llm_label(cls, sr):
+                local_model.record(prediction, False, categories, severity)
+            else:
+                local_model.record(prediction, False)
+    elapsed_ms = int((time.perf_counter() - started) * 1000)
+
+    # store raw llm classification JSON when available
+    llm_class_raw = None
+    try:
+        llm_class_raw = json.dumps(cls) if not isinstance(cls, str) else str(cls)
+    except Exception:
+        llm_class_raw = str(cls)
 
     c.categories = ",".join(categories)
     c.sentiment = sentiment
     c.severity = severity
+    c.sla_due_at = sla_monitor.sla_due_at(c.created_at, severity)
     c.department = department
     c.keywords = ','.join(keywords) if keywords else None
     c.llm_classification = llm_class_raw
@@ -53,9 +133,20 @@ def process_and_route(complaint_id: int):
     except Exception:
         llm_routing_raw = str(sr)
     c.llm_routing = llm_routing_raw
+    c.llm_calls, c.prompt_tokens, c.completion_tokens, c.llm_ms = (
+        (usage.calls, usage.prompt_tokens, usage.completion_tokens, usage.llm_ms) if usage else (0, 0, 0, 0))
 
     db.add(c)
+    # category/keyword rows and summary counters change in the same transaction as the complaint
+    set_categories(db, {c.id: categories})
+    set_keywords(db, {c.id: keywords})
+    record_change(db, before, snapshot(c))
+    # near-duplicates linked while this ticket waited in the queue copied an untriaged original
+    db.flush()
+    dedup.update_duplicates(db, [c.id])
     db.commit()
+    # the new deadline may be earlier than the one the SLA scanner is sleeping towards
+    sla_monitor.notify()
 
     # Capture values before closing the session to avoid DetachedInstanceError
     result = {
@@ -65,9 +156,14 @@ def process_and_route(complaint_id: int):
         'sentiment': sentiment,
         'severity': severity,
         'department': department,
+        'triage_mode': mode,
+        'triage_ms': elapsed_ms,
+        'llm_usage': usage.as_dict() if usage else None,
     }
     # Log using captured values
-    logger.info("Processed complaint %s, categories=%s, severity=%s, dept=%s", result['id'], result['categories'], result['severity'], result['department'])
+    logger.info("Processed complaint %s, mode=%s, triage_ms=%s, categories=%s, severity=%s, dept=%s, tokens=%s+%s",
+                result['id'], mode, elapsed_ms, result['categories'], result['severity'], result['department'],
+                c.prompt_tokens, c.completion_tokens)
 
     db.close()
 
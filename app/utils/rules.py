@@ -0,0 +1,181 @@
+import logging
+import re
+
+logger = logging.getLogger(__name__)
+
+try:
+    import ahocorasick  # pyahocorasick, optional C automaton
+except ImportError:
+    ahocorasick = None
+
+
+class RuleMatch:
+    """Result of RuleSet.match.
+
+    `triggers` maps every matched rule label to the term that fired it; the full set of matched terms
+    and their spans are computed on first access.
+    """
+
+    def __init__(self, low: str, triggers: dict, ruleset):
+        self._low = low
+        self.triggers = triggers
+        self._ruleset = ruleset
+        self._spans = None
+
+    @property
+    def labels(self) -> set:
+        return set(self.triggers)
+
+    def has(self, label: str) -> bool:
+        return label in self.triggers
+
+    @property
+    def spans(self) -> list:
+        """Sorted (start, end, term) tuples for every occurrence, overlaps included."""
+        if self._spans is None:
+            self._spans = self._ruleset.spans(self._low)
+        return self._spans
+
+    @property
+    def terms(self) -> set:
+        return {s[2] for s in self.spans}
+
+    def explain(self) -> list:
+        """JSON-friendly spans with the rule labels each term triggered."""
+        return [
+            {"term": term, "start": start, "end": end, "rules": sorted(self._ruleset.term_labels[term])}
+            for start, end, term in self.spans
+        ]
+
+
+class RuleSet:
+    """All substring rules of the heuristic classifier compiled into one matcher.
+
+    `rules` maps a label to its trigger terms; a text matches a label when any of its terms occurs as a
+    case-insensitive substring (the semantics of the old `any(w in low for w in [...])` checks).
+    With pyahocorasick installed the text is matched in a single pass through an Aho-Corasick automaton.
+    Otherwise texts up to REGEX_MAX_CHARS go through one compiled regex of all terms (prefix-factored,
+    so at each position it follows one branch per character). On longer texts CPython's regex engine
+    loses to its substring search, so there each distinct term is searched at most once (rules stop at
+    their first hit, and a term is skipped when a shorter term it contains is already absent).
+    """
+
+    REGEX_MAX_CHARS = 400  # measured crossover with the per-term search (benchmarks/bench_rules.py)
+
+    def __init__(self, rules: dict, backend: str = None):
+        self.rules = {label: [t.lower() for t in terms] for label, terms in rules.items()}
+        self.term_labels = {}
+        for label, terms in self.rules.items():
+            for t in terms:
+                self.term_labels.setdefault(t, set()).add(label)
+
+        # shorter terms first; each longer term remembers the longest term it contains
+        self._order = sorted(self.term_labels, key=len)
+        self._prereq = {}
+        for t in self._order:
+            contained = [s for s in self._order if s != t and s in t]
+            self._prereq[t] = max(contained, key=len) if contained else None
+        self._label_terms = [(label, sorted(terms, key=len)) for label, terms in self.rules.items()]
+
+        # the longest term starting at a position is matched; the terms it starts with are there too
+        self._regex = re.compile(_trie_pattern(self.term_labels)) if self.term_labels else None
+        self._prefixes = {t: [p for p in self.term_labels if t.startswith(p)] for t in self.term_labels}
+
+        self.backend = backend or ('ahocorasick' if ahocorasick is not None else 'scan')
+        self._automaton = None
+        if self.backend == 'ahocorasick':
+            if ahocorasick is None:
+                raise ImportError("pyahocorasick is not installed")
+            self._automaton = ahocorasick.Automaton()
+            for t in self.term_labels:
+                self._automaton.add_word(t, (t, tuple(self.term_labels[t])))
+            self._automaton.make_automaton()
+
+    def _present(self, t: str, low: str, seen: dict) -> bool:
+        hit = seen.get(t)
+        if hit is None:
+            pre = self._prereq[t]
+            hit = (pre is None or self._present(pre, low, seen)) and t in low
+            seen[t] = hit
+        return hit
+
+    def scan_terms(self, low: str) -> set:
+        """Every term occurring in the (already lower-cased) text."""
+        seen = {}
+        return {t for t in self._order if self._present(t, low, seen)}
+
+    def spans(self, low: str) -> list:
+        """Sorted (start, end, term) tuples for every occurrence in the lower-cased text, overlaps included."""
+        if self._automaton is not None:
+            return sorted((end - len(term) + 1, end + 1, term) for end, (term, _) in self._automaton.iter(low))
+        spans = []
+        for term in self.scan_terms(low):
+            i = low.find(term)
+            while i != -1:
+                spans.append((i, i + len(term), term))
+                i = low.find(term, i + 1)
+        return sorted(spans)
+
+    def match(self, text: str) -> RuleMatch:
+        low = (text or "").lower()
+        triggers = {}
+        if self._automaton is not None:
+            for _, (term, labels) in self._automaton.iter(low):
+                for label in labels:
+                    triggers.setdefault(label, term)
+            return RuleMatch(low, triggers, self)
+
+        if self._regex is not None and len(low) <= self.REGEX_MAX_CHARS:
+            present = set()
+            search = self._regex.search
+            m = search(low)
+            while m:
+                present.update(self._prefixes[m.group()])
+                m = search(low, m.start() + 1)
+            for label, terms in self._label_terms:
+                for t in terms:
+                    if t in present:
+                        triggers[label] = t
+                        break
+            return RuleMatch(low, triggers, self)
+
+        seen = {}
+        prereq = self._prereq
+        for label, terms in self._label_terms:
+            for t in terms:
+                hit = seen.get(t)
+                if hit is None:
+                    pre = prereq[t]
+                    # a term can't occur if a term it contains was already found absent
+                    hit = False if (pre is not None and seen.get(pre) is False) else t in low
+                    seen[t] = hit
+                if hit:
+                    triggers[label] = t
+                    break
+        return RuleMatch(low, triggers, self)
+
+    def match_keywords(self, keywords) -> set:
+        """Labels whose terms equal one of `keywords` exactly (case-insensitive)."""
+        labels = set()
+        for k in keywords or []:
+            labels |= self.term_labels.get(k.lower(), set())
+        return labels
+
+
+def _trie_pattern(terms) -> str:
+    """One regex matching any of `terms`, factored on common prefixes; the longest match wins at each position."""
+    root = {}
+    for t in terms:
+        node = root
+        for ch in t:
+            node = node.setdefault(ch, {})
+        node[""] = {}
+
+    def build(node):
+        alts = [re.escape(ch) + build(child) for ch, child in sorted(node.items()) if ch]
+        if not alts:
+            return ""
+        body = alts[0] if len(alts) == 1 else "(?:" + "|".join(alts) + ")"
+        return f"(?:{body})?" if "" in node else body
+
+    return build(root)
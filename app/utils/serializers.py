@@ -6,47 +6,87 @@ def _iso(dt: datetime):
     return dt.isoformat() if dt else None
 
 
-def complaint_to_dict(c):
-    # Build a clean, structured dict from a Complaint ORM instance
+def _split(val):
     try:
-        categories = [s.strip() for s in (c.categories or '').split(',') if s.strip()]
+        return [s.strip() for s in (val or '').split(',') if s.strip()]
     except Exception:
-        categories = []
+        return []
+
+
+# Try to parse LLM JSON blobs if they are JSON strings
+def _maybe_json(val):
+    if not val:
+        return None
+    if isinstance(val, (dict, list)):
+        return val
     try:
-        keywords = [s.strip() for s in (c.keywords or '').split(',') if s.strip()]
+        return json.loads(val)
     except Exception:
-        keywords = []
-
-    # Try to parse LLM JSON blobs if they are JSON strings
-    def _maybe_json(val):
-        if not val:
-            return None
-        if isinstance(val, (dict, list)):
-            return val
-        try:
-            return json.loads(val)
-        except Exception:
-            return val
+        return val
+
+
+# Output field -> how to read it from a Complaint (an ORM instance or a row of selected columns)
+COMPLAINT_FIELDS = {
+    "id": lambda c: c.id,
+    "customer_name": lambda c: c.customer_name,
+    "customer_email": lambda c: c.customer_email,
+    "channel": lambda c: c.channel,
+    "subject": lambda c: c.subject,
+    "description": lambda c: c.description,
+    "keywords": lambda c: _split(c.keywords),
+    "sentiment": lambda c: c.sentiment,
+    "severity": lambda c: c.severity,
+    "categories": lambda c: _split(c.categories),
+    "department": lambda c: c.department,
+    "status": lambda c: c.status,
+    "llm_classification": lambda c: _maybe_json(c.llm_classification),
+    "llm_routing": lambda c: _maybe_json(c.llm_routing),
+    "received_at": lambda c: _iso(c.received_at),
+    "acknowledged_at": lambda c: _iso(c.acknowledged_at),
+    "resolved_at": lambda c: _iso(c.resolved_at),
+    "created_at": lambda c: _iso(getattr(c, 'created_at', None)),
+    "updated_at": lambda c: _iso(getattr(c, 'updated_at', None)),
+    "sla_violation": lambda c: bool(c.sla_violation),
+    "duplicate_of": lambda c: c.duplicate_of,
+    "llm_calls": lambda c: c.llm_calls,
+    "prompt_tokens": lambda c: c.prompt_tokens,
+    "completion_tokens": lambda c: c.completion_tokens,
+    "llm_ms": lambda c: c.llm_ms,
+}
+
+
+def complaint_to_dict(c, fields=None):
+    # Build a clean, structured dict from a Complaint; `fields` limits it to those keys
+    return {f: COMPLAINT_FIELDS[f](c) for f in (fields or COMPLAINT_FIELDS)}
+
+
+def job_to_dict(j):
+    return {
+        "id": j.id,
+        "kind": j.kind,
+        "complaint_id": j.complaint_id,
+        "status": j.status,
+        "attempts": j.attempts,
+        "max_attempts": j.max_attempts,
+        "run_after": _iso(j.run_after),
+        "last_error": j.last_error,
+        "created_at": _iso(getattr(j, 'created_at', None)),
+        "finished_at": _iso(j.finished_at),
+    }
+
 
+def retriage_run_to_dict(r):
     return {
-        "id": c.id,
-        "customer_name": c.customer_name,
-        "customer_email": c.customer_email,
-        "channel": c.channel,
-        "subject": c.subject,
-        "description": c.description,
-        "keywords": keywords,
-        "sentiment": c.sentiment,
-        "severity": c.severity,
-        "categories": categories,
-        "department": c.department,
-        "status": c.status,
-        "llm_classification": _maybe_json(c.llm_classification),
-        "llm_routing": _maybe_json(c.llm_routing),
-        "received_at": _iso(c.received_at),
-        "acknowledged_at": _iso(c.acknowledged_at),
-        "resolved_at": _iso(c.resolved_at),
-        "created_at": _iso(getattr(c, 'created_at', None)),
-        "updated_at": _iso(getattr(c, 'updated_at', None)),
-        "sla_violation": bool(c.sla_violation),
+        "id": r.id,
+        "status": r.status,
+        "start_after_id": r.start_after_id,
+        "last_id": r.last_id,
+        "processed": r.processed,
+        "total": r.total,
+        "progress": round(r.processed / r.total, 4) if r.total else None,
+        "chunk_size": r.chunk_size,
+        "batch_size": r.batch_size,
+        "error": r.error,
+        "started_at": _iso(r.started_at),
+        "finished_at": _iso(r.finished_at),
     }
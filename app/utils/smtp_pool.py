@@ -0,0 +1,148 @@
+"""A small pool of long-lived, authenticated SMTP connections.
+
+Opening a session costs a TCP connect, EHLO, STARTTLS and AUTH, several round trips before the first
+message. The pool keeps up to SMTP_POOL_SIZE sessions open and hands them out with `connection()`.
+A session that sat idle for more than SMTP_IDLE_CHECK seconds is probed with NOOP before it is
+reused, one idle for more than SMTP_MAX_IDLE is closed, and one that fails mid-use is dropped,
+so the next checkout reconnects.
+"""
+import logging
+import smtplib
+import threading
+import time
+from contextlib import contextmanager
+from .. import config
+
+logger = logging.getLogger(__name__)
+
+# errors after which the session can't be trusted any more; other SMTPResponseExceptions
+# (a refused recipient, a rejected message) leave it usable
+_BROKEN = (smtplib.SMTPServerDisconnected, smtplib.SMTPHeloError, OSError)
+
+
+def smtp_configured() -> bool:
+    return bool(config.SMTP_USER and config.SMTP_PASSWORD and config.SMTP_SERVER)
+
+
+class SMTPPool:
+    def __init__(self, host: str = None, port: int = None, user: str = None, password: str = None,
+                 size: int = None, timeout: float = None, starttls: bool = None):
+        self.host = host or config.SMTP_SERVER
+        self.port = port or config.SMTP_PORT
+        self.user = config.SMTP_USER if user is None else user
+        self.password = config.SMTP_PASSWORD if password is None else password
+        self.size = max(1, size or config.SMTP_POOL_SIZE)
+        self.timeout = timeout or config.SMTP_TIMEOUT
+        self.starttls = config.SMTP_STARTTLS if starttls is None else starttls
+        self._slots = threading.BoundedSemaphore(self.size)
+        self._lock = threading.Lock()
+        self._idle = []  # [(conn, monotonic time it was returned)], most recently used last
+        self.stats = {"connects": 0, "reuses": 0, "dropped": 0}
+
+    def _connect(self):
+        conn = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        try:
+            conn.ehlo()
+            if self.starttls and conn.has_extn("starttls"):
+                conn.starttls()
+                conn.ehlo()
+            if self.user and self.password:
+                conn.login(self.user, self.password)
+        except Exception:
+            _close(conn)
+            raise
+        with self._lock:
+            self.stats["connects"] += 1
+        return conn
+
+    def _checkout(self):
+        while True:
+            with self._lock:
+                if not self._idle:
+                    break
+                conn, since = self._idle.pop()
+            idle = time.monotonic() - since
+            if idle > config.SMTP_MAX_IDLE:
+                _close(conn)
+                continue
+            if idle > config.SMTP_IDLE_CHECK:
+                try:
+                    if conn.noop()[0] != 250:
+                        raise smtplib.SMTPServerDisconnected("NOOP failed")
+                except Exception:
+                    self._drop(conn)
+                    continue
+            with self._lock:
+                self.stats["reuses"] += 1
+            return conn
+        return self._connect()
+
+    def _drop(self, conn):
+        _close(conn)
+        with self._lock:
+            self.stats["dropped"] += 1
+
+    @contextmanager
+    def connection(self):
+        """Check out a ready session; it goes back to the pool unless the connection broke."""
+        self._slots.acquire()
+        try:
+            conn = self._checkout()
+            try:
+                yield conn
+            except _BROKEN:
+                self._drop(conn)
+                raise
+            except BaseException:
+                self._release(conn)
+                raise
+            else:
+                self._release(conn)
+        finally:
+            self._slots.release()
+
+    def _release(self, conn):
+        with self._lock:
+            self._idle.append((conn, time.monotonic()))
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn, _ in idle:
+            try:
+                conn.quit()
+            except Exception:
+                _close(conn)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return dict(self.stats, idle=len(self._idle), size=self.size)
+
+
+def _close(conn):
+    try:
+        conn.close()
+    except Exception:
+        pass
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> SMTPPool:
+    """The process-wide pool, built from the SMTP_* settings on first use."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = SMTPPool()
+        return _pool
+
+
+def close_pool():
+    """Close the idle sessions; the next get_pool() builds a fresh pool from the current settings."""
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.close()
@@ -0,0 +1,118 @@
+"""Benchmark: concurrent reads and writes on SQLite, plain engine vs the tuned one in app.database.
+
+    python benchmarks/bench_db.py [--writers 8] [--readers 8] [--seconds 5] [--seed-rows 20000]
+
+For each configuration a fresh database file is seeded with complaints. Writer threads then insert
+complaints (one session and commit per complaint, like POST /submit_complaint) while reader threads run
+the listing query (one page of the newest complaints) and a lookup by id, for a fixed time.
+Prints operations per second, p95 latency and "database is locked" errors per side.
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from sqlalchemy import select
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import sessionmaker
+
+from app.database import Base, create_db_engine
+from app.models import Complaint
+
+
+def seed(engine, rows):
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as conn:
+        conn.execute(Complaint.__table__.insert(), [
+            {"customer_email": f"seed{i % 500}@example.com", "description": f"seeded complaint {i}",
+             "channel": "Web", "status": ("New", "In Progress", "Resolved")[i % 3]}
+            for i in range(rows)
+        ])
+
+
+def run(engine, writers, readers, seconds, seed_rows):
+    Session = sessionmaker(bind=engine, autoflush=False)
+    stop = time.monotonic() + seconds
+    lat = {"write": [], "read": []}
+    errors = {"write": 0, "read": 0}
+    lock = threading.Lock()
+
+    def writer(n):
+        i = 0
+        while time.monotonic() < stop:
+            started = time.perf_counter()
+            db = Session()
+            try:
+                db.add(Complaint(customer_email=f"bench{n}@example.com", description=f"bench write {n}/{i}", channel="Web"))
+                db.commit()
+                ok = True
+            except OperationalError:
+                db.rollback()
+                ok = False
+            finally:
+                db.close()
+            with lock:
+                if ok:
+                    lat["write"].append(time.perf_counter() - started)
+                else:
+                    errors["write"] += 1
+            i += 1
+
+    def reader():
+        while time.monotonic() < stop:
+            started = time.perf_counter()
+            try:
+                with engine.connect() as conn:
+                    conn.execute(select(Complaint.id, Complaint.status, Complaint.created_at)
+                                 .order_by(Complaint.id.desc()).limit(50)).all()
+                    conn.execute(select(Complaint).where(Complaint.id == random.randint(1, seed_rows))).first()
+                ok = True
+            except OperationalError:
+                ok = False
+            with lock:
+                if ok:
+                    lat["read"].append(time.perf_counter() - started)
+                else:
+                    errors["read"] += 1
+
+    threads = [threading.Thread(target=writer, args=(n,)) for n in range(writers)]
+    threads += [threading.Thread(target=reader) for _ in range(readers)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return lat, errors
+
+
+def p95(values):
+    return statistics.quantiles(values, n=20)[-1] * 1000 if len(values) >= 20 else float('nan')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--writers', type=int, default=8)
+    parser.add_argument('--readers', type=int, default=8)
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--seed-rows', type=int, default=20000)
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp(prefix='bench_db_')
+    print(f"{args.writers} writers, {args.readers} readers, {args.seconds:.0f}s, {args.seed_rows} seeded rows")
+    for name, tuned in (("plain", False), ("tuned", True)):
+        engine = create_db_engine(f"sqlite:///{os.path.join(tmp, name + '.db')}", tuned=tuned)
+        seed(engine, args.seed_rows)
+        lat, errors = run(engine, args.writers, args.readers, args.seconds, args.seed_rows)
+        engine.dispose()
+        print(f"{name:6s} writes {len(lat['write']) / args.seconds:8.1f}/s  p95 {p95(lat['write']):7.1f} ms  "
+              f"locked {errors['write']:4d}   reads {len(lat['read']) / args.seconds:8.1f}/s  "
+              f"p95 {p95(lat['read']):7.1f} ms  locked {errors['read']:4d}")
+
+
+if __name__ == '__main__':
+    main()
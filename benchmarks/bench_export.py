@@ -0,0 +1,98 @@
+"""Benchmark: streaming export (app.export) vs the original view_complaints.py.
+
+    python benchmarks/bench_export.py [--rows 200000] [--description-bytes 1000]
+
+Seeds a fresh database, then exports every complaint with the original approach (SELECT *, fetchall,
+one indented JSON document per row) and with app.export in each format. Output goes to a temporary
+file. Each export runs twice: once timed, once under tracemalloc for peak Python memory (tracing slows
+it down). Prints seconds, peak memory and output size.
+"""
+import argparse
+import json
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.database import create_db_engine
+from app.export import Export, output_kind
+from app.migrations import migrate
+
+WORDS = ("order refund delivery package late broken charged twice support account password invoice screen "
+         "replacement warranty courier damaged product please help thanks").split()
+
+
+def seed(path, rows, description_bytes):
+    engine = create_db_engine(f"sqlite:///{path}")
+    migrate(engine)
+    engine.dispose()
+    rng = random.Random(7)
+    conn = sqlite3.connect(path)
+    for start in range(0, rows, 20000):
+        conn.executemany(
+            "INSERT INTO complaints (customer_email, channel, subject, description, keywords, severity, categories, "
+            "department, status, sla_violation, llm_classification) VALUES (?, 'Email', ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            [(f"c{i % 9000}@example.com", f"Ticket {i}", " ".join(rng.choices(WORDS, k=description_bytes // 7)), "refund,late delivery", "Medium",
+              "Delivery Problem", "Logistics", "Resolved", i % 7 == 0, '{"categories": ["Delivery Problem"]}')
+             for i in range(start, min(start + 20000, rows))])
+        conn.commit()
+    conn.close()
+
+
+def original(path, out):
+    # view_complaints.py as it was
+    conn = sqlite3.connect(path)
+    cursor = conn.cursor()
+    cursor.execute("SELECT * FROM complaints")
+    rows = cursor.fetchall()
+    columns = [desc[0] for desc in cursor.description]
+    for row in rows:
+        print(json.dumps(dict(zip(columns, row)), default=str, indent=2), file=out)
+    conn.close()
+
+
+def streamed(path, out, fmt):
+    run = Export(fmt, url=f"sqlite:///{path}")
+    for data in run.stream():
+        out.write(data)
+
+
+def measure(fn, target, binary):
+    started = time.perf_counter()
+    with open(target, "wb" if binary else "w") as out:
+        fn(out)
+    elapsed = time.perf_counter() - started
+    tracemalloc.start()
+    with open(target, "wb" if binary else "w") as out:
+        fn(out)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed, peak, os.path.getsize(target)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=200_000)
+    parser.add_argument('--description-bytes', type=int, default=1000)
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp(prefix='bench_export_')
+    path = os.path.join(tmp, 'complaints.db')
+    seed(path, args.rows, args.description_bytes)
+    print(f"{args.rows} complaints, database {os.path.getsize(path) / 2**20:.0f} MB\n")
+
+    runs = [("view_complaints.py", lambda out: original(path, out), False)]
+    for fmt in ("ndjson", "csv", "columnar"):
+        runs.append((f"export {output_kind(fmt)[0]}", lambda out, fmt=fmt: streamed(path, out, fmt), True))
+    for label, fn, binary in runs:
+        elapsed, peak, size = measure(fn, os.path.join(tmp, 'out'), binary)
+        print(f"{label:28s} {elapsed:7.1f}s  peak {peak / 2**20:8.1f} MB  output {size / 2**20:7.0f} MB")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,134 @@
+"""Benchmark: bounded streaming body extraction vs the original extract_text_from_email.
+
+    python benchmarks/bench_extract.py [--emails 30] [--html-mb 2] [--attachment-mb 5] [--repeat 3]
+
+Builds a corpus of synthetic large emails (HTML newsletters, plain text with big attachments, long
+quoted reply threads and single-part HTML), runs both extractors on every message (parsing included)
+and prints milliseconds per email, peak traced memory, and average characters of extracted text,
+which is what ends up in the LLM prompt.
+"""
+import argparse
+import email
+import os
+import random
+import re
+import sys
+import time
+import tracemalloc
+from email.mime.application import MIMEApplication
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.utils.extract_metadata import extract_text
+
+WORDS = ("order refund broken delivery invoice support screen late package charged twice replacement "
+         "account password update warranty courier damaged product please help thanks").split()
+
+
+# --- original implementation, kept as the baseline ---------------------------------------------------
+def legacy_extract(raw):
+    msg = email.message_from_bytes(raw)
+    text = []
+    if msg.is_multipart():
+        for part in msg.walk():
+            ctype = part.get_content_type()
+            disp = str(part.get('Content-Disposition'))
+            if ctype == 'text/plain' and 'attachment' not in disp:
+                payload = part.get_payload(decode=True)
+                if payload:
+                    text.append(payload.decode(part.get_content_charset() or 'utf-8', errors='ignore'))
+    else:
+        payload = msg.get_payload(decode=True)
+        if payload:
+            text.append(payload.decode(msg.get_content_charset() or 'utf-8', errors='ignore'))
+    body = '\n'.join(text).strip()
+    if not body:
+        html = msg.get_payload(decode=True)
+        if html:
+            body = re.sub('<[^<]+?>', '', html.decode('utf-8', errors='ignore'))
+    return body
+
+
+def sentence(rng, n=12):
+    return " ".join(rng.choice(WORDS) for _ in range(n)).capitalize() + "."
+
+
+def newsletter(rng, size):
+    blocks = []
+    total = 0
+    while total < size:
+        block = (f'<table class="row"><tr><td style="padding:8px"><a href="https://example.com/{rng.randint(0, 10**6)}">'
+                 f'<img src="cid:{rng.randint(0, 999)}"/></a><p>{sentence(rng)}</p></td></tr></table>\n')
+        blocks.append(block)
+        total += len(block)
+    return "<html><head><style>td {font: 12px sans-serif}</style></head><body>" + "".join(blocks) + "</body></html>"
+
+
+def make_corpus(rng, n, html_bytes, attachment_bytes):
+    corpus = []
+    for i in range(n):
+        kind = i % 4
+        if kind == 0:  # HTML newsletter with no text/plain alternative
+            msg = MIMEMultipart('alternative')
+            msg.attach(MIMEText(newsletter(rng, html_bytes), 'html', 'utf-8'))
+        elif kind == 1:  # short complaint with a large PDF attached
+            msg = MIMEMultipart('mixed')
+            msg.attach(MIMEText(" ".join(sentence(rng) for _ in range(5)), 'plain', 'utf-8'))
+            part = MIMEApplication(rng.randbytes(attachment_bytes), Name="scan.pdf")
+            part['Content-Disposition'] = 'attachment; filename="scan.pdf"'
+            msg.attach(part)
+        elif kind == 2:  # reply at the top of a long quoted thread
+            lines = [sentence(rng) for _ in range(3)]
+            for depth in range(1, 30):
+                lines.append(f"On Mon, {depth} Jun 2024 at 10:02, Support <help@example.com> wrote:")
+                lines += [">" * depth + " " + sentence(rng) for _ in range(20)]
+            lines += ["--", "Jane Customer", "Sent from my iPhone"]
+            msg = MIMEText("\n".join(lines), 'plain', 'utf-8')
+        else:  # single-part HTML
+            msg = MIMEText(newsletter(rng, html_bytes // 4), 'html', 'utf-8')
+        msg['Subject'] = f"Synthetic {i}"
+        corpus.append(msg.as_bytes())
+    return corpus
+
+
+def measure(fn, corpus, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        out = [fn(raw) for raw in corpus]
+        best = min(best, time.perf_counter() - start)
+    tracemalloc.start()
+    for raw in corpus:
+        fn(raw)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return out, best, peak
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--emails', type=int, default=30)
+    parser.add_argument('--html-mb', type=float, default=2)
+    parser.add_argument('--attachment-mb', type=float, default=5)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    corpus = make_corpus(rng, args.emails, int(args.html_mb * 2**20), int(args.attachment_mb * 2**20))
+    total_mb = sum(len(r) for r in corpus) / 2**20
+    print(f"{len(corpus)} synthetic emails, {total_mb:.1f} MB raw")
+
+    results = {}
+    for name, fn in (("original", legacy_extract), ("bounded", extract_text)):
+        out, best, peak = measure(fn, corpus, args.repeat)
+        chars = sum(len(t) for t in out) / len(out)
+        results[name] = best
+        print(f"{name:9s} {best / len(corpus) * 1000:8.1f} ms/email   peak {peak / 2**20:7.1f} MB   "
+              f"avg text {chars:10.0f} chars")
+    print(f"speedup x{results['original'] / results['bounded']:.1f}")
+
+
+if __name__ == '__main__':
+    main()
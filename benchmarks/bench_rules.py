@@ -0,0 +1,124 @@
+"""Micro-benchmark: compiled heuristic rules vs the original per-rule substring scans.
+
+    python benchmarks/bench_rules.py [--sizes 300,3000,30000] [--repeat 200]
+
+Runs classify + severity heuristics on synthetic emails of growing length, checks that every
+implementation returns the same categories/severity, and prints microseconds per email.
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.llm_utils import RULES, heuristic_classify, heuristic_severity_and_routing, max_severity
+from app.utils import rules
+
+FILLER = ("hello team I am writing about my recent order the product arrived on time and the packaging was fine "
+          "but I have a few questions about the settings menu and the manual please advise thanks kind regards").split()
+TRIGGERS = ["stopped working", "overcharged", "urgent", "late", "refund", "crash", "rude", "hazard", "invoice", "won't spin"]
+
+
+# --- original implementation (before the rule engine), kept as the baseline -------------------------
+def legacy_classify(text):
+    categories = []
+    low = text.lower()
+    if any(w in low for w in ["bill", "invoice", "charge"]):
+        categories.append("Billing Issue")
+    if any(w in low for w in ["broken", "defect", "not working", "malfunction", "stopped working", "stopped"]):
+        categories.append("Product Defect")
+    if any(w in low for w in ["refund", "money back"]):
+        categories.append("Refund Request")
+    if any(w in low for w in ["error", "bug", "crash", "unable to", "fail"]):
+        categories.append("Technical Issue")
+    if any(w in low for w in ["deliver", "shipment", "late", "missing"]):
+        categories.append("Delivery Problem")
+    if any(w in low for w in ["rude", "bad service", "support", "experience"]):
+        categories.append("Service Quality")
+    return categories or ["Others"]
+
+
+def legacy_severity(text, sentiment, keywords):
+    low = text.lower()
+    severity = "Low"
+    urgent_terms = ['urgent', 'asap', 'immediately', 'need it urgently']
+    keywords_l = [k.lower() for k in (keywords or [])]
+    if any(t in low for t in urgent_terms) or any(t in keywords_l for t in urgent_terms):
+        severity = 'Urgent'
+    if severity != 'Urgent':
+        severity = {'Negative': 'High', 'Neutral': 'Medium', 'Positive': 'Low'}.get(sentiment, severity)
+    defect_indicators = ["not working", "stopped working", "stopped", "broken", "malfunction", "won't spin", "won't start"]
+    billing_indicators = ['refund', 'charged', 'overcharged', 'double charge', 'fraud']
+    if any(d in low for d in defect_indicators) or any(d in keywords_l for d in defect_indicators):
+        severity = severity if severity == 'Urgent' else max_severity(severity, 'High')
+    if any(b in low for b in billing_indicators) or any(b in keywords_l for b in billing_indicators):
+        severity = severity if severity == 'Urgent' else max_severity(severity, 'High')
+    if any(w in low for w in ["late", "delay", "missing", "not here"]):
+        severity = severity if severity == 'Urgent' else max_severity(severity, 'Medium')
+    if any(w in low for w in ["life-threatening", "danger", "hazard"]):
+        severity = 'Urgent'
+    return severity
+
+
+def run_legacy(text):
+    cats = legacy_classify(text)
+    return cats, legacy_severity(text, 'Neutral', [])
+
+
+def make_runner(ruleset):
+    def run(text):
+        m = ruleset.match(text)
+        cats = heuristic_classify(text, m)['categories']
+        return cats, heuristic_severity_and_routing(text, cats, 'Neutral', [], match=m)['severity']
+    return run
+
+
+def make_email(n_chars, rng):
+    words = []
+    size = 0
+    while size < n_chars:
+        w = rng.choice(TRIGGERS) if rng.random() < 0.002 else rng.choice(FILLER)
+        words.append(w)
+        size += len(w) + 1
+    return " ".join(words)
+
+
+def bench(fn, texts, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for t in texts:
+            fn(t)
+    return (time.perf_counter() - start) / (repeat * len(texts)) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', default='300,600,3000,30000')
+    parser.add_argument('--repeat', type=int, default=200)
+    parser.add_argument('--emails', type=int, default=20)
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    runners = [('legacy any() scans', run_legacy), ('rules: scan backend', make_runner(rules.RuleSet(RULES.rules, backend='scan')))]
+    if rules.ahocorasick is not None:
+        runners.append(('rules: ahocorasick backend', make_runner(rules.RuleSet(RULES.rules, backend='ahocorasick'))))
+    else:
+        print("pyahocorasick not installed; only the scan backend is measured")
+
+    for size in [int(s) for s in args.sizes.split(',')]:
+        texts = [make_email(size, rng) for _ in range(args.emails)]
+        expected = [run_legacy(t) for t in texts]
+        repeat = max(1, args.repeat * 300 // size)
+        base = None
+        print(f"\nemail length ~{size} chars ({len(texts)} emails x {repeat} rounds)")
+        for name, fn in runners:
+            assert [fn(t) for t in texts] == expected, f"{name} disagrees with the legacy heuristics"
+            us = bench(fn, texts, repeat)
+            base = base or us
+            print(f"  {name:<28} {us:9.1f} us/email   x{base / us:4.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+"""Benchmark: full-text search (GET /search) vs a LIKE scan over 1M complaints.
+
+    python benchmarks/bench_search.py [--rows 1000000] [--repeat 5]
+
+Seeds a fresh database with synthetic complaints, inserted through the FTS triggers, and times a full
+index rebuild. Then, for a set of queries (common, rare, AND, phrase, prefix, and one combined with
+a status filter), prints the latency of the first ranked page from app.search, how many rows match,
+and the time of a LIKE '%term%' scan over subject, description and keywords finding the same rows
+unranked (what grepping an export amounts to).
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.database import create_db_engine
+from app.migrations import migrate
+from app.search import build_search_query, fts_query
+from app.utils.pagination import complaint_filters, parse_fields
+
+COMMON = ("order refund delivery package late broken charged twice support account password invoice "
+          "screen replacement warranty courier damaged product please help thanks again still waiting "
+          "customer service days weeks email phone call nobody answered app crashes login error payment").split()
+PRODUCTS = [f"model{n}" for n in range(5000)]  # rare terms: each appears in a few hundred complaints
+
+# (label, query, filters, LIKE terms)
+QUERIES = [
+    ("common word", "refund", {}, ["refund"]),
+    ("rare word", "model4242", {}, ["model4242"]),
+    ("two words", "courier damaged", {}, ["courier", "damaged"]),
+    ("phrase", '"charged twice"', {}, ["charged twice"]),
+    ("prefix", "model424*", {}, ["model424"]),
+    ("with filter", "login error", {"status": "New"}, ["login", "error"]),
+]
+
+
+def seed(engine, rows, batch=20000):
+    rng = random.Random(42)
+    statuses = ("New", "In Progress", "Resolved", "Resolved", "Resolved")
+    started = time.perf_counter()
+    with engine.begin() as conn:
+        for start in range(0, rows, batch):
+            params = []
+            for i in range(start, min(start + batch, rows)):
+                words = rng.choices(COMMON, k=rng.randint(15, 40))
+                words.insert(rng.randrange(len(words)), rng.choice(PRODUCTS))
+                params.append(("Web", f"Problem with {words[0]} {words[1]}", " ".join(words),
+                               ",".join(words[:3]), statuses[i % len(statuses)]))
+            conn.exec_driver_sql("INSERT INTO complaints (channel, subject, description, keywords, status) "
+                                 "VALUES (?, ?, ?, ?, ?)", params)
+    return time.perf_counter() - started
+
+
+def timed(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        out = fn()
+        times.append(time.perf_counter() - started)
+    return statistics.median(times) * 1000, out
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    path = os.path.join(tempfile.mkdtemp(prefix='bench_search_'), 'search.db')
+    engine = create_db_engine(f"sqlite:///{path}")
+    migrate(engine)
+    load = seed(engine, args.rows)
+    print(f"{args.rows} complaints inserted through the FTS triggers in {load:.1f}s ({args.rows / load:,.0f} rows/s)")
+    started = time.perf_counter()
+    with engine.begin() as conn:
+        conn.exec_driver_sql("INSERT INTO complaints_fts (complaints_fts) VALUES ('rebuild')")
+        conn.exec_driver_sql("INSERT INTO complaints_fts (complaints_fts) VALUES ('optimize')")
+    print(f"full index rebuild + optimize {time.perf_counter() - started:.1f}s, database {os.path.getsize(path) / 2**20:.0f} MB")
+
+    fields = parse_fields("id,subject,status")
+    print(f"\n{'query':12s} {'matches':>8s} {'fts page':>10s} {'LIKE scan':>10s}")
+    with engine.connect() as conn:
+        for label, q, filters, terms in QUERIES:
+            match = fts_query(q)
+            clauses = complaint_filters(**filters)
+            page_ms, _ = timed(lambda: conn.execute(build_search_query(match, fields, clauses, limit=20)).all(), args.repeat)
+            matches = conn.exec_driver_sql(
+                "SELECT count(*) FROM complaints_fts JOIN complaints ON complaints.id = complaints_fts.rowid "
+                "WHERE complaints_fts MATCH ?" + (" AND complaints.status = ?" if filters else ""),
+                (match,) + tuple(filters.values())).scalar()
+            like = " AND ".join("(subject LIKE ? OR description LIKE ? OR keywords LIKE ?)" for _ in terms)
+            like_params = tuple(f"%{t}%" for t in terms for _ in range(3))
+            if filters:
+                like += " AND status = ?"
+                like_params += tuple(filters.values())
+            like_ms, _ = timed(lambda: conn.exec_driver_sql(f"SELECT id FROM complaints WHERE {like}", like_params).all(),
+                               max(1, args.repeat // 2))
+            print(f"{label:12s} {matches:8d} {page_ms:8.1f}ms {like_ms:8.1f}ms")
+    engine.dispose()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+"""Benchmark: preloaded lexicon sentiment scorer vs TextBlob.
+
+    python benchmarks/bench_sentiment.py [--db ./complaints.db] [--synthetic 2000] [--repeat 3]
+
+Scores the complaint descriptions stored in the database (plus synthetic texts so there is always a
+corpus), reports label agreement with TextBlob and with the sentiment already stored per complaint,
+and prints the cold-start cost (first call, lexicon loading included) and microseconds per text.
+"""
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app import sentiment_analyzer
+from app.sentiment_analyzer import polarity_label
+
+PHRASES = ["the product is great", "delivery was terribly slow", "support was not helpful", "I am very happy",
+           "this is not good", "the refund never arrived", "absolutely awful experience!", "it works fine",
+           "my order is late again", "thanks for the quick help", "the screen is broken", "really disappointed"]
+FILLER = "hello I am writing about my order from last week and the invoice that came with it".split()
+
+
+def make_text(rng):
+    parts = []
+    for _ in range(rng.randint(2, 6)):
+        parts.append(" ".join(rng.choice(FILLER) for _ in range(rng.randint(3, 12))))
+        parts.append(rng.choice(PHRASES))
+    return ". ".join(parts)
+
+
+def load_corpus(db_path):
+    if not os.path.exists(db_path):
+        return []
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    try:
+        return conn.execute("SELECT description, sentiment FROM complaints WHERE description IS NOT NULL").fetchall()
+    finally:
+        conn.close()
+
+
+def textblob_label(text):
+    from textblob import TextBlob
+    return polarity_label(TextBlob(text).sentiment.polarity)
+
+
+def timed(fn):
+    start = time.perf_counter()
+    out = fn()
+    return out, time.perf_counter() - start
+
+
+def agreement(a, b):
+    pairs = [(x, y) for x, y in zip(a, b) if y]
+    return sum(x == y for x, y in pairs) / len(pairs) if pairs else None, len(pairs)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--db', default='./complaints.db')
+    parser.add_argument('--synthetic', type=int, default=2000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    stored = load_corpus(args.db)
+    rng = random.Random(42)
+    texts = [d for d, _ in stored] + [make_text(rng) for _ in range(args.synthetic)]
+    print(f"{len(stored)} stored complaints + {args.synthetic} synthetic texts")
+
+    # cold start: the first call pays for loading the lexicon / TextBlob's lazy corpus
+    _, cold_lex = timed(lambda: sentiment_analyzer.score(texts[0]))
+    _, cold_tb = timed(lambda: textblob_label(texts[0]))
+    print(f"first call: lexicon {cold_lex * 1000:.1f} ms, TextBlob {cold_tb * 1000:.1f} ms")
+
+    best_tb = best_lex = float('inf')
+    for _ in range(args.repeat):
+        tb_labels, t = timed(lambda: [textblob_label(x) for x in texts])
+        best_tb = min(best_tb, t)
+        lex_labels, t = timed(lambda: sentiment_analyzer.local_sentiment_many(texts))
+        best_lex = min(best_lex, t)
+    n = len(texts)
+    print(f"TextBlob per text        {best_tb / n * 1e6:9.1f} us")
+    print(f"lexicon score_many       {best_lex / n * 1e6:9.1f} us   x{best_tb / best_lex:.1f}")
+
+    rate, count = agreement(lex_labels, tb_labels)
+    print(f"label agreement with TextBlob: {rate:.3f} over {count} texts")
+    if stored:
+        k = len(stored)
+        rate, count = agreement(lex_labels[:k], [s for _, s in stored])
+        if count:
+            print(f"label agreement with stored sentiment: {rate:.3f} over {count} complaints")
+        rate, count = agreement(tb_labels[:k], [s for _, s in stored])
+        if count:
+            print(f"  (TextBlob vs stored sentiment:       {rate:.3f})")
+
+
+if __name__ == '__main__':
+    main()
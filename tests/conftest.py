@@ -0,0 +1,16 @@
+import os
+import tempfile
+
+# Point the app at a throwaway database and keep tests off the network before
+# any app module (and its load_dotenv call) is imported. load_dotenv does not
+# override variables that are already set.
+_tmpdir = tempfile.mkdtemp(prefix='complaints_test_')
+os.environ['DB_PATH'] = os.path.join(_tmpdir, 'complaints_test.db')
+for _var in ('GITHUB_TOKEN', 'LLM_API_KEY', 'OPENAI_API_KEY', 'OPENAI_KEY',
+             'SMTP_USER', 'SMTP_PASSWORD', 'IMAP_SERVER', 'ADMIN_EMAIL'):
+    os.environ[_var] = ''
+# Jobs are drained explicitly by the tests instead of by background workers
+os.environ['QUEUE_WORKERS'] = '0'
+os.environ['OUTBOX_WORKERS'] = '0'
+# No trained local classifier unless a test writes one here
+os.environ['LOCAL_MODEL_PATH'] = os.path.join(_tmpdir, 'local_model.json')
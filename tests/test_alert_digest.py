@@ -0,0 +1,105 @@
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath('.'))
+
+from sqlalchemy import select, delete
+
+from app import alert_digest, config
+from app.database import SessionLocal, init_db
+from app.models import OutboxMessage
+
+
+def _configure(monkeypatch):
+    init_db()
+    monkeypatch.setattr(config, 'ADMIN_EMAIL', 'admin@example.com')
+    monkeypatch.setattr(config, 'SMTP_SERVER', 'smtp.example.com')
+    monkeypatch.setattr(config, 'SMTP_USER', 'support@example.com')
+    monkeypatch.setattr(config, 'SMTP_PASSWORD', 'pw')
+
+
+def _digests(tag, wait=5):
+    """Subjects of the queued digest emails for departments ending in `tag`, once there are any."""
+    deadline = time.time() + wait
+    while True:
+        db = SessionLocal()
+        try:
+            subjects = db.execute(
+                select(OutboxMessage.subject)
+                .where(OutboxMessage.kind == 'alert', OutboxMessage.subject.like(f'% in %{tag}'))
+            ).scalars().all()
+        finally:
+            db.close()
+        if subjects or time.time() > deadline:
+            return sorted(subjects)
+        time.sleep(0.02)
+
+
+def _cleanup(ids, tag):
+    db = SessionLocal()
+    db.execute(delete(OutboxMessage).where(OutboxMessage.kind == 'sla', OutboxMessage.complaint_id.in_(ids)))
+    db.execute(delete(OutboxMessage).where(OutboxMessage.kind == 'alert', OutboxMessage.subject.like(f'% in %{tag}')))
+    db.commit()
+    db.close()
+
+
+def test_violations_survive_a_restart_and_are_grouped_and_deduplicated(monkeypatch):
+    _configure(monkeypatch)
+    d = alert_digest.AlertDigest(window=0.2, max_tickets=10000, dedup_seconds=3600)
+    ids = [900000 + i for i in range(200)]
+    db = SessionLocal()
+    try:
+        alerts = []
+        for i, tid in enumerate(ids):
+            dept = ['Accounts-dg', 'Logistics-dg'][i % 2]
+            sev = ['High', 'Urgent'][i % 3 == 0]
+            alerts.append({"id": tid, "department": dept, "severity": sev, "subject": f"ticket {i}"})
+        assert d.record(db, alerts) == 200
+        assert d.record(db, [{"id": ids[7], "department": "Accounts-dg", "severity": "High"}]) == 0  # repeat
+        db.commit()
+    finally:
+        db.close()
+
+    # the process that recorded them is gone; a new sender picks up the pending rows
+    restarted = alert_digest.AlertDigest(window=0.2, max_tickets=10000, dedup_seconds=3600)
+    assert restarted.snapshot()['pending'] >= 200
+    restarted.notify()
+    subjects = _digests('-dg')
+    try:
+        assert len(subjects) == 4  # department x severity
+        assert sum(int(s.split()[2]) for s in subjects) == 200
+        assert restarted.snapshot()['digests'] == 4
+        stats = d.snapshot()
+        assert stats['queued'] == 200 and stats['suppressed'] == 1
+
+        db = SessionLocal()
+        try:
+            statuses = set(db.execute(
+                select(OutboxMessage.status).where(OutboxMessage.kind == 'sla', OutboxMessage.complaint_id.in_(ids))
+            ).scalars())
+            assert statuses == {'digested'}
+            # still suppressed after the digest went out
+            assert restarted.record(db, [{"id": ids[3], "department": "Accounts-dg", "severity": "High"}]) == 0
+            db.rollback()
+        finally:
+            db.close()
+    finally:
+        restarted.stop()
+        _cleanup(ids, '-dg')
+
+
+def test_full_buffer_is_sent_before_the_window(monkeypatch):
+    _configure(monkeypatch)
+    d = alert_digest.AlertDigest(window=60, max_tickets=3)
+    ids = [910000 + i for i in range(3)]
+    db = SessionLocal()
+    d.record(db, [{"id": tid, "department": "Accounts-full", "severity": "High"} for tid in ids])
+    db.commit()
+    db.close()
+    d.notify()
+    try:
+        assert _digests('-full') == ['SLA Violations: 3 High tickets in Accounts-full']
+    finally:
+        d.stop()
+        _cleanup(ids, '-full')
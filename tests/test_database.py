@@ -0,0 +1,69 @@
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.abspath('.'))
+
+from app.database import SessionLocal, SingleWriter, db_stats, engine, init_db
+from app.models import Complaint
+
+
+def test_connections_use_wal_and_pragmas():
+    init_db()
+    stats = db_stats()
+    assert stats['journal_mode'] == 'wal'
+    assert stats['synchronous'] == 1  # NORMAL
+    assert stats['busy_timeout'] == 5000
+    assert stats['single_writer'] is not None
+
+
+def test_single_writer_is_reentrant_and_times_out():
+    w = SingleWriter(timeout=0.2)
+    assert w.acquire() and w.acquire()  # nested use in one thread
+    got = []
+    t = threading.Thread(target=lambda: got.append(w.acquire()))
+    t.start()
+    t.join()
+    assert got == [False] and w.stats()['timeouts'] == 1  # gave up, leaving the wait to SQLite
+    w.release()
+    w.release()
+    t = threading.Thread(target=lambda: got.append(w.acquire()))
+    t.start()
+    t.join()
+    assert got == [False, True]
+
+
+def test_concurrent_writers_and_readers_do_not_lock_each_other_out():
+    init_db()
+    errors = []
+
+    def write(n):
+        try:
+            for i in range(20):
+                db = SessionLocal()
+                db.add(Complaint(customer_email=f"w{n}@example.com", description=f"concurrency test {n}/{i}"))
+                db.commit()
+                db.close()
+        except Exception as e:
+            errors.append(e)
+
+    def read():
+        try:
+            deadline = time.monotonic() + 0.5
+            while time.monotonic() < deadline:
+                with engine.connect() as conn:
+                    conn.exec_driver_sql("SELECT count(*) FROM complaints").scalar()
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=write, args=(n,)) for n in range(8)] + [threading.Thread(target=read) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert errors == []
+    db = SessionLocal()
+    assert db.query(Complaint).filter(Complaint.description.like("concurrency test %")).count() == 160
+    db.close()
+    assert not db_stats()['single_writer']['held']
@@ -0,0 +1,72 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath('.'))
+
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app import dedup, job_queue
+from app.database import SessionLocal
+from app.models import Complaint, Job
+
+client = TestClient(app)
+
+BROKEN = ("My order 1234 arrived with a cracked screen and the box was crushed. "
+          "I want a replacement shipped as soon as possible please.")
+RESENT = ("My order 1234 arrived with a cracked screen and the box was crushed. "
+          "I want a replacement shipped as soon as possible, thanks.")
+BILLING = "I was charged twice for my subscription this month and need a refund of the duplicate payment."
+
+
+def _submit(email, text, key=None):
+    headers = {"Idempotency-Key": key} if key else {}
+    return client.post('/submit_complaint', headers=headers, json={
+        "customer_name": "Dup Tester", "customer_email": email, "complaint_description": text,
+    })
+
+
+def test_message_ids_are_normalized():
+    assert dedup.normalize_message_id(" <ABC.123@Mail.Example.COM>\n") == "abc.123@mail.example.com"
+    assert dedup.normalize_message_id("") is None
+    assert dedup.hamming(dedup.simhash(BROKEN), dedup.simhash(RESENT)) <= 5
+    assert dedup.hamming(dedup.simhash(BROKEN), dedup.simhash(BILLING)) > 5
+    assert dedup.simhash("help") is None  # too short to compare
+
+
+def test_idempotency_key_replays_the_first_response():
+    first = _submit("idem@example.com", "The courier left my parcel in the rain and it is ruined.", key="req-42")
+    again = _submit("idem@example.com", "The courier left my parcel in the rain and it is ruined.", key="req-42")
+    assert first.status_code == 202 and again.status_code == 200
+    assert again.json()['id'] == first.json()['id'] and again.json()['job_id'] == first.json()['job_id']
+    assert again.json()['status'] == 'existing'
+
+    db = SessionLocal()
+    assert db.query(Complaint).filter(Complaint.idempotency_key == "req-42").count() == 1
+    db.close()
+
+
+def test_near_duplicates_from_the_same_customer_are_linked_not_triaged():
+    original = _submit("near@example.com", BROKEN).json()
+    resend = _submit("NEAR@example.com", RESENT).json()
+    other_topic = _submit("near@example.com", BILLING).json()
+    other_customer = _submit("someone-else@example.com", BROKEN).json()
+
+    assert resend['status'] == 'duplicate' and resend['duplicate_of'] == original['id']
+    assert resend['job_id'] is None and resend['complaint']['status'] == 'Duplicate'
+    assert other_topic['duplicate_of'] is None and other_topic['job_id'] is not None
+    assert other_customer['duplicate_of'] is None
+
+    db = SessionLocal()
+    assert [j.kind for j in db.query(Job).filter(Job.complaint_id == resend['id'])] == ['acknowledge']
+    assert db.get(Complaint, resend['id']).sla_due_at is None  # never raises an SLA alert
+    db.close()
+
+    # linked while the original was still queued: its triage is copied once it finishes
+    job_queue.run_pending_jobs()
+    db = SessionLocal()
+    first, linked = db.get(Complaint, original['id']), db.get(Complaint, resend['id'])
+    assert first.severity is not None and first.department is not None
+    assert [getattr(linked, f) for f in dedup._COPIED] == [getattr(first, f) for f in dedup._COPIED]
+    assert linked.status == 'Duplicate' and linked.sla_due_at is None
+    db.close()
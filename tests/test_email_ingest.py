@@ -0,0 +1,301 @@
+import os
+import sys
+import select
+import socketserver
+import threading
+import time
+from email.header import Header
+from email.mime.text import MIMEText
+
+sys.path.insert(0, os.path.abspath('.'))
+
+import pytest
+
+from app import config, email_ingestor, ingest_pipeline
+from app.database import SessionLocal, engine, init_db
+from app.models import Complaint, Job, MailboxState
+
+
+def _uids_in(spec, all_uids):
+    top = max(all_uids, default=0)
+    out = set()
+    for part in spec.split(","):
+        lo, _, hi = part.partition(":")
+        lo = top if lo == "*" else int(lo)
+        hi = lo if not hi else (top if hi == "*" else int(hi))
+        lo, hi = min(lo, hi), max(lo, hi)
+        out.update(u for u in all_uids if lo <= u <= hi)
+    return out
+
+
+class _IMAPHandler(socketserver.StreamRequestHandler):
+    """Just enough IMAP4rev1 for imaplib: LOGIN, SELECT, UID SEARCH/FETCH/STORE, IDLE, NOOP, LOGOUT."""
+
+    def reply(self, line):
+        self.wfile.write(line.encode() + b"\r\n")
+
+    def handle(self):
+        box = self.server
+        self.reply("* OK stub IMAP4rev1 ready")
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            tag, _, rest = line.decode().strip().partition(" ")
+            cmd, _, args = rest.partition(" ")
+            cmd = cmd.upper()
+            box.commands.append(cmd if cmd != "UID" else "UID " + args.split(" ", 1)[0].upper())
+            if cmd == "CAPABILITY":
+                self.reply("* CAPABILITY IMAP4rev1 " + ("IDLE" if box.idle else ""))
+                self.reply(f"{tag} OK done")
+            elif cmd == "LOGIN":
+                self.reply(f"{tag} OK logged in")
+            elif cmd == "SELECT":
+                self.reply(f"* {len(box.messages)} EXISTS")
+                self.reply(f"* OK [UIDVALIDITY {box.uidvalidity}] ok")
+                self.reply(f"{tag} OK [READ-WRITE] selected")
+            elif cmd == "UID":
+                sub, _, args = args.partition(" ")
+                self.uid(tag, sub.upper(), args)
+            elif cmd == "IDLE":
+                self.idle(tag)
+            elif cmd == "NOOP":
+                self.reply(f"{tag} OK noop")
+            elif cmd == "LOGOUT":
+                self.reply("* BYE")
+                self.reply(f"{tag} OK bye")
+                return
+            else:
+                self.reply(f"{tag} BAD unknown command")
+
+    def uid(self, tag, sub, args):
+        box = self.server
+        uids = sorted(box.messages)
+        if sub == "SEARCH":
+            words = args.split()
+            found = set(uids)
+            if "UID" in words:
+                found &= _uids_in(words[words.index("UID") + 1], uids)
+            if "UNSEEN" in words:
+                found = {u for u in found if u not in box.seen}
+            self.reply("* SEARCH " + " ".join(str(u) for u in sorted(found)))
+        elif sub == "FETCH":
+            for u in sorted(_uids_in(args.split(" ", 1)[0], uids)):
+                raw = box.messages[u]
+                self.wfile.write(f"* {uids.index(u) + 1} FETCH (UID {u} BODY[] {{{len(raw)}}}\r\n".encode() + raw + b")\r\n")
+        elif sub == "STORE":
+            box.seen.update(_uids_in(args.split(" ", 1)[0], uids))
+        self.reply(f"{tag} OK UID {sub} done")
+
+    def idle(self, tag):
+        box = self.server
+        self.reply("+ idling")
+        known = len(box.messages)
+        while True:
+            if select.select([self.connection], [], [], 0.05)[0]:
+                self.rfile.readline()  # DONE
+                self.reply(f"{tag} OK IDLE terminated")
+                return
+            if len(box.messages) != known:
+                known = len(box.messages)
+                self.reply(f"* {known} EXISTS")
+
+
+def _raw(i):
+    msg = MIMEText(f"My order {i} arrived broken, please help.")
+    msg['From'] = f"Customer {i} <customer{i}@example.com>"
+    msg['Subject'] = f"Broken order {i}"
+    return msg.as_bytes()
+
+
+@pytest.fixture
+def imap_server(monkeypatch):
+    server = socketserver.ThreadingTCPServer(("127.0.0.1", 0), _IMAPHandler)
+    server.daemon_threads = True
+    server.messages, server.seen, server.commands = {}, set(), []
+    server.uidvalidity, server.idle = 7, True
+    server.add = lambda raw: server.messages.__setitem__(max(server.messages, default=0) + 1, raw)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    monkeypatch.setattr(config, 'IMAP_SERVER', '127.0.0.1')
+    monkeypatch.setattr(config, 'IMAP_PORT', server.server_address[1])
+    monkeypatch.setattr(config, 'IMAP_SSL', False)
+    monkeypatch.setattr(config, 'IMAP_USER', 'support@example.com')
+    monkeypatch.setattr(config, 'IMAP_PASSWORD', 'pw')
+    monkeypatch.setattr(email_ingestor, '_session', None)
+    init_db()
+    with engine.begin() as conn:
+        conn.execute(MailboxState.__table__.delete())
+    yield server
+    if email_ingestor._session is not None:
+        email_ingestor._session.close()
+    server.shutdown()
+    server.server_close()
+
+
+def _email_subjects():
+    db = SessionLocal()
+    try:
+        return {c.subject for c in db.query(Complaint).filter(Complaint.channel == 'Email')}
+    finally:
+        db.close()
+
+
+def test_backlog_is_fetched_in_uid_batches_over_one_session(imap_server, monkeypatch):
+    monkeypatch.setattr(config, 'IMAP_FETCH_BATCH', 50)
+    for i in range(120):
+        imap_server.add(_raw(i))
+    imap_server.seen.add(1)  # already read by someone: skipped
+
+    assert email_ingestor.poll_inbox_once() == 119
+    assert imap_server.commands.count('UID FETCH') == 3
+    assert 1 <= imap_server.commands.count('UID STORE') <= 4  # one per batch at most, for what was stored so far
+    assert imap_server.seen == set(range(1, 121))
+    assert {f"Broken order {i}" for i in range(1, 120)} <= _email_subjects()
+    db = SessionLocal()
+    ids = [c.id for c in db.query(Complaint).filter(Complaint.subject == "Broken order 5")]
+    assert db.query(Job).filter(Job.kind == 'triage', Job.complaint_id.in_(ids)).count() == 1
+    db.close()
+
+    imap_server.add(_raw(500))
+    imap_server.add(_raw(501))
+    assert email_ingestor.poll_inbox_once() == 2
+    assert imap_server.commands.count('LOGIN') == 1  # the session was kept
+    assert email_ingestor.poll_inbox_once() == 0
+
+    db = SessionLocal()
+    state = db.query(MailboxState).one()
+    db.close()
+    assert (state.uidvalidity, state.last_uid) == (7, 122)
+
+
+def test_new_uidvalidity_resets_the_watermark(imap_server):
+    for i in range(3):
+        imap_server.add(_raw(600 + i))
+    assert email_ingestor.poll_inbox_once() == 3
+
+    # the mailbox was recreated: UIDs start over below the old watermark
+    imap_server.messages, imap_server.seen = {}, set()
+    imap_server.uidvalidity = 8
+    imap_server.add(_raw(700))
+    email_ingestor._session.close()
+    assert email_ingestor.poll_inbox_once() == 1
+    assert "Broken order 700" in _email_subjects()
+
+
+def test_idle_picks_up_new_mail_without_polling(imap_server, monkeypatch):
+    monkeypatch.setattr(config, 'IMAP_POLL_INTERVAL', 3600)
+    stop = threading.Event()
+    t = threading.Thread(target=email_ingestor.start_polling_loop, args=(stop,), daemon=True)
+    t.start()
+    deadline = time.time() + 5
+    while 'IDLE' not in imap_server.commands and time.time() < deadline:
+        time.sleep(0.02)
+
+    imap_server.add(_raw(800))
+    deadline = time.time() + 5
+    while "Broken order 800" not in _email_subjects() and time.time() < deadline:
+        time.sleep(0.05)
+    assert "Broken order 800" in _email_subjects()
+    assert imap_server.commands.count('LOGIN') == 1
+
+    stop.set()
+    t.join(5)
+    assert not t.is_alive()
+
+
+def test_nothing_is_flagged_seen_until_it_is_stored(imap_server, monkeypatch):
+    for i in range(5):
+        imap_server.add(_raw(900 + i))
+
+    def broken(self, batch, done, skip=()):
+        raise RuntimeError("disk full")
+
+    monkeypatch.setattr(ingest_pipeline._Run, 'persist', broken)
+    assert email_ingestor.poll_inbox_once() == 0
+    assert imap_server.seen == set()
+    assert ingest_pipeline.pipeline_stats()['persist']['errors'] >= 5
+
+    monkeypatch.undo()  # back to the real persist (and the fixture's settings)
+    monkeypatch.setattr(config, 'IMAP_SERVER', '127.0.0.1')
+    monkeypatch.setattr(config, 'IMAP_PORT', imap_server.server_address[1])
+    monkeypatch.setattr(config, 'IMAP_SSL', False)
+    monkeypatch.setattr(config, 'IMAP_USER', 'support@example.com')
+    monkeypatch.setattr(config, 'IMAP_PASSWORD', 'pw')
+    assert email_ingestor.poll_inbox_once() == 5
+    assert imap_server.seen == set(range(1, 6))
+
+
+def test_fetch_waits_for_a_triage_backlog_and_full_queues(imap_server, monkeypatch):
+    monkeypatch.setattr(config, 'IMAP_FETCH_BATCH', 10)
+    monkeypatch.setattr(config, 'INGEST_QUEUE_SIZE', 1)
+    monkeypatch.setattr(config, 'INGEST_BACKLOG_WAIT', 0.01)
+    backlog = iter([5000, 5000] + [0] * 100)
+    monkeypatch.setattr(ingest_pipeline, 'triage_backlog', lambda: next(backlog))
+    for i in range(30):
+        imap_server.add(_raw(1000 + i))
+    waits = ingest_pipeline.STAGES['fetch'].waits
+
+    assert email_ingestor.poll_inbox_once() == 30
+    assert ingest_pipeline.STAGES['fetch'].waits >= waits + 2
+    stats = ingest_pipeline.pipeline_stats()
+    assert stats['fetch']['items'] >= 30 and stats['parse']['items'] >= 30 and stats['persist']['items'] >= 30
+    assert stats['triage'].get('queued', 0) >= 30
+
+
+def test_resent_message_id_is_stored_once(imap_server):
+    for i in range(3):
+        raw = _raw(1100 + i)
+        imap_server.add(raw.replace(b"Subject:", f"Message-ID: <Resend-{i % 2}@Example.com>\nSubject:".encode(), 1))
+
+    assert email_ingestor.poll_inbox_once() == 2  # the third reuses the first one's Message-ID
+    assert imap_server.seen == {1, 2, 3}
+    db = SessionLocal()
+    assert db.query(Complaint).filter(Complaint.message_id.like('resend-%@example.com')).count() == 2
+    db.close()
+
+
+def test_a_message_that_cannot_be_stored_is_skipped_not_retried_forever(imap_server, monkeypatch):
+    imap_server.add(_raw(1200))
+    imap_server.add("From: Zoë Müller <zoe@example.com>\nSubject: Bestellung kaputt – bitte helfen\n\n"
+                    "Meine Bestellung kam kaputt an.\n".encode())
+    imap_server.add(_raw(1201))
+    imap_server.add(_raw(1202))
+    parse = ingest_pipeline.parse_message
+
+    def poisoned(raw):
+        fields = parse(raw)
+        if fields["subject"] == "Broken order 1201":
+            fields["subject"] = Header("Broken order 1201")  # can't be bound as a parameter
+        return fields
+
+    monkeypatch.setattr(ingest_pipeline, 'parse_message', poisoned)
+    assert email_ingestor.poll_inbox_once() == 3
+    assert imap_server.seen == {1, 2, 4}  # the skipped one stays unread for a human
+    assert {"Broken order 1200", "Bestellung kaputt – bitte helfen", "Broken order 1202"} <= _email_subjects()
+    db = SessionLocal()
+    assert db.query(Complaint).filter(Complaint.customer_name == "Zoë Müller").count() == 1
+    assert db.query(MailboxState).one().last_uid == 4
+    db.close()
+    assert email_ingestor.poll_inbox_once() == 0
+
+
+def test_a_parse_failure_stops_the_run_without_hanging(imap_server, monkeypatch):
+    monkeypatch.setattr(config, 'INGEST_QUEUE_SIZE', 1)
+    monkeypatch.setattr(config, 'INGEST_PARSE_WORKERS', 1)
+    for i in range(6):
+        imap_server.add(_raw(1300 + i))
+
+    def broken(raw):
+        raise ValueError("unparseable")
+
+    monkeypatch.setattr(ingest_pipeline, 'parse_message', broken)
+    errors = ingest_pipeline.STAGES['parse'].errors
+    t = threading.Thread(target=email_ingestor.poll_inbox_once, daemon=True)
+    t.start()
+    t.join(10)
+    assert not t.is_alive()
+    assert ingest_pipeline.STAGES['parse'].errors > errors and imap_server.seen == set()
+
+    monkeypatch.setattr(ingest_pipeline, 'parse_message', email_ingestor.parse_message)
+    assert email_ingestor.poll_inbox_once() == 6
@@ -0,0 +1,75 @@
+import os
+import sys
+from email.mime.application import MIMEApplication
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+
+sys.path.insert(0, os.path.abspath('.'))
+
+from app import config
+from app.utils.extract_metadata import extract_text, html_to_text, parse_email_bytes, strip_quotes_and_signature
+
+
+def _alternative(plain=None, html=None, attachment=None):
+    msg = MIMEMultipart('mixed')
+    alt = MIMEMultipart('alternative')
+    if plain is not None:
+        alt.attach(MIMEText(plain, 'plain', 'utf-8'))
+    if html is not None:
+        alt.attach(MIMEText(html, 'html', 'utf-8'))
+    msg.attach(alt)
+    if attachment is not None:
+        part = MIMEApplication(attachment, Name="invoice.pdf")
+        part['Content-Disposition'] = 'attachment; filename="invoice.pdf"'
+        msg.attach(part)
+    msg['Subject'] = 'Order problem'
+    return msg.as_bytes()
+
+
+def test_html_only_alternative_is_converted_to_text():
+    html = ("<html><head><style>p {color: red}</style><script>track()</script></head><body>"
+            "<p>My blender&nbsp;stopped working.</p><div>Order <b>#77</b></div></body></html>")
+    text = extract_text(_alternative(html=html))
+    assert text == "My blender\xa0stopped working.\n\nOrder #77"
+
+
+def test_plain_text_is_preferred_and_attachments_are_skipped():
+    raw = _alternative(plain="The invoice total is wrong.", html="<p>The invoice total is wrong.</p>",
+                       attachment=b"%PDF-1.4 SECRET-ATTACHMENT-BYTES" * 1000)
+    assert extract_text(raw) == "The invoice total is wrong."
+
+
+def test_parts_and_messages_are_capped(monkeypatch):
+    monkeypatch.setattr(config, 'EMAIL_PART_MAX_BYTES', 1000)
+    body = "refund please " * 100_000  # 1.4 MB, sent base64-encoded
+    text = extract_text(_alternative(plain=body))
+    assert text.startswith("refund please refund") and 900 <= len(text) <= 1000
+
+    # nothing past EMAIL_MAX_BYTES is parsed at all
+    msg = parse_email_bytes(_alternative(plain="short", attachment=b"x" * 3_000_000), max_bytes=100_000)
+    assert sum(len(str(p.get_payload())) for p in msg.walk() if not p.is_multipart()) < 100_000
+
+
+def test_quoted_replies_and_signatures_are_stripped():
+    reply = (
+        "Still no refund for order 9.\n"
+        "\n"
+        "--\n"
+        "Jane Doe\n"
+        "Head of Things\n"
+    )
+    assert strip_quotes_and_signature(reply) == "Still no refund for order 9."
+    thread = (
+        "It broke again today.\n"
+        "On Mon, 3 Jun 2024 at 10:02, Support <help@example.com>\n"
+        "wrote:\n"
+        "> We replaced the part.\n"
+    )
+    assert strip_quotes_and_signature(thread) == "It broke again today."
+    outlook = "Please call me.\nFrom: Support\nSent: Monday\nSubject: Re: ticket\nOld text"
+    assert strip_quotes_and_signature(outlook) == "Please call me."
+    assert strip_quotes_and_signature("> only a quote") == "> only a quote"
+
+
+def test_html_to_text_handles_unclosed_markup():
+    assert html_to_text("<p>broken <b>markup" + "<" * 5 + " tail").startswith("broken markup")
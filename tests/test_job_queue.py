@@ -0,0 +1,94 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath('.'))
+
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app import config, job_queue
+from app.database import SessionLocal
+from app.models import Job
+
+client = TestClient(app)
+
+
+def _new_job(kind, max_attempts=3):
+    db = SessionLocal()
+    job = job_queue.enqueue(db, kind, None, max_attempts=max_attempts)
+    db.commit()
+    job_id = job.id
+    db.close()
+    return job_id
+
+
+def _job(job_id):
+    db = SessionLocal()
+    j = db.query(Job).filter(Job.id == job_id).first()
+    db.close()
+    return j
+
+
+def test_submit_returns_202_and_job_completes():
+    r = client.post('/submit_complaint', json={
+        "customer_name": "Zed",
+        "customer_email": "zed@example.com",
+        "complaint_description": "I was charged twice for my subscription.",
+    })
+    assert r.status_code == 202
+    job_id = r.json()['job_id']
+    assert client.get(f'/jobs/{job_id}').json()['status'] == 'queued'
+
+    job_queue.run_pending_jobs()
+    assert client.get(f'/jobs/{job_id}').json()['status'] == 'done'
+    c = client.get(f"/admin/complaint/{r.json()['id']}", headers={'x-api-key': config.ADMIN_API_KEY}).json()
+    assert c['severity'] is not None
+
+
+def test_failing_job_retries_then_dead_letters(monkeypatch):
+    calls = []
+
+    def boom(job):
+        calls.append(job.id)
+        raise RuntimeError("provider down")
+
+    monkeypatch.setitem(job_queue.HANDLERS, 'boom', boom)
+    monkeypatch.setattr(config, 'QUEUE_BACKOFF_BASE', 0.0)
+    job_id = _new_job('boom', max_attempts=3)
+
+    job_queue.run_pending_jobs()
+    j = _job(job_id)
+    assert len(calls) == 3
+    assert j.status == 'dead'
+    assert 'provider down' in j.last_error
+
+    assert job_queue.requeue_job(job_id)
+    assert _job(job_id).status == 'queued' and _job(job_id).last_error is None
+    monkeypatch.setitem(job_queue.HANDLERS, 'boom', lambda job: None)
+    job_queue.run_pending_jobs()
+    assert _job(job_id).status == 'done'
+
+
+def test_recover_requeues_interrupted_jobs(monkeypatch):
+    monkeypatch.setitem(job_queue.HANDLERS, 'noop', lambda job: None)
+    job_id = _new_job('noop')
+    claimed = job_queue.claim_job(['noop'])
+    assert claimed.id == job_id
+    assert _job(job_id).status == 'running'
+
+    # simulate a crash: the claimed job is never completed
+    assert job_queue.recover_jobs() >= 1
+    assert _job(job_id).status == 'queued'
+    job_queue.run_pending_jobs()
+    assert _job(job_id).status == 'done'
+
+
+def test_recover_dead_letters_jobs_interrupted_on_their_last_attempt(monkeypatch):
+    monkeypatch.setitem(job_queue.HANDLERS, 'crash', lambda job: None)
+    job_id = _new_job('crash', max_attempts=2)
+    for _ in range(2):
+        # claimed, then the process dies before the job finishes
+        assert job_queue.claim_job(['crash']).id == job_id
+        job_queue.recover_jobs()
+    j = _job(job_id)
+    assert j.status == 'dead' and j.attempts == 2 and 'last attempt' in j.last_error
@@ -0,0 +1,59 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath('.'))
+
+from app import llm_utils
+from app.database import init_db
+from app.llm_cache import LLMCache, LRUCache, make_key
+
+
+class _Resp:
+    status_code = 200
+    is_error = False
+
+    def json(self):
+        return {"choices": [{"message": {"content": "Negative"}}]}
+
+
+def test_lru_evicts_and_expires(monkeypatch):
+    lru = LRUCache(max_entries=2, ttl=60)
+    lru.put('a', '1')
+    lru.put('b', '2')
+    assert lru.get('a') == '1'  # 'a' is now most recently used
+    lru.put('c', '3')
+    assert lru.get('b') is None
+    assert lru.evictions == 1
+
+    import app.llm_cache as mod
+    now = mod.time.time()
+    monkeypatch.setattr(mod.time, 'time', lambda: now + 120)
+    assert lru.get('a') is None
+    assert lru.expirations == 1
+
+
+def test_sqlite_tier_survives_memory_clear():
+    init_db()
+    c = LLMCache(max_entries=10, ttl=3600, persist=True, db_max_entries=100)
+    key = make_key('m', None, 'prompt', 0.0)
+    c.put(key, 'cached answer', model='m')
+    c.memory.clear()
+    assert c.get(key) == 'cached answer'
+    assert c.stats()['db_hits'] == 1
+    assert c.get(make_key('m', None, 'other prompt', 0.0)) is None
+    assert c.stats()['misses'] == 1
+
+
+def test_call_llm_hits_cache_even_while_circuit_open(monkeypatch):
+    posts = []
+    monkeypatch.setattr(llm_utils, '_build_headers_and_url', lambda: ('http://llm.invalid', {'Authorization': 'Bearer x'}))
+    monkeypatch.setattr(llm_utils.llm_client, 'post', lambda *a, **k: posts.append(1) or _Resp())
+    monkeypatch.setattr(llm_utils, 'llm_cache', LLMCache(max_entries=10, ttl=3600, persist=False, db_max_entries=0))
+    monkeypatch.setattr(llm_utils.config, 'LLM_CACHE_ENABLED', True)
+
+    assert llm_utils.call_llm('same prompt') == 'Negative'
+    monkeypatch.setattr(llm_utils, '_breakers', {})
+    llm_utils.breaker_for('llm.invalid').trip(3600)
+    assert llm_utils.call_llm('same prompt') == 'Negative'
+    assert llm_utils.call_llm('new prompt') is None
+    assert len(posts) == 1
@@ -0,0 +1,142 @@
+import asyncio
+import json
+import os
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.abspath('.'))
+
+import pytest
+
+from app import config, llm_utils
+from app.database import SessionLocal, init_db
+from app.models import Complaint
+from app.llm_client import LLMClient
+
+
+class _StubLLM(BaseHTTPRequestHandler):
+    """Chat-completions stand-in: echoes the prompt back and records the client port."""
+    protocol_version = 'HTTP/1.1'
+    peers = []
+    unknown_models = set()
+    bodies = []
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        self.peers.append(self.client_address[1])
+        self.bodies.append(body)
+        if body['model'] in self.unknown_models:
+            status, out = 404, {"error": {"code": "unknown_model"}}
+        else:
+            status, out = 200, {"choices": [{"message": {"content": "echo:" + body['messages'][-1]['content']}}],
+                                "usage": {"prompt_tokens": 11, "completion_tokens": 4}}
+        data = json.dumps(out).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def stub(monkeypatch):
+    server = ThreadingHTTPServer(('127.0.0.1', 0), _StubLLM)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    _StubLLM.peers = []
+    _StubLLM.unknown_models = set()
+    _StubLLM.bodies = []
+    monkeypatch.setattr(config, 'GITHUB_TOKEN', 'test-token')
+    monkeypatch.setattr(config, 'GITHUB_MODELS_URL', f'http://127.0.0.1:{server.server_port}/chat/completions')
+    monkeypatch.setattr(config, 'LLM_CACHE_ENABLED', False)
+    client = LLMClient(max_concurrency=4)
+    monkeypatch.setattr(llm_utils, 'llm_client', client)
+    yield client
+    client.close()
+    server.shutdown()
+
+
+def test_sync_calls_reuse_one_connection(stub):
+    for i in range(5):
+        assert llm_utils.call_llm(f'prompt {i}') == f'echo:prompt {i}'
+    assert len(_StubLLM.peers) == 5
+    assert len(set(_StubLLM.peers)) == 1
+
+
+def test_endpoint_headers_are_memoized(stub, monkeypatch):
+    url, headers = stub.endpoint()
+    assert headers['Authorization'] == 'Bearer test-token'
+    assert stub.endpoint()[0] == url
+    monkeypatch.setattr(config, 'GITHUB_TOKEN', 'rotated')
+    assert stub.endpoint()[1]['Authorization'] == 'Bearer rotated'
+
+
+def test_async_calls_run_concurrently(stub):
+    async def run():
+        try:
+            return await asyncio.gather(*(llm_utils.acall_llm(f'async {i}') for i in range(10)))
+        finally:
+            await stub.aclose()
+    results = asyncio.run(run())
+    assert results == [f'echo:async {i}' for i in range(10)]
+
+
+def test_async_client_of_a_finished_loop_is_closed(stub):
+    async def call():
+        await stub.apost(*stub.endpoint(), {"model": "m", "messages": [{"role": "user", "content": "hi"}]})
+        return stub._async_client
+
+    first = asyncio.run(call())
+    second = asyncio.run(call())  # a new loop gets a new client; the old one is not leaked
+    assert second is not first and first.is_closed and not second.is_closed
+    stub.close()
+    assert second.is_closed and stub._async_client is None
+
+
+def test_unknown_model_falls_back_to_variant(stub, monkeypatch):
+    monkeypatch.setattr(config, 'LLM_MODEL', 'github/gpt-4o-mini')
+    _StubLLM.unknown_models = {'github/gpt-4o-mini'}
+    assert llm_utils.call_llm('hello') == 'echo:hello'
+
+
+def test_prompts_are_budgeted_and_usage_is_tracked(stub, monkeypatch):
+    monkeypatch.setattr(config, 'LLM_TEXT_MAX_TOKENS', 200)
+    thread = "My order 5 never arrived. " * 200 + "\nOn Mon, 3 Jun 2024 Support wrote:\n> old reply\n"
+    with llm_utils.track_usage() as usage:
+        llm_utils.triage_complaint(thread)
+        llm_utils.call_llm('second call')
+    sent = _StubLLM.bodies[0]
+    complaint = sent['messages'][-1]['content'].split("Complaint:\n", 1)[1]
+    assert sent['max_tokens'] == config.LLM_MAX_TOKENS['triage']
+    assert llm_utils.estimate_tokens(complaint) <= 200
+    assert "characters omitted" in complaint and "old reply" not in complaint
+    assert complaint.startswith("My order 5") and complaint.rstrip().endswith("never arrived.")
+    # provider-reported counts are summed per block
+    assert usage.as_dict() == {"calls": 2, "cached": 0, "prompt_tokens": 22, "completion_tokens": 8,
+                               "llm_ms": usage.llm_ms}
+
+
+def test_usage_is_stored_per_complaint(stub):
+    from fastapi.testclient import TestClient
+    from app.main import app
+    from app.utils.router import process_and_route
+    init_db()
+    db = SessionLocal()
+    c = Complaint(customer_email="tokens@example.com", description="The app crashes every time I log in.")
+    db.add(c)
+    db.commit()
+    cid = c.id
+    db.close()
+
+    result = process_and_route(cid, mode='fused')
+    assert result['llm_usage']['prompt_tokens'] == 11 and result['llm_usage']['completion_tokens'] == 4
+    db = SessionLocal()
+    c = db.get(Complaint, cid)
+    assert (c.llm_calls, c.prompt_tokens, c.completion_tokens) == (1, 11, 4)
+    db.close()
+
+    stats = TestClient(app).get('/admin/llm_usage', headers={'x-api-key': config.ADMIN_API_KEY}).json()
+    assert stats['tickets'] >= 1 and any(r['id'] == cid for r in stats['costliest'])
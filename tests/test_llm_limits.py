@@ -0,0 +1,75 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath('.'))
+
+from app import llm_utils
+from app.llm_utils import CircuitBreaker, RateLimiter
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_bulk_lane_leaves_quota_for_urgent(monkeypatch):
+    clock = _Clock()
+    monkeypatch.setattr(llm_utils.time, 'monotonic', clock)
+    lim = RateLimiter(rpm=10, tpm=0, reserve={"urgent": 0.0, "normal": 0.1, "bulk": 0.5},
+                      max_wait={"urgent": 0.0, "normal": 0.0, "bulk": 0.0})
+    key = ('provider', 'model')
+    admitted_bulk = sum(lim.acquire(key, 100, 'bulk') for _ in range(10))
+    assert admitted_bulk == 5
+    assert lim.acquire(key, 100, 'urgent')
+    m = lim.stats()['lanes']
+    assert m['bulk'] == {"admitted": 5, "throttled": 0, "shed": 5}
+    assert m['urgent']['admitted'] == 1
+
+    # refill: 10/min -> one request every 6 seconds
+    assert lim.try_acquire(key, 1, 'bulk') > 0
+    clock.now += 60
+    assert lim.try_acquire(key, 1, 'bulk') == 0
+
+
+def test_token_bucket_limits_large_prompts(monkeypatch):
+    clock = _Clock()
+    monkeypatch.setattr(llm_utils.time, 'monotonic', clock)
+    lim = RateLimiter(rpm=0, tpm=1000, reserve={"normal": 0.0}, max_wait={"normal": 0.0})
+    assert lim.acquire('k', 600, 'normal')
+    assert not lim.acquire('k', 600, 'normal')
+    assert lim.try_acquire('k', 600, 'normal') == 12.0  # 200 tokens missing at 1000/min
+
+
+def test_circuit_breaker_half_open_probe(monkeypatch):
+    clock = _Clock()
+    monkeypatch.setattr(llm_utils.time, 'monotonic', clock)
+    b = CircuitBreaker(failure_threshold=2, open_seconds=10, max_open_seconds=100)
+    b.record_failure()
+    assert b.allow()
+    b.record_failure()
+    assert b.state == 'open' and not b.allow()
+
+    clock.now += 10
+    assert b.allow()          # the single half-open probe
+    assert not b.allow()      # everyone else waits for its outcome
+    b.record_failure()        # probe failed: open again for twice as long
+    clock.now += 10
+    assert not b.allow()
+    clock.now += 10
+    assert b.allow()
+    b.record_success()
+    assert b.state == 'closed' and b.allow()
+
+
+def test_retry_after_is_capped(monkeypatch):
+    clock = _Clock()
+    monkeypatch.setattr(llm_utils.time, 'monotonic', clock)
+    b = CircuitBreaker(failure_threshold=5, open_seconds=10, max_open_seconds=300)
+    b.trip(71085)
+    clock.now += 299
+    assert not b.allow()
+    clock.now += 1
+    assert b.allow()
@@ -0,0 +1,93 @@
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath('.'))
+
+import pytest
+
+from app import migrations
+from app.database import create_db_engine
+from app.migrations import MIGRATIONS, Migration, applied_versions, migrate
+
+# complaints as created by the first release, before any migration
+LEGACY_SCHEMA = """
+CREATE TABLE complaints (
+    id INTEGER PRIMARY KEY, customer_name VARCHAR(255), customer_email VARCHAR(255), channel VARCHAR(50) NOT NULL,
+    subject VARCHAR(512), description TEXT NOT NULL, keywords VARCHAR(512), sentiment VARCHAR(50),
+    severity VARCHAR(50), categories VARCHAR(255), department VARCHAR(255), status VARCHAR(50) NOT NULL,
+    received_at DATETIME, acknowledged_at DATETIME, resolved_at DATETIME, sla_violation BOOLEAN,
+    created_at DATETIME DEFAULT (CURRENT_TIMESTAMP), updated_at DATETIME
+)
+"""
+
+
+def _legacy_engine(rows=25):
+    path = os.path.join(tempfile.mkdtemp(prefix='migrations_'), 'legacy.db')
+    conn = sqlite3.connect(path)
+    conn.execute(LEGACY_SCHEMA)
+    conn.executemany(
+        "INSERT INTO complaints (channel, description, severity, keywords, categories, status, created_at) "
+        "VALUES ('Web', ?, ?, ?, ?, 'New', ?)",
+        [(f"old complaint {i}", "Urgent" if i % 2 else None, "refund,Late Delivery" if i % 5 == 0 else None,
+          "Billing Issue" if i % 3 == 0 else None, "2024-01-01 00:00:00") for i in range(rows)])
+    conn.commit()
+    conn.close()
+    return create_db_engine(f"sqlite:///{path}")
+
+
+def test_legacy_database_is_upgraded_and_backfilled_in_chunks(monkeypatch):
+    monkeypatch.setattr(migrations.config, 'MIGRATION_BACKFILL_CHUNK', 10)
+    eng = _legacy_engine()
+    migrate(eng)
+    applied = applied_versions(eng)
+    assert sorted(applied) == [m.version for m in MIGRATIONS]
+    assert all(done for _, done in applied.values())
+    with eng.connect() as conn:
+        cols = {r[1] for r in conn.exec_driver_sql("PRAGMA table_info('complaints')")}
+        assert {'sla_due_at', 'llm_routing', 'message_id', 'duplicate_of', 'prompt_tokens'} <= cols
+        due = dict(conn.exec_driver_sql("SELECT id, sla_due_at FROM complaints").all())
+        assert due[2] == '2024-01-01 12:00:00' and due[1] == '2024-01-04 00:00:00'  # Urgent 12h, unknown 72h
+        assert conn.exec_driver_sql("SELECT count(*) FROM outbox").scalar() == 0  # new tables created too
+        keywords = conn.exec_driver_sql("SELECT keyword, count(*), min(created_at) FROM complaint_keywords GROUP BY keyword").all()
+        assert sorted(keywords) == [('late delivery', 5, '2024-01-01 00:00:00'), ('refund', 5, '2024-01-01 00:00:00')]
+        # rows stored before the full-text index are searchable
+        assert conn.exec_driver_sql("SELECT count(*) FROM complaints_fts WHERE complaints_fts MATCH 'old'").scalar() == 25
+        # category rows and counters for the old complaints, without a rebuild at startup
+        assert conn.exec_driver_sql("SELECT count(*) FROM complaint_categories").scalar() == 9
+        counters = dict(((d, b), n) for d, b, n in conn.exec_driver_sql("SELECT dimension, bucket, count FROM summary_counters"))
+        assert counters[('total', '')] == 25 and counters[('category', 'Billing Issue')] == 9
+        assert counters[('category', 'Others')] == 16 and counters[('severity', 'Urgent')] == 12
+        # every row has a change time for the incremental export, and later raw writes keep it current
+        assert conn.exec_driver_sql("SELECT count(*) FROM complaints WHERE updated_at IS NULL").scalar() == 0
+        before = conn.exec_driver_sql("SELECT updated_at FROM complaints WHERE id = 1").scalar()
+        time.sleep(0.01)  # the change time has millisecond precision
+        conn.exec_driver_sql("UPDATE complaints SET status = 'Resolved' WHERE id = 1")
+        assert conn.exec_driver_sql("SELECT updated_at FROM complaints WHERE id = 1").scalar() > before
+    assert applied[2][0] == 25  # progress was stored chunk by chunk (10, 10, 5)
+
+
+def test_current_schema_skips_introspection(monkeypatch):
+    eng = _legacy_engine(rows=1)
+    migrate(eng)
+    monkeypatch.setattr(migrations, 'upgrade', lambda *a: pytest.fail("schema is current"))
+    monkeypatch.setattr(migrations.Base.metadata, 'create_all', lambda *a, **k: pytest.fail("schema is current"))
+    migrate(eng)
+
+
+def test_failed_step_rolls_back(monkeypatch):
+    eng = _legacy_engine(rows=1)
+    migrate(eng)
+
+    def broken(cur):
+        cur.execute("ALTER TABLE complaints ADD COLUMN half_done TEXT")
+        raise RuntimeError("boom")
+
+    monkeypatch.setattr(migrations, 'MIGRATIONS', MIGRATIONS + [Migration(len(MIGRATIONS) + 1, "broken", broken)])
+    with pytest.raises(RuntimeError):
+        migrate(eng)
+    with eng.connect() as conn:
+        assert 'half_done' not in {r[1] for r in conn.exec_driver_sql("PRAGMA table_info('complaints')")}
+    assert len(MIGRATIONS) + 1 not in applied_versions(eng)
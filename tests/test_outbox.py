@@ -0,0 +1,184 @@
+import os
+import sys
+import socketserver
+import threading
+from datetime import datetime
+
+sys.path.insert(0, os.path.abspath('.'))
+
+import pytest
+
+from app import config, outbox
+from app.database import SessionLocal, engine, init_db
+from app.models import Complaint, OutboxMessage
+from app.utils import notifier, smtp_pool
+
+
+class _SMTPHandler(socketserver.StreamRequestHandler):
+    """Just enough ESMTP for smtplib: EHLO, AUTH PLAIN, MAIL/RCPT/DATA, NOOP, RSET, QUIT."""
+
+    def reply(self, line):
+        self.wfile.write((line + "\r\n").encode())
+
+    def handle(self):
+        server = self.server
+        server.connections += 1
+        self.reply("220 stub ESMTP")
+        rcpts, sent_here = [], 0
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            cmd = line.decode().strip()
+            verb = cmd.split(" ", 1)[0].upper()
+            if verb == "EHLO":
+                self.reply("250-stub")
+                self.reply("250-PIPELINING")
+                self.reply("250 AUTH PLAIN")
+            elif verb == "AUTH":
+                server.logins += 1
+                self.reply("235 ok")
+            elif verb == "MAIL":
+                rcpts = []
+                self.reply("250 ok")
+            elif verb == "RCPT":
+                addr = cmd.split(":", 1)[1].strip("<> ")
+                if addr in server.refuse:
+                    self.reply("550 no such user")
+                else:
+                    rcpts.append(addr)
+                    self.reply("250 ok")
+            elif verb == "DATA":
+                self.reply("354 go ahead")
+                data = []
+                while True:
+                    chunk = self.rfile.readline()
+                    if chunk in (b".\r\n", b""):
+                        break
+                    data.append(chunk)
+                server.messages.extend(rcpts)
+                self.reply("250 queued")
+                sent_here += 1
+                if server.drop_after and sent_here >= server.drop_after:
+                    server.drop_after = 0
+                    return  # hang up without a word, like a server restart
+            elif verb == "NOOP" or verb == "RSET":
+                self.reply("250 ok")
+            elif verb == "QUIT":
+                self.reply("221 bye")
+                return
+            else:
+                self.reply("502 not implemented")
+
+
+@pytest.fixture
+def smtp_server(monkeypatch):
+    server = socketserver.ThreadingTCPServer(("127.0.0.1", 0), _SMTPHandler)
+    server.daemon_threads = True
+    server.connections = server.logins = server.drop_after = 0
+    server.messages, server.refuse = [], set()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    monkeypatch.setattr(config, 'SMTP_SERVER', '127.0.0.1')
+    monkeypatch.setattr(config, 'SMTP_PORT', server.server_address[1])
+    monkeypatch.setattr(config, 'SMTP_USER', 'support@example.com')
+    monkeypatch.setattr(config, 'SMTP_PASSWORD', 'pw')
+    monkeypatch.setattr(config, 'OUTBOX_BACKOFF_BASE', 0)
+    smtp_pool.close_pool()
+    init_db()
+    with engine.begin() as conn:
+        conn.execute(OutboxMessage.__table__.delete())
+    yield server
+    smtp_pool.close_pool()
+    server.shutdown()
+    server.server_close()
+
+
+def _complaints(n):
+    db = SessionLocal()
+    rows = [Complaint(customer_email=f"customer{i}@example.com", description=f"ticket {i}",
+                      received_at=datetime.utcnow()) for i in range(n)]
+    db.add_all(rows)
+    db.commit()
+    ids = [c.id for c in rows]
+    db.close()
+    return ids
+
+
+def _statuses():
+    db = SessionLocal()
+    try:
+        return {m.to_email: m.status for m in db.query(OutboxMessage)}
+    finally:
+        db.close()
+
+
+def test_acknowledgements_share_one_session_and_are_deduplicated(smtp_server):
+    ids = _complaints(5)
+    for cid in ids:
+        assert notifier.send_acknowledgement(cid)
+    assert not notifier.send_acknowledgement(ids[0])  # a retried job doesn't queue a second email
+
+    assert outbox.run_outbox_once() == 5
+    assert sorted(smtp_server.messages) == sorted(f"customer{i}@example.com" for i in range(5))
+    assert smtp_server.connections == 1 and smtp_server.logins == 1
+
+    db = SessionLocal()
+    assert all(c.acknowledged_at for c in db.query(Complaint).filter(Complaint.id.in_(ids)))
+    db.close()
+
+    # the pooled session is reused for the next batch
+    assert notifier.send_email("someone@example.com", "hi", "there")
+    assert smtp_server.connections == 1
+
+    stats = outbox.outbox_stats()
+    assert stats['depth'] == {'sent': 5}
+    assert stats['latency_ms']['samples'] >= 5 and stats['latency_ms']['p95'] is not None
+    assert stats['pool']['connects'] == 1 and stats['pool']['reuses'] >= 1
+
+
+def test_dropped_connection_is_retried_on_a_new_session(smtp_server):
+    ids = _complaints(4)
+    for cid in ids:
+        notifier.send_acknowledgement(cid)
+    smtp_server.drop_after = 2
+
+    assert outbox.send_next_batch() == 4  # two go out, the session dies, the rest are rescheduled
+    assert len(smtp_server.messages) == 2
+    assert list(_statuses().values()).count('queued') == 2
+
+    outbox.run_outbox_once()
+    assert len(smtp_server.messages) == 4
+    assert smtp_server.connections == 2
+    assert set(_statuses().values()) == {'sent'}
+
+
+def test_permanent_rejection_is_dead_lettered(smtp_server, monkeypatch):
+    monkeypatch.setattr(config, 'ADMIN_EMAIL', 'admin@example.com')
+    smtp_server.refuse.add('admin@example.com')
+    assert notifier.alert_admin_many([("one", "a"), ("two", "b")]) == 2
+    ids = _complaints(1)
+    notifier.send_acknowledgement(ids[0])
+
+    outbox.run_outbox_once()
+    db = SessionLocal()
+    statuses = sorted((m.kind, m.status, m.attempts) for m in db.query(OutboxMessage))
+    db.close()
+    assert statuses == [('ack', 'sent', 1), ('alert', 'dead', 1), ('alert', 'dead', 1)]
+
+    # a dead message can be requeued once the problem is fixed
+    smtp_server.refuse.clear()
+    db = SessionLocal()
+    dead_id = db.query(OutboxMessage).filter(OutboxMessage.status == 'dead').first().id
+    db.close()
+    assert outbox.requeue_message(dead_id)
+    db = SessionLocal()
+    assert db.get(OutboxMessage, dead_id).last_error is None
+    db.close()
+    assert outbox.run_outbox_once() == 1
+
+
+def test_messages_are_not_queued_without_smtp():
+    db = SessionLocal()
+    assert not outbox.queue_email(db, "someone@example.com", "s", "b")
+    db.close()
@@ -0,0 +1,94 @@
+import json
+import os
+import sys
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.abspath('.'))
+
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.config import ADMIN_API_KEY
+from app.database import SessionLocal
+from app.models import Complaint
+from app.summary import set_categories, set_keywords
+
+client = TestClient(app)
+
+
+def _seed(n, department):
+    db = SessionLocal()
+    for i in range(n):
+        # identical created_at values, so pages must fall back to the id tiebreak
+        db.add(Complaint(description=f"complaint {i} " + "x" * 500, channel='Web', status='New', department=department))
+    db.commit()
+    db.close()
+
+
+def _pages(url, params, headers=None):
+    ids, cursor = [], None
+    while True:
+        r = client.get(url, params=dict(params, **({"cursor": cursor} if cursor else {})), headers=headers or {})
+        assert r.status_code == 200
+        ids.extend(item['id'] for item in r.json())
+        cursor = r.headers.get('x-next-cursor')
+        if not cursor:
+            return ids, r
+
+
+def test_keyset_pages_cover_every_row_once():
+    _seed(23, 'Paging')
+    ids, last = _pages('/get_complaints', {"department": "Paging", "limit": 5, "fields": "id,department"})
+    assert len(ids) == 23 and len(set(ids)) == 23
+    assert ids == sorted(ids)
+    assert set(last.json()[0]) == {'id', 'department'}
+
+    desc, _ = _pages('/get_complaints', {"department": "Paging", "limit": 7, "order": "desc"})
+    assert desc == ids[::-1]
+
+    admin, _ = _pages('/admin/complaints', {"department": "Paging", "limit": 10}, {"x-api-key": ADMIN_API_KEY})
+    assert admin == ids
+
+
+def test_ndjson_stream_and_bad_params():
+    _seed(4, 'Streaming')
+    r = client.get('/get_complaints', params={"department": "Streaming", "format": "ndjson", "fields": "id,categories"})
+    assert r.status_code == 200
+    assert r.headers['content-type'].startswith('application/x-ndjson')
+    rows = [json.loads(line) for line in r.text.splitlines()]
+    assert len(rows) == 4
+    assert rows[0] == {"id": rows[0]['id'], "categories": []}
+
+    assert client.get('/get_complaints', params={"fields": "id,password"}).status_code == 400
+    assert client.get('/get_complaints', params={"cursor": "not-a-cursor"}).status_code == 400
+    assert client.get('/get_complaints', params={"order": "sideways"}).status_code == 400
+
+
+def test_category_and_keyword_filters_and_trends():
+    db = SessionLocal()
+    rows = []
+    for i in range(12):
+        created = datetime.utcnow() - timedelta(days=10) if i >= 9 else None  # three from the week before
+        c = Complaint(description=f"tagged {i}", channel='Web', categories='Billing Zeta' if i % 2 else 'Other Zeta',
+                      keywords='zeta refund,Zeta Card' if i % 3 == 0 else 'zeta card', created_at=created)
+        db.add(c)
+        db.flush()
+        rows.append(c)
+    set_categories(db, {c.id: c.categories for c in rows})
+    set_keywords(db, {c.id: c.keywords for c in rows})
+    db.commit()
+    ids = [c.id for c in rows]
+    db.close()
+    in_order = ids[9:] + ids[:9]  # the backdated rows sort first
+
+    billing, _ = _pages('/get_complaints', {"category": "Billing Zeta", "limit": 2, "fields": "id,categories"})
+    assert billing == [i for i in in_order if ids.index(i) % 2]
+    refund, _ = _pages('/get_complaints', {"keyword": "Zeta Refund", "limit": 2, "order": "desc"})
+    assert refund == [i for i in in_order if ids.index(i) % 3 == 0][::-1]
+    both, _ = _pages('/admin/complaints', {"category": "Billing Zeta", "keyword": "zeta refund"}, {"x-api-key": ADMIN_API_KEY})
+    assert both == [i for i in in_order if ids.index(i) % 6 == 3]
+
+    trends = client.get('/stats/keywords', params={"days": 7, "limit": 200}).json()
+    counts = {k['keyword']: k for k in trends['keywords']}
+    assert counts['zeta card'] == {"keyword": "zeta card", "count": 9, "previous": 3, "change": 6}
+    assert counts['zeta refund']['count'] == 3 and counts['zeta refund']['previous'] == 1
@@ -0,0 +1,166 @@
+"""Query-plan regression check: the SQL behind the endpoints and background scans must not fall back to
+full table scans (or sort a listing page) on a large database.
+
+The database is seeded with QUERY_PLAN_ROWS complaints (default 1,000,000; set it lower for a quick
+local run). The real endpoints and scanners run against it while their statements are recorded, and
+each recorded statement is then checked with EXPLAIN QUERY PLAN, with and without ANALYZE statistics.
+"""
+import os
+import re
+import sys
+import tempfile
+from datetime import datetime
+
+sys.path.insert(0, os.path.abspath('.'))
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+from sqlalchemy.orm import sessionmaker
+
+from app import config, dedup, ingest_pipeline, job_queue, outbox, sla_monitor, summary
+from app.database import create_db_engine
+from app.main import app
+from app.migrations import migrate
+from app.routes import admin, complaints
+from app.utils import pagination
+
+ROWS = int(os.getenv("QUERY_PLAN_ROWS", 1_000_000))
+TABLES = ("complaints", "jobs", "outbox", "complaint_categories", "complaint_keywords", "complaint_signatures")
+
+SEED_COMPLAINTS = """
+WITH RECURSIVE seq(n) AS (SELECT 1 UNION ALL SELECT n + 1 FROM seq WHERE n < ?)
+INSERT INTO complaints (customer_name, customer_email, channel, description, severity, categories, department,
+                        status, sla_violation, sla_due_at, llm_calls, prompt_tokens, completion_tokens, llm_ms, created_at)
+SELECT 'Customer ' || (n % 5000), 'c' || (n % 5000) || '@example.com', 'Web', 'Seeded complaint ' || n,
+       CASE n % 4 WHEN 0 THEN 'Low' WHEN 1 THEN 'Medium' WHEN 2 THEN 'High' ELSE 'Urgent' END,
+       'Delivery Problem',
+       CASE n % 7 WHEN 0 THEN 'Accounts' WHEN 1 THEN 'Product Engineering' WHEN 2 THEN 'Finance'
+            WHEN 3 THEN 'Technical Support' WHEN 4 THEN 'Logistics' WHEN 5 THEN 'Customer Experience'
+            ELSE 'General Support' END,
+       CASE n % 10 WHEN 0 THEN 'New' WHEN 1 THEN 'In Progress' ELSE 'Resolved' END,
+       n % 30 = 1, datetime('2100-01-01', '+' || n || ' seconds'),
+       n % 3, (n % 3) * 400, (n % 3) * 60, (n % 3) * 900,
+       datetime('2024-01-01', '+' || (n * 30) || ' seconds')
+FROM seq
+"""
+SEED_TAGS = """
+INSERT INTO complaint_categories (complaint_id, category, created_at)
+SELECT id, CASE id % 5 WHEN 0 THEN 'Billing Issue' ELSE 'Delivery Problem' END, created_at FROM complaints;
+INSERT INTO complaint_keywords (complaint_id, keyword, created_at)
+SELECT id, 'keyword ' || (id % 400), created_at FROM complaints
+UNION ALL SELECT id, 'refund', created_at FROM complaints WHERE id % 3 = 0
+"""
+SEED_QUEUES = """
+WITH RECURSIVE seq(n) AS (SELECT 1 UNION ALL SELECT n + 1 FROM seq WHERE n < ?)
+INSERT INTO {table} (kind, complaint_id, status, attempts, max_attempts, run_after{extra_cols})
+SELECT CASE n % 2 WHEN 0 THEN 'triage' ELSE 'ack' END, n, CASE n % 50 WHEN 0 THEN 'queued' ELSE 'done' END,
+       1, 5, datetime('2024-01-01', '+' || n || ' seconds'){extra_vals}
+FROM seq
+"""
+
+
+@pytest.fixture(scope="module")
+def seeded():
+    path = os.path.join(tempfile.mkdtemp(prefix='query_plans_'), 'seeded.db')
+    eng = create_db_engine(f"sqlite:///{path}")
+    migrate(eng)
+    with eng.begin() as conn:
+        conn.exec_driver_sql(SEED_COMPLAINTS, (ROWS,))
+        for statement in SEED_TAGS.split(";"):
+            conn.exec_driver_sql(statement)
+        conn.exec_driver_sql(SEED_QUEUES.format(table="jobs", extra_cols="", extra_vals=""), (ROWS // 100,))
+        conn.exec_driver_sql(SEED_QUEUES.format(
+            table="outbox", extra_cols=", to_email, subject, body, dedup_key",
+            extra_vals=", 'c@example.com', 'Ticket', 'Body', 'c@example.com|' || n"), (ROWS // 100,))
+    yield eng
+    eng.dispose()
+
+
+def _record_statements(eng, monkeypatch):
+    """Point the app at `eng`, run every endpoint and scanner query once, and return the SQL they issued."""
+    session = sessionmaker(bind=eng, autoflush=False)
+    for module in (admin, complaints, sla_monitor):
+        monkeypatch.setattr(module, 'SessionLocal', session)
+    for module in (pagination, ingest_pipeline, outbox, job_queue):
+        monkeypatch.setattr(module, 'engine', eng)
+    monkeypatch.setattr(config, 'SUMMARY_COUNTERS', False)  # the GROUP BY fallback of GET /get_summary
+
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if not executemany and statement.lstrip().upper().startswith(("SELECT", "UPDATE", "DELETE", "WITH")):
+            statements.append((statement, parameters))
+
+    event.listen(eng, "before_cursor_execute", record)
+    try:
+        client = TestClient(app)
+        auth = {'x-api-key': config.ADMIN_API_KEY}
+        for query in ("", "?order=desc", "?status=New", "?severity=High", "?department=Logistics",
+                      "?status=In Progress&severity=Urgent", "?date_from=2024-03-01&date_to=2024-03-02",
+                      "?status=New&fields=id,status&order=desc", "?category=Billing Issue",
+                      "?keyword=keyword 7&order=desc", "?category=Billing Issue&keyword=refund&status=New",
+                      "?keyword=refund&date_from=2024-03-01&date_to=2024-03-02"):
+            r = client.get('/get_complaints' + query)
+            assert r.status_code == 200
+            if r.headers.get('X-Next-Cursor'):
+                client.get('/get_complaints' + (query + '&' if query else '?') + 'cursor=' + r.headers['X-Next-Cursor'])
+        client.get('/admin/complaints?department=Finance&order=desc', headers=auth)
+        client.get('/admin/complaint/12345', headers=auth)
+        client.get('/get_summary')
+        client.get('/stats/keywords?days=30')
+        client.get('/search?q=4242 complaint&status=New')
+        client.get('/admin/llm_usage', headers=auth)
+        client.get('/admin/ingest', headers=auth)
+        client.get('/admin/outbox', headers=auth)
+        client.get('/admin/jobs?status=dead', headers=auth)
+        client.get('/admin/jobs?complaint_id=77', headers=auth)
+        sla_monitor.check_sla_once()
+        sla_monitor.next_deadline()
+        job_queue.claim_job()
+        outbox.claim_batch()
+        db = session()
+        summary.trending_keywords(db, days=7, now=datetime(2024, 3, 1))  # inside the seeded range
+        dedup.find_near_duplicate(db, 'c1@example.com', dedup.simhash("my parcel arrived broken and late again"))
+        db.close()
+    finally:
+        event.remove(eng, "before_cursor_execute", record)
+    return statements
+
+
+def _plan(eng, statement, parameters):
+    with eng.connect() as conn:
+        return [row[-1] for row in conn.exec_driver_sql("EXPLAIN QUERY PLAN " + statement, parameters).all()]
+
+
+def _problems(plan, statement, partial_indexes):
+    found = []
+    for step in plan:
+        m = re.fullmatch(r"SCAN (%s)(?: USING (COVERING )?INDEX (\w+))?" % "|".join(TABLES), step)
+        if not m or m.group(2):
+            continue
+        # walking a non-covering index is only fine for an unfiltered page or a partial index
+        if m.group(3) is None or (re.search(r"\bWHERE\b", statement) and m.group(3) not in partial_indexes):
+            found.append(step)
+    if "_cursor_created" in statement:  # a listing page
+        found += [step for step in plan if step.startswith("USE TEMP B-TREE FOR ORDER BY")]
+    return found
+
+
+@pytest.mark.parametrize("analyzed", [False, True], ids=["no-stats", "analyzed"])
+def test_hot_queries_use_indexes(seeded, monkeypatch, analyzed):
+    if analyzed:
+        with seeded.begin() as conn:
+            conn.exec_driver_sql("ANALYZE")
+    statements = _record_statements(seeded, monkeypatch)
+    assert len(statements) > 20
+    with seeded.connect() as conn:
+        partial_indexes = {name for name, sql in conn.exec_driver_sql(
+            "SELECT name, sql FROM sqlite_master WHERE type = 'index' AND sql LIKE '% WHERE %'")}
+    failures = []
+    for statement, parameters in statements:
+        plan = _plan(seeded, statement, parameters)
+        problems = _problems(plan, statement, partial_indexes)
+        if problems:
+            failures.append(f"{' '.join(statement.split())}\n    -> {problems} in {plan}")
+    assert not failures, "queries without a usable index:\n" + "\n".join(failures)
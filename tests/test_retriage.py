@@ -0,0 +1,98 @@
+import json
+import os
+import re
+import sys
+import threading
+
+sys.path.insert(0, os.path.abspath('.'))
+
+from app import llm_utils, retriage
+from app.database import SessionLocal, init_db
+from app.models import Complaint, RetriageRun
+
+
+def _seed(n):
+    init_db()
+    db = SessionLocal()
+    start = db.query(Complaint.id).order_by(Complaint.id.desc()).limit(1).scalar() or 0
+    for i in range(n):
+        db.add(Complaint(description=f"My parcel {i} is late again", channel='Web', status='New'))
+    db.commit()
+    db.close()
+    return start
+
+
+def _fake_batch_llm(calls):
+    def fake(prompt, system=None, temperature=0.0, max_tokens=512, priority=None):
+        calls.append(llm_utils._lane.get())
+        llm_utils._usage.get().add(100, 10, 5)  # what a real call records
+        ids = [int(x) for x in re.findall(r'"id": (\d+)', prompt)]
+        # answer for every item except the last one, which must fall back to heuristics
+        return json.dumps({"results": [
+            {"id": i, "categories": ["Delivery Problem"], "confidence": 0.9, "sentiment": "Negative",
+             "severity": "Medium", "routed_department": "Logistics", "justification": "late"}
+            for i in ids[:-1]
+        ]})
+    return fake
+
+
+def test_retriage_packs_batches_and_bulk_updates(monkeypatch):
+    after = _seed(7)
+    calls = []
+    monkeypatch.setattr(llm_utils, 'call_llm', _fake_batch_llm(calls))
+    run_id = retriage.start_run(after_id=after, chunk_size=5, batch_size=3)
+    assert retriage.process_run(run_id, concurrency=2) == 'done'
+
+    assert len(calls) == 3  # chunks of 5 + 2 -> batches of 3+2 and 2
+    assert set(calls) == {'bulk'}
+    db = SessionLocal()
+    rows = db.query(Complaint).filter(Complaint.id > after).order_by(Complaint.id).all()
+    run = db.get(RetriageRun, run_id)
+    db.close()
+    assert run.processed == 7 and run.last_id == rows[-1].id
+    assert all(r.department == 'Logistics' for r in rows)
+    # each request's usage is shared out, not repeated on every row of its batch
+    assert sum(r.llm_calls for r in rows) == 3 and sum(r.prompt_tokens for r in rows) == 300
+    routed = [json.loads(r.llm_routing) for r in rows]
+    assert sum(1 for r in routed if r['fallback_fields']) == 3  # one per LLM request
+
+
+def test_retriage_resumes_after_cancel(monkeypatch):
+    after = _seed(6)
+    monkeypatch.setattr(llm_utils, 'call_llm', _fake_batch_llm([]))
+    run_id = retriage.start_run(after_id=after, chunk_size=2, batch_size=2)
+    stop = threading.Event()
+    assert retriage.process_run(run_id, progress=lambda done, total, last: stop.set(), cancel_event=stop) == 'cancelled'
+
+    db = SessionLocal()
+    run = db.get(RetriageRun, run_id)
+    assert run.processed == 2 and run.last_id == after + 2
+    db.close()
+
+    retriage.resume_run(run_id)
+    assert retriage.process_run(run_id) == 'done'
+    db = SessionLocal()
+    run = db.get(RetriageRun, run_id)
+    db.close()
+    assert run.processed == 6 and run.total == 6
+
+
+def test_retriage_skips_duplicates_and_updates_them_from_the_original(monkeypatch):
+    after = _seed(2)
+    db = SessionLocal()
+    dup = Complaint(description="My parcel 0 is late again!", channel='Web', status='Duplicate', duplicate_of=after + 1)
+    db.add(dup)
+    db.commit()
+    dup_id = dup.id
+    db.close()
+    calls = []
+    monkeypatch.setattr(llm_utils, 'call_llm', _fake_batch_llm(calls))
+    run_id = retriage.start_run(after_id=after, batch_size=5)
+    assert retriage.process_run(run_id) == 'done'
+
+    db = SessionLocal()
+    original, linked = db.get(Complaint, after + 1), db.get(Complaint, dup_id)
+    assert db.get(RetriageRun, run_id).processed == 2 and len(calls) == 1
+    assert (linked.categories, linked.department) == (original.categories, original.department)
+    assert not linked.llm_calls  # never sent to the LLM itself
+    db.close()
@@ -0,0 +1,40 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath('.'))
+
+import pytest
+
+from app.llm_utils import RULES, heuristic_classify, heuristic_severity_and_routing
+from app.utils import rules
+
+BACKENDS = ['scan'] + (['ahocorasick'] if rules.ahocorasick is not None else [])
+
+
+@pytest.mark.parametrize('backend', BACKENDS)
+@pytest.mark.parametrize('padding', ['', ' and that is all' * 100])  # the scan fallback changes method on long texts
+def test_backends_report_overlapping_spans(backend, padding):
+    rs = rules.RuleSet({"billing": ["charge", "overcharged", "double charge"], "defect": ["stopped", "stopped working"]}, backend=backend)
+    m = rs.match("I was Overcharged after the machine STOPPED WORKING" + padding)
+    assert m.labels == {"billing", "defect"}
+    assert [s[2] for s in m.spans] == ["overcharged", "charge", "stopped", "stopped working"]
+    assert m.explain()[0] == {"term": "overcharged", "start": 6, "end": 17, "rules": ["billing"]}
+    assert rs.match("all good").labels == set()
+    assert rs.match_keywords(["Double Charge", "other"]) == {"billing"}
+
+
+def test_heuristics_use_rule_matches():
+    text = "My washing machine stopped working and it is a fire hazard, I was also charged twice"
+    cls = heuristic_classify(text)
+    assert cls['categories'] == ["Billing Issue", "Product Defect"]
+    assert cls['matched'] == {"Billing Issue": "charge", "Product Defect": "stopped"}
+    sr = heuristic_severity_and_routing(text, cls['categories'], sentiment='Neutral')
+    assert sr['severity'] == 'Urgent'
+    assert sr['matched']['safety'] == 'hazard'
+    assert sr['routed_department'] == 'Accounts'
+
+
+def test_keyword_only_urgency():
+    sr = heuristic_severity_and_routing("please look at this", ["Others"], sentiment='Positive', keywords=["ASAP"])
+    assert sr['severity'] == 'Urgent'
+    assert RULES.match("please look at this").labels == set()
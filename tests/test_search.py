@@ -0,0 +1,73 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath('.'))
+
+from fastapi.testclient import TestClient
+
+from app.database import SessionLocal
+from app.main import app
+from app.models import Complaint
+from app.search import fts_query
+
+client = TestClient(app)
+
+
+def _add(description, subject=None, status='New', keywords=None):
+    db = SessionLocal()
+    c = Complaint(description=description, subject=subject, status=status, keywords=keywords, channel='Web')
+    db.add(c)
+    db.commit()
+    cid = c.id
+    db.close()
+    return cid
+
+
+def _ids(params):
+    r = client.get('/search', params=params)
+    assert r.status_code == 200, r.text
+    return [item['id'] for item in r.json()], r
+
+
+def test_fts_query_quotes_user_input():
+    assert fts_query('Refunds  late*') == '"refunds" "late"*'
+    assert fts_query('"charged twice" OR blender') == '"charged twice" OR "blender"'
+    assert fts_query('NEAR( ) AND OR') == '"near" "and"'
+    assert fts_query('-- ::') == ''
+
+
+def test_search_ranks_filters_and_stays_in_sync():
+    subject_hit = _add("Please look at this quickly", subject="Quokkablender refund missing")
+    body_hit = _add("My quokkablender arrived cracked and I was refunded only half of it", status='Resolved')
+    other = _add("The quokkatoaster burns everything", keywords="quokkatoaster,burnt")
+
+    ids, r = _ids({"q": "quokkablender refunds"})
+    assert ids == [subject_hit, body_hit]  # stemmed, and a subject match ranks first
+    assert '<mark>' in r.json()[0]['snippet'] and r.json()[0]['score'] > r.json()[1]['score']
+    assert set(r.json()[0]) == {'id', 'subject', 'status', 'severity', 'department', 'created_at', 'score', 'snippet'}
+
+    assert set(_ids({"q": "quokka*"})[0]) == {subject_hit, body_hit, other}
+    assert _ids({"q": '"quokkablender arrived cracked"'})[0] == [body_hit]
+    assert set(_ids({"q": "quokkatoaster OR quokkablender"})[0]) == {subject_hit, body_hit, other}
+    assert _ids({"q": "quokka*", "status": "Resolved"})[0] == [body_hit]
+
+    pages, cursor = [], None
+    while True:
+        ids, r = _ids(dict({"q": "quokka*", "limit": 1, "fields": "id"}, **({"cursor": cursor} if cursor else {})))
+        pages += ids
+        cursor = r.headers.get('x-next-cursor')
+        if not cursor:
+            break
+    assert sorted(pages) == sorted({subject_hit, body_hit, other}) and len(pages) == 3
+
+    # the triggers re-index updated rows
+    db = SessionLocal()
+    db.get(Complaint, other).description = "Now it is the quokkakettle that leaks"
+    db.commit()
+    db.close()
+    assert _ids({"q": "quokkatoaster"})[0] == [other]  # still in keywords
+    assert _ids({"q": "quokkatoaster burns"})[0] == []
+    assert _ids({"q": "quokkakettle leaks"})[0] == [other]
+
+    assert client.get('/search', params={"q": "::"}).status_code == 400
+    assert client.get('/search', params={"q": "quokkakettle", "cursor": "nope"}).status_code == 400
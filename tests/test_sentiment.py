@@ -0,0 +1,40 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath('.'))
+
+from app import config, sentiment_analyzer
+from app.sentiment_analyzer import score, score_many, local_sentiment, analyze_sentiment
+
+
+def test_negation_and_intensifiers():
+    assert score("good") > 0
+    assert score("very good") > score("good")
+    assert score("not good") < 0
+    assert score("not bad") > 0
+    # contractions are negations too
+    assert score("this isn't good") == score("this is not good")
+    assert score("good!") > score("good")
+
+
+def test_score_many_matches_single_scores():
+    texts = ["The product is great", "Delivery was terribly slow and support was useless", "", None,
+             "see https://example.com/great-deals for details"]
+    assert score_many(texts) == [score(t) for t in texts]
+    assert score(texts[-1]) == 0.0  # words inside URLs are not scored
+    assert local_sentiment(texts[1]) == "Negative"
+
+
+def test_llm_sentiment_is_opt_in(monkeypatch):
+    calls = []
+
+    def fake(prompt, **kwargs):
+        calls.append(prompt)
+        return "Positive"
+    monkeypatch.setattr(sentiment_analyzer, 'call_llm', fake)
+    monkeypatch.setattr(config, 'LLM_SENTIMENT', False)
+    assert analyze_sentiment("awful, broken and late") == "Negative"
+    assert calls == []
+    monkeypatch.setattr(config, 'LLM_SENTIMENT', True)
+    assert analyze_sentiment("awful, broken and late") == "Positive"
+    assert len(calls) == 1
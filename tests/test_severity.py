@@ -7,6 +7,7 @@ import sys
 sys.path.insert(0, os.path.abspath('.'))
 
 from app.main import app
+from app.job_queue import run_pending_jobs
 
 client = TestClient(app)
 
@@ -53,11 +54,15 @@ def test_severity_and_keywords():
     ids = []
     for p in sample_payloads:
         r = client.post('/submit_complaint', json=p)
-        assert r.status_code == 200
+        assert r.status_code == 202
         data = r.json()
         assert 'id' in data
+        assert data['status'] == 'queued'
         ids.append(data['id'])
 
+    # triage + acknowledgement jobs run in the background; drain them here
+    run_pending_jobs()
+
     # fetch each complaint detail via admin endpoint (use ADMIN_API_KEY env)
     api_key = os.getenv('ADMIN_API_KEY', 'secret_admin_key')
     headers = {'x-api-key': api_key}
@@ -0,0 +1,83 @@
+import os
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.abspath('.'))
+
+from sqlalchemy import text
+
+from app import config, sla_monitor
+from app.database import SessionLocal, init_db, engine
+from app.models import Complaint
+
+
+def _add(**kw):
+    init_db()
+    db = SessionLocal()
+    c = Complaint(description="sla test", channel='Web', **kw)
+    db.add(c)
+    db.commit()
+    cid = c.id
+    db.close()
+    return cid
+
+
+def _flagged(cid):
+    db = SessionLocal()
+    try:
+        return db.get(Complaint, cid).sla_violation
+    finally:
+        db.close()
+
+
+def test_scan_flags_only_newly_overdue_open_complaints():
+    now = datetime.utcnow()
+    overdue = _add(status='New', sla_due_at=now - timedelta(minutes=5))
+    resolved = _add(status='Resolved', sla_due_at=now - timedelta(minutes=5))
+    later = _add(status='In Progress', sla_due_at=now + timedelta(hours=1))
+
+    assert sla_monitor.check_sla_once(now) >= 1
+    assert _flagged(overdue) and not _flagged(resolved) and not _flagged(later)
+    db = SessionLocal()
+    try:
+        # the pending alert was committed together with the flag
+        assert db.execute(text(
+            "SELECT status FROM outbox WHERE kind = 'sla' AND complaint_id = :id"), {"id": overdue}).scalar() == 'pending'
+    finally:
+        db.close()
+    assert sla_monitor.check_sla_once(now) == 0
+    assert sla_monitor.next_deadline() <= now + timedelta(hours=1)
+
+    with engine.connect() as conn:
+        plan = conn.execute(text(
+            "EXPLAIN QUERY PLAN SELECT id FROM complaints "
+            "WHERE status IN ('New', 'In Progress') AND sla_violation = 0 AND sla_due_at <= :now"
+        ), {"now": now}).all()
+    assert 'ix_complaints_sla' in str(plan)
+
+
+def test_due_at_follows_severity():
+    created = datetime(2025, 1, 1, 12, 0, 0)
+    assert sla_monitor.sla_due_at(created, 'Urgent') == created + timedelta(hours=config.SLA_THRESHOLDS['Urgent'])
+    assert sla_monitor.sla_due_at(created, None) == created + timedelta(hours=72)
+
+
+def test_loop_wakes_at_the_next_deadline(monkeypatch):
+    monkeypatch.setattr(config, 'SLA_MIN_SLEEP', 0.05)
+    monkeypatch.setattr(config, 'SLA_DEADLINE_SLACK', 0.05)
+    stop = threading.Event()
+    t = threading.Thread(target=sla_monitor.start_sla_loop, args=(stop, 60), daemon=True)
+    t.start()
+    try:
+        cid = _add(status='New', sla_due_at=datetime.utcnow() + timedelta(seconds=0.5))
+        sla_monitor.notify()
+        deadline = time.time() + 5
+        while not _flagged(cid) and time.time() < deadline:
+            time.sleep(0.05)
+        assert _flagged(cid)
+    finally:
+        stop.set()
+        sla_monitor.notify()
+        t.join(timeout=5)
@@ -0,0 +1,57 @@
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath('.'))
+
+from app import llm_utils
+
+
+def _fake_llm(reply, calls):
+    def fake(prompt, system=None, temperature=0.0, max_tokens=512):
+        calls.append(prompt)
+        return reply
+    return fake
+
+
+def test_fused_triage_single_call(monkeypatch):
+    calls = []
+    reply = json.dumps({
+        "categories": ["Delivery Problem"],
+        "confidence": 0.9,
+        "sentiment": "negative",
+        "severity": "High",
+        "routed_department": "Logistics",
+        "justification": "Package is late",
+    })
+    monkeypatch.setattr(llm_utils, 'call_llm', _fake_llm(reply, calls))
+    r = llm_utils.triage_complaint("My package was supposed to arrive last week and it's still not here.")
+    assert len(calls) == 1
+    assert r['categories'] == ["Delivery Problem"]
+    assert r['sentiment'] == 'Negative'
+    assert r['severity'] == 'High'
+    assert r['routed_department'] == 'Logistics'
+    assert r['fallback_fields'] == []
+
+
+def test_fused_triage_falls_back_per_field(monkeypatch):
+    calls = []
+    # invalid severity and unknown department; categories are valid
+    reply = 'Sure! {"categories": ["Billing Issue"], "confidence": 0.8, "severity": "Critical", "routed_department": "Nowhere"}'
+    monkeypatch.setattr(llm_utils, 'call_llm', _fake_llm(reply, calls))
+    r = llm_utils.triage_complaint("I was charged twice for my subscription. Please refund the extra charge.")
+    assert len(calls) == 1
+    assert r['categories'] == ["Billing Issue"]
+    assert r['confidence'] == 0.8
+    assert r['severity'] in llm_utils.SEVERITIES
+    assert r['routed_department'] == 'Accounts'
+    assert set(r['fallback_fields']) == {'sentiment', 'severity', 'routed_department'}
+
+
+def test_fused_triage_without_llm_matches_heuristics(monkeypatch):
+    monkeypatch.setattr(llm_utils, 'call_llm', _fake_llm(None, []))
+    text = "My washing machine stopped working after two days. It won't spin."
+    r = llm_utils.triage_complaint(text)
+    assert r['categories'] == llm_utils.heuristic_classify(text)['categories']
+    assert r['routed_department'] == 'Product Engineering'
+    assert 'categories' in r['fallback_fields']
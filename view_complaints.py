@@ -1,15 +1,8 @@
-import sqlite3
-import json
+"""Print every complaint as NDJSON; kept for old habits. Use `python -m app.export --help` for formats,
+column selection, date ranges and incremental exports."""
+import sys
 
-conn = sqlite3.connect("complaints.db")
-cursor = conn.cursor()
+from app.export import main
 
-cursor.execute("SELECT * FROM complaints")  # or your table name
-rows = cursor.fetchall()
-
-columns = [desc[0] for desc in cursor.description]
-
-for row in rows:
-    print(json.dumps(dict(zip(columns, row)), default=str, indent=2))
-
-conn.close()
+if __name__ == '__main__':
+    raise SystemExit(main(sys.argv[1:]))